@@ -163,6 +163,13 @@ ADMIN_API_ALLOWED_SUBNETS = [
 # API Token Stuff
 API_TOKEN_EXPIRE_AFTER_DAYS = env.int("API_TOKEN_EXPIRE_AFTER_DAYS", default=90)
 
+# Deleting and scrubbing old data (see metadeploy.api.retention) happens in
+# batches of this many rows, each in its own transaction:
+RETENTION_BATCH_SIZE = env.int("RETENTION_BATCH_SIZE", default=500)
+# Seconds to pause between batches, and to spend on each step per run:
+RETENTION_BATCH_PAUSE = env.float("RETENTION_BATCH_PAUSE", default=0.05)
+RETENTION_TIME_BUDGET = env.float("RETENTION_TIME_BUDGET", default=15.0)
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -374,6 +381,25 @@ JS_REVERSE_JS_VAR_NAME = "api_urls"
 JS_REVERSE_EXCLUDE_NAMESPACES = ["admin", "admin_rest"]
 
 METADEPLOY_JOB_TIMEOUT = env.int("METADEPLOY_JOB_TIMEOUT", default=3600)
+# How long a Job's cancellation flag is kept, in seconds. It has to outlive the
+# time the Job may spend in the queue, and is cleared as soon as the Job ends:
+JOB_CANCEL_TIMEOUT = env.int("JOB_CANCEL_TIMEOUT", default=24 * 60 * 60)
+# How many times a Job interrupted by a worker restart is put back in line to
+# carry on where it stopped, before it is canceled instead:
+JOB_MAX_RESUMES = env.int("JOB_MAX_RESUMES", default=2)
+# How many steps of a plan with parallel_steps may run at the same time:
+PARALLEL_STEPS_MAX_WORKERS = env.int("PARALLEL_STEPS_MAX_WORKERS", default=4)
+# How many of a plan's preflight checks may be evaluated at the same time:
+PREFLIGHT_CHECKS_MAX_WORKERS = env.int("PREFLIGHT_CHECKS_MAX_WORKERS", default=4)
+# Where workers keep the repositories that steps include with a `source`, by
+# commit (see metadeploy.api.sources):
+SOURCE_ARCHIVE_CACHE_DIR = env(
+    "SOURCE_ARCHIVE_CACHE_DIR", default="/tmp/metadeploy/sources"
+)
+# How long (in seconds) a cached repository may go unused before it's removed:
+SOURCE_ARCHIVE_CACHE_MAX_AGE = env.int(
+    "SOURCE_ARCHIVE_CACHE_MAX_AGE", default=7 * 24 * 60 * 60
+)
 
 # Redis configuration:
 
@@ -409,18 +435,49 @@ CHANNEL_LAYERS = {
 }
 MAX_QUEUE_LENGTH = env.int("MAX_QUEUE_LENGTH", default=15)
 
+# Jobs are handed to RQ by the fair-share scheduler in metadeploy.api.scheduler.
+# It keeps at most this many Jobs waiting in the default queue:
+JOB_SCHEDULER_QUEUE_DEPTH = env.int("JOB_SCHEDULER_QUEUE_DEPTH", default=5)
+# Seconds one run of the enqueuer may hold its lock for, and how long another
+# run waits for it before giving up:
+JOB_SCHEDULER_LOCK_TIMEOUT = env.int("JOB_SCHEDULER_LOCK_TIMEOUT", default=60)
+JOB_SCHEDULER_LOCK_WAIT = env.int("JOB_SCHEDULER_LOCK_WAIT", default=10)
+# Most jobs that may be running or queued at once for one org, and one product:
+JOB_SCHEDULER_MAX_PER_ORG = env.int("JOB_SCHEDULER_MAX_PER_ORG", default=1)
+JOB_SCHEDULER_MAX_PER_PRODUCT = env.int("JOB_SCHEDULER_MAX_PER_PRODUCT", default=10)
+# How long (in seconds) a job's recorded queue position is kept:
+JOB_SCHEDULER_POSITION_TIMEOUT = env.int("JOB_SCHEDULER_POSITION_TIMEOUT", default=180)
+
+# Push notifications sent from RQ workers go through a background publisher
+# thread (see metadeploy.api.publisher):
+PUSH_PUBLISHER_QUEUE_SIZE = env.int("PUSH_PUBLISHER_QUEUE_SIZE", default=1000)
+PUSH_PUBLISHER_PUT_TIMEOUT = env.int("PUSH_PUBLISHER_PUT_TIMEOUT", default=5)
+PUSH_PUBLISHER_DRAIN_TIMEOUT = env.int("PUSH_PUBLISHER_DRAIN_TIMEOUT", default=10)
+# Write push notifications to an outbox table in the same transaction as the
+# model change, to be sent by `manage.py relay_push_events`
+# (see metadeploy.api.outbox). This takes the place of the background publisher
+# above, and needs the relay process running:
+PUSH_OUTBOX_ENABLED = env.bool("PUSH_OUTBOX_ENABLED", default=False)
+PUSH_OUTBOX_BATCH_SIZE = env.int("PUSH_OUTBOX_BATCH_SIZE", default=100)
+PUSH_OUTBOX_MAX_ATTEMPTS = env.int("PUSH_OUTBOX_MAX_ATTEMPTS", default=5)
+PUSH_OUTBOX_POLL_INTERVAL = env.float("PUSH_OUTBOX_POLL_INTERVAL", default=0.5)
+# How long (in seconds) a relay may hold outbox rows before another relay takes
+# them over:
+PUSH_OUTBOX_CLAIM_TIMEOUT = env.int("PUSH_OUTBOX_CLAIM_TIMEOUT", default=60)
+
+# The sweeps that run every minute, in this order, as part of one maintenance
+# tick (see metadeploy.api.maintenance):
+MAINTENANCE_TASKS = ["expire_preflight_results", "enqueue_jobs", "cleanup_user_data"]
+# Seconds a maintenance tick may run for, and may hold its lock for. A tick
+# that starts while the previous one still holds the lock is skipped:
+MAINTENANCE_TIMEOUT = env.int("MAINTENANCE_TIMEOUT", default=240)
+MAINTENANCE_LOCK_TIMEOUT = env.int("MAINTENANCE_LOCK_TIMEOUT", default=300)
+
 CRON_JOBS = {
-    "cleanup_user_data": {
-        "func": "metadeploy.api.jobs.cleanup_user_data_job",
-        "cron_string": "* * * * *",
-    },
-    "enqueue_jobs": {
-        "func": "metadeploy.api.jobs.enqueuer_job",
-        "cron_string": "* * * * *",
-    },
-    "expire_preflight_results": {
-        "func": "metadeploy.api.jobs.expire_preflights_job",
+    "maintenance": {
+        "func": "metadeploy.api.maintenance.maintenance_job",
         "cron_string": "* * * * *",
+        "timeout": MAINTENANCE_TIMEOUT,
     },
     "calculate_average_plan_runtimes": {
         "func": "metadeploy.api.jobs.calculate_average_plan_runtime_job",
@@ -434,11 +491,26 @@ CRON_JOBS = {
 # CRON_SCHEDULE is a mapping from a name identifying the job
 # to a cron string specifying the schedule for the job,
 # or null to disable the job.
+# The sweeps in MAINTENANCE_TASKS used to be cron jobs of their own. Setting
+# one of them takes it out of the maintenance tick: null disables it, and a
+# cron string runs it as its own cron job again, on that schedule.
+maintenance_task_jobs = {
+    "expire_preflight_results": "metadeploy.api.jobs.expire_preflights_job",
+    "enqueue_jobs": "metadeploy.api.jobs.enqueuer_job",
+    "cleanup_user_data": "metadeploy.api.jobs.cleanup_user_data_job",
+}
 cron_overrides = json.loads(env("CRON_SCHEDULE", default="{}"))
 if not isinstance(cron_overrides, dict):
     raise TypeError("CRON_SCHEDULE must be a JSON object")
 for key, cron_string in cron_overrides.items():
-    if key in CRON_JOBS:
+    if key in MAINTENANCE_TASKS:
+        MAINTENANCE_TASKS.remove(key)
+        if cron_string is not None:
+            CRON_JOBS[key] = {
+                "func": maintenance_task_jobs[key],
+                "cron_string": cron_string,
+            }
+    elif key in CRON_JOBS:
         if cron_string is None:
             del CRON_JOBS[key]
         else:
@@ -466,14 +538,70 @@ REST_FRAMEWORK = {
 
 }
 
+# How long to keep an org's status (current job and preflight) cached for.
+# It is invalidated on every change anyway, so this is only a safety net:
+ORG_STATUS_CACHE_TIMEOUT = env.int("ORG_STATUS_CACHE_TIMEOUT", default=300)
+
+# How long a websocket subscription that was allowed stays allowed without being
+# checked against the database again:
+WEBSOCKET_AUTH_CACHE_TIMEOUT = env.int("WEBSOCKET_AUTH_CACHE_TIMEOUT", default=60)
+
+# Database work done by websocket consumers runs on its own thread pool, so one
+# slow query doesn't hold up every other websocket in the process:
+WEBSOCKET_DB_THREADS = env.int("WEBSOCKET_DB_THREADS", default=8)
+# How many calls may be queued or running on that pool at once:
+WEBSOCKET_DB_MAX_PENDING = env.int("WEBSOCKET_DB_MAX_PENDING", default=200)
+# Log a warning when a call waits longer than this (in seconds) to start:
+WEBSOCKET_DB_WAIT_WARNING = env.float("WEBSOCKET_DB_WAIT_WARNING", default=1.0)
+
+# Messages kept per websocket group, and for how many seconds after the last one,
+# so clients that reconnect can be sent what they missed (0 turns this off):
+WEBSOCKET_REPLAY_LENGTH = env.int("WEBSOCKET_REPLAY_LENGTH", default=100)
+WEBSOCKET_REPLAY_TTL = env.int("WEBSOCKET_REPLAY_TTL", default=300)
+
+# Websocket connections that haven't sent anything (the frontend sends a heartbeat
+# every 30 seconds) in this many seconds are closed:
+WEBSOCKET_IDLE_TIMEOUT = env.int("WEBSOCKET_IDLE_TIMEOUT", default=120)
+# Subscriptions without a message or resubscription for this long are dropped:
+WEBSOCKET_SUBSCRIPTION_IDLE_TIMEOUT = env.int(
+    "WEBSOCKET_SUBSCRIPTION_IDLE_TIMEOUT", default=3600
+)
+# At most this many subscriptions per connection; the least active go first:
+WEBSOCKET_MAX_GROUPS = env.int("WEBSOCKET_MAX_GROUPS", default=50)
+# How often (in seconds) to check for the above:
+WEBSOCKET_REAP_INTERVAL = env.int("WEBSOCKET_REAP_INTERVAL", default=30)
+# How often (in seconds) to log connection counters:
+WEBSOCKET_STATS_INTERVAL = env.int("WEBSOCKET_STATS_INTERVAL", default=300)
+
 # Token expiration
 TOKEN_LIFETIME_MINUTES = env.int("TOKEN_LIFETIME_MINUTES", default=10)
 PREFLIGHT_LIFETIME_MINUTES = env.int("PREFLIGHT_LIFETIME_MINUTES", default=10)
+# How long facts a preflight learned about an org (installed packages and the
+# like) are kept for the Job that follows, in seconds. Capped at the preflight's
+# own lifetime:
+ORG_FACTS_CACHE_TIMEOUT = env.int("ORG_FACTS_CACHE_TIMEOUT", default=300)
+# A preflight request for an org and plan shares the preflight that's already
+# running, or one that completed this many seconds ago:
+PREFLIGHT_REUSE_SECONDS = env.int("PREFLIGHT_REUSE_SECONDS", default=60)
+# How long (in seconds) a queued preflight waits for another one on the same org
+# and plan to finish (and share its results), before it runs anyway, and how
+# often it looks again meanwhile. It waits off the worker, rescheduled through
+# the RQ scheduler:
+PREFLIGHT_LOCK_WAIT = env.int("PREFLIGHT_LOCK_WAIT", default=120)
+PREFLIGHT_LOCK_RETRY_DELAY = env.int("PREFLIGHT_LOCK_RETRY_DELAY", default=10)
 
 # Displaying average job completion time
 MINIMUM_JOBS_FOR_AVERAGE = env.int("MINIMUM_JOBS_FOR_AVERAGE", default=5)
 AVERAGE_JOB_WINDOW = env.int("AVERAGE_JOB_WINDOW", default=20)
 
+# Estimating when running and queued jobs will finish (see metadeploy.api.eta).
+# How many recent samples per step, per plan, and of queue waits to look at:
+ETA_WINDOW = env.int("ETA_WINDOW", default=50)
+# How long (in seconds) to cache the resulting percentiles:
+ETA_CACHE_TIMEOUT = env.int("ETA_CACHE_TIMEOUT", default=300)
+# How long (in seconds) to cache each job's expected finish time, at most:
+ETA_JOB_CACHE_TIMEOUT = env.int("ETA_JOB_CACHE_TIMEOUT", default=60)
+
 API_PRODUCT_PAGE_SIZE = env.int("API_PRODUCT_PAGE_SIZE", default=25)
 
 LOG_REQUESTS = True
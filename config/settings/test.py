@@ -6,5 +6,12 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Send pushes straight away rather than through the outbox:
+PUSH_OUTBOX_ENABLED = False
+
+# Don't let cached org status or websocket permissions leak between tests:
+ORG_STATUS_CACHE_TIMEOUT = 0
+WEBSOCKET_AUTH_CACHE_TIMEOUT = 0
+
 HEROKU_TOKEN = "abcdefg1234567"
 HEROKU_APP_NAME = "test_heroku_app_name"
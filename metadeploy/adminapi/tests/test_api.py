@@ -80,6 +80,8 @@ class TestPlanViewSet:
                     "supported_orgs": "Persistent",
                     "org_config_name": "release",
                     "scratch_org_duration_override": None,
+                    "parallel_steps": False,
+                    "skip_installed_packages": False,
                 }
             ],
             "links": {"next": None, "previous": None},
@@ -125,6 +127,7 @@ class TestPlanViewSet:
                     "path": "main_task",
                     "step_num": "1.0",
                     "source": None,
+                    "depends_on": [],
                     "task_class": "cumulusci.core.tests.test_tasks._TaskHasResult",
                     "task_config": {},
                 }
@@ -137,6 +140,8 @@ class TestPlanViewSet:
             "supported_orgs": "Persistent",
             "org_config_name": "release",
             "scratch_org_duration_override": None,
+            "parallel_steps": False,
+            "skip_installed_packages": False,
         }
 
     def test_create(self, admin_api_client, version_factory, plan_template_factory):
@@ -201,6 +206,7 @@ class TestPlanViewSet:
                     "path": "task1",
                     "step_num": "1.0",
                     "source": None,
+                    "depends_on": [],
                     "task_class": "cumulusci.core.tests.test_tasks._TaskHasResult",
                     "task_config": {},
                 },
@@ -213,6 +219,7 @@ class TestPlanViewSet:
                     "path": "task2",
                     "step_num": "1.3",
                     "source": None,
+                    "depends_on": [],
                     "task_class": "cumulusci.core.tests.test_tasks._TaskHasResult",
                     "task_config": {},
                 },
@@ -225,6 +232,8 @@ class TestPlanViewSet:
             "supported_orgs": "Persistent",
             "org_config_name": "release",
             "scratch_org_duration_override": None,
+            "parallel_steps": False,
+            "skip_installed_packages": False,
         }
         assert response.json() == expected
 
@@ -0,0 +1,177 @@
+"""
+Push-based Job cancellation.
+
+Canceling a Job sets a flag in the cache, which expires after
+JOB_CANCEL_TIMEOUT seconds, and publishes a message on a Redis channel for
+that Job. While the Job runs, a `CancelWatcher` thread in the worker listens
+on the channel:
+
+- If a task is running, the watcher sends SIGUSR1 to the worker's main
+  thread, and keeps sending it every `poll_interval` while any task runs. The
+  handler raises StopFlowException inside the task, but only while the task
+  is waiting in one of CumulusCI's polling or retry loops (SAFE_WAIT_POINTS),
+  e.g. for a deploy or package install to finish on Salesforce. There the
+  task holds no locks and is in no `finally` block of its own, and the Job
+  is marked canceled and the worker freed minutes before the task would have
+  finished. Anywhere else the signal is ignored, including in the main
+  thread of a parallel plan, which only waits for its steps' threads (see
+  `metadeploy.api.parallel` for how those stop).
+- Between tasks, `BasicFlowCallback.pre_task` sees that the watcher has been
+  told, or finds the flag in the cache, and stops the flow there. A task that
+  never waits in one of those loops runs to the end first.
+
+When the watcher stops, the flag is cleared.
+"""
+
+import logging
+import signal
+import threading
+
+from cumulusci.core.tasks import BaseTask
+from cumulusci.salesforce_api.metadata import BaseMetadataApiCall
+from cumulusci.utils import waiting
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .constants import REDIS_JOB_CANCEL_CHANNEL, REDIS_JOB_CANCEL_KEY
+from .flows import StopFlowException
+
+logger = logging.getLogger(__name__)
+
+INTERRUPT_SIGNAL = signal.SIGUSR1
+
+# The loops in which tasks sleep between checks on something Salesforce is
+# doing. A signal that arrives while one of these is the innermost frame is
+# between two statements of the loop, or in its `time.sleep`:
+SAFE_WAIT_POINTS = frozenset(
+    func.__code__
+    for func in (
+        BaseTask._poll,
+        BaseTask._retry,
+        # Deploys and the like wait for Salesforce in here:
+        BaseMetadataApiCall._get_response,
+        waiting.poll,
+        waiting.retry,
+    )
+)
+
+
+def request_cancel(job_id):
+    """Tell the worker running (or about to run) a Job to stop."""
+    cache.set(
+        REDIS_JOB_CANCEL_KEY.format(id=job_id),
+        True,
+        timeout=settings.JOB_CANCEL_TIMEOUT,
+    )
+    try:
+        get_redis_connection("default").publish(
+            REDIS_JOB_CANCEL_CHANNEL.format(id=job_id), "cancel"
+        )
+    except Exception:
+        # The flag is still there for pre_task to find:
+        logger.exception(f"Could not publish cancellation of Job {job_id}")
+
+
+class CancelWatcher:
+    """Listen for cancellation of one Job, for as long as it runs.
+
+    Use it as a context manager around the flow. Call `task_started` and
+    `task_finished` around each task, so that a cancellation interrupts it.
+    Steps of a parallel plan run side by side, so the watcher counts them.
+    """
+
+    poll_interval = 1.0
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.canceled = threading.Event()
+        self._running_tasks = 0
+        self._running_tasks_lock = threading.Lock()
+        self._interrupted = False
+        self._stopped = threading.Event()
+        self._thread = None
+        self._previous_handler = None
+        # Signal handlers can only be installed by, and only run in, the main
+        # thread. Anywhere else the watcher only sets `canceled`:
+        self._main_thread = threading.main_thread()
+        self._can_interrupt = threading.current_thread() is self._main_thread
+
+    def __enter__(self):
+        if self._can_interrupt:
+            self._previous_handler = signal.signal(
+                INTERRUPT_SIGNAL, self._handle_interrupt
+            )
+        self._thread = threading.Thread(
+            target=self._watch, name=f"cancel-watcher-{self.job_id}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join(timeout=self.poll_interval * 2)
+        if self._can_interrupt:
+            signal.signal(INTERRUPT_SIGNAL, self._previous_handler)
+        cache.delete(REDIS_JOB_CANCEL_KEY.format(id=self.job_id))
+
+    def is_canceled(self):
+        return self.canceled.is_set()
+
+    def task_started(self):
+        with self._running_tasks_lock:
+            self._running_tasks += 1
+
+    def task_finished(self):
+        with self._running_tasks_lock:
+            self._running_tasks -= 1
+
+    @property
+    def interruptible(self):
+        return self._running_tasks > 0 and not self._interrupted
+
+    def _watch(self):
+        try:
+            pubsub = get_redis_connection("default").pubsub(
+                ignore_subscribe_messages=True
+            )
+            pubsub.subscribe(REDIS_JOB_CANCEL_CHANNEL.format(id=self.job_id))
+        except Exception:
+            logger.exception(
+                f"Could not watch Job {self.job_id} for cancellation, "
+                "falling back to checking between tasks"
+            )
+            return
+        try:
+            while not self._stopped.is_set():
+                message = pubsub.get_message(timeout=self.poll_interval)
+                if message is not None:
+                    break
+            else:
+                return
+        except Exception:
+            logger.exception(f"Stopped watching Job {self.job_id} for cancellation")
+            return
+        finally:
+            pubsub.close()
+        self._on_cancel()
+
+    def _on_cancel(self):
+        logger.info(f"Job {self.job_id} canceled")
+        self.canceled.set()
+        if not self._can_interrupt:
+            return
+        # Until the task gets to a safe point, or is over:
+        while not self._stopped.is_set():
+            if self.interruptible:
+                signal.pthread_kill(self._main_thread.ident, INTERRUPT_SIGNAL)
+            self._stopped.wait(self.poll_interval)
+
+    def _handle_interrupt(self, signum, frame):
+        # The task may have finished while the signal was on its way, in which
+        # case the next pre_task stops the flow instead:
+        # No lock here: the main thread may be holding it.
+        if self.interruptible and frame is not None:
+            if frame.f_code in SAFE_WAIT_POINTS:
+                self._interrupted = True
+                raise StopFlowException("Job canceled.")
@@ -2,6 +2,10 @@ from urllib.parse import urlparse
 
 from cumulusci.core.config import BaseProjectConfig
 from cumulusci.core.runtime import BaseCumulusCI
+from cumulusci.utils.yaml.cumulusci_yml import GitHubSourceModel
+from pydantic import ValidationError
+
+from .sources import CachedGitHubSource
 
 
 def extract_user_and_repo(gh_url):
@@ -11,7 +15,7 @@ def extract_user_and_repo(gh_url):
 
 
 class MetadeployProjectConfig(BaseProjectConfig):
-    def __init__(self, *args, repo_root=None, plan=None, **kwargs):
+    def __init__(self, *args, repo_root=None, plan=None, commit=None, **kwargs):
         self.plan = plan
 
         repo_info = kwargs.pop("repo_info", None)
@@ -23,17 +27,45 @@ class MetadeployProjectConfig(BaseProjectConfig):
                 "url": repo_url,
                 "name": repo_name,
                 "owner": user,
-                "commit": plan.commit_ish or plan.version.commit_ish,
+                "commit": commit or plan.commit_ish or plan.version.commit_ish,
             }
 
         super().__init__(*args, repo_info=repo_info, **kwargs)
 
+    def include_source(self, spec):
+        """Include a project, as BaseProjectConfig does, but fetch GitHub
+        sources through the worker's cache, see `metadeploy.api.sources`."""
+        if isinstance(spec, dict):
+            try:
+                spec = GitHubSourceModel(**spec)
+            except ValidationError:
+                pass
+        if not isinstance(spec, GitHubSourceModel) or spec in self.included_sources:
+            return super().include_source(spec)
+
+        # The rest is what BaseProjectConfig.include_source does for a new
+        # source, which it can only create as a plain GitHubSource:
+        source = self.get_github_source(spec)
+        self.logger.info(f"Fetching from {source}")
+        project_config = source.fetch()
+        project_config.set_keychain(self.keychain)
+        project_config.source = source
+        self.included_sources[spec] = project_config
+        if not self.allow_remote_code:
+            spec.allow_remote_code = False
+        else:
+            project_config._add_tasks_directory_to_python_path()
+        return project_config
+
+    def get_github_source(self, spec):
+        return CachedGitHubSource(self, spec)
+
     def construct_subproject_config(self, **kwargs):
         return MetadeployProjectConfig(
             self.universal_config_obj,
             plan=self.plan,
             included_sources=self.included_sources,
-            **kwargs
+            **kwargs,
         )
 
 
@@ -1,31 +1,41 @@
 from datetime import timedelta
 
-from allauth.socialaccount.models import SocialToken
-from asgiref.sync import async_to_sync
+from allauth.socialaccount.models import SocialAccount, SocialToken
 from django.conf import settings
+from django.db.models import (
+    DateTimeField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Value,
+)
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
 from .models import Job, PreflightResult, User
-from .push import user_token_expired
+from .org_status import invalidate_org_status
+from .publisher import publish
+from .push import user_tokens_expired
+from .retention import clear_old_exceptions, delete_old_users
 
 
 def cleanup_user_data():
     """Remove old records with PII and other sensitive data."""
-    # fix status of dead jobs that got left as started
-    fix_dead_jobs_status()
-
-    # remove oauth tokens after 10 minutes of inactivity
-    expire_oauth_tokens()
-
-    # remove users after 30 days
-    delete_old_users()
-
-    # remove job exceptions after 90 days
-    clear_old_exceptions()
-
-    # expire API access tokens after specified number of days
-    expire_api_access_tokens_older_than_days(settings.API_TOKEN_EXPIRE_AFTER_DAYS)
+    return {
+        # fix status of dead jobs that got left as started
+        "dead_jobs": fix_dead_jobs_status(),
+        # remove oauth tokens after 10 minutes of inactivity
+        "oauth_tokens": expire_oauth_tokens(),
+        # remove users after 30 days
+        "old_users": delete_old_users()["rows"],
+        # remove job exceptions after 90 days
+        "old_exceptions": clear_old_exceptions(),
+        # expire API access tokens after specified number of days
+        "api_tokens": expire_api_access_tokens_older_than_days(
+            settings.API_TOKEN_EXPIRE_AFTER_DAYS
+        ),
+    }
 
 
 def expire_oauth_tokens():
@@ -39,47 +49,32 @@ def expire_oauth_tokens():
         minutes=settings.TOKEN_LIFETIME_MINUTES
     )
     day_ago = timezone.now() - timedelta(days=1)
-    for token in SocialToken.objects.filter(
-        account__last_login__lte=token_lifetime_ago
-    ):
-        user = token.account.user
-        has_running_jobs = (
-            user.job_set.filter(
-                status=Job.Status.started, created_at__gt=day_ago
-            ).exists()
-            or user.preflightresult_set.filter(
-                status=PreflightResult.Status.started, created_at__gt=day_ago
-            ).exists()
-        )
-        if not has_running_jobs:
-            token.delete()
-            if not user.is_staff:
-                token.account.extra_data = {}
-                token.account.save()
-            async_to_sync(user_token_expired)(user)
-
-
-def delete_old_users():
-    """Delete old users.
-
-    Deletes users who have not logged in for 30 days, unless they have the is_staff flag.
-    """
-    month_ago = timezone.now() - timedelta(days=30)
-    User.objects.filter(is_staff=False, last_login__lte=month_ago).delete()
-
-
-def clear_old_exceptions():
-    """Update Job and PreflightRecords over 90 days old to clear the exception field.
-
-    (This field may contain customer metadata such as custom schema names from the org.)
-    """
-    ninety_days_ago = timezone.now() - timedelta(days=90)
-    Job.objects.filter(created_at__lte=ninety_days_ago, exception__isnull=False).update(
-        exception=None
+    running_jobs = Job.objects.filter(
+        user=OuterRef("account__user"),
+        status=Job.Status.started,
+        created_at__gt=day_ago,
+    )
+    running_preflights = PreflightResult.objects.filter(
+        user=OuterRef("account__user"),
+        status=PreflightResult.Status.started,
+        created_at__gt=day_ago,
     )
-    PreflightResult.objects.filter(
-        created_at__lte=ninety_days_ago, exception__isnull=False
-    ).update(exception=None)
+    expired = list(
+        SocialToken.objects.filter(account__last_login__lte=token_lifetime_ago)
+        .exclude(Exists(running_jobs))
+        .exclude(Exists(running_preflights))
+        .values_list("id", "account_id", "account__user_id", "account__user__is_staff")
+    )
+    if not expired:
+        return 0
+
+    SocialToken.objects.filter(id__in=[token_id for token_id, *_ in expired]).delete()
+    SocialAccount.objects.filter(
+        id__in=[account_id for _, account_id, _, is_staff in expired if not is_staff]
+    ).update(extra_data={})
+    users = User.objects.filter(id__in={user_id for _, _, user_id, _ in expired})
+    publish(user_tokens_expired, list(users.only("id")))
+    return len(expired)
 
 
 def fix_dead_jobs_status():
@@ -89,20 +84,28 @@ def fix_dead_jobs_status():
     """
     now = timezone.now()
     timeout_seconds = settings.RQ_QUEUES["default"]["DEFAULT_TIMEOUT"] + 120
-    timeout_ago = now - timedelta(seconds=timeout_seconds)
+    timeout = timedelta(seconds=timeout_seconds)
     canceled_values = {
         "status": "canceled",
         "canceled_at": now,
         "exception": "The installation job was interrupted. Please retry the installation.",
     }
-    Job.objects.filter(status="started", enqueued_at__lte=timeout_ago).update(
-        **canceled_values
+    dead_jobs = Job.objects.filter(
+        status="started",
+        # The Jobs of a batch run one after the other, in one RQ job:
+        enqueued_at__lte=ExpressionWrapper(
+            Value(now) - Value(timeout) * (F("batch_position") + 1),
+            output_field=DateTimeField(),
+        ),
     )
+    org_ids = set(dead_jobs.values_list("org_id", flat=True))
+    count = dead_jobs.update(**canceled_values)
+    invalidate_org_status(*org_ids)
+    return count
 
 
 def expire_api_access_tokens_older_than_days(days: int):
     """Delete any Admin API access tokens older than days given."""
     obsolete_date = timezone.now() - timedelta(days=days)
-    expired_tokens = Token.objects.filter(created__lte=obsolete_date)
-    if expired_tokens:
-        expired_tokens.delete()
+    deleted, _ = Token.objects.filter(created__lte=obsolete_date).delete()
+    return deleted
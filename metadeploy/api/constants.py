@@ -6,4 +6,20 @@ OPTIONAL = "optional"
 HIDE = "hide"
 ORGANIZATION_DETAILS = "organization_details"
 REDIS_JOB_CANCEL_KEY = "metadeploy:cancel:{id}"
+REDIS_JOB_CANCEL_CHANNEL = "metadeploy:cancel_channel:{id}"
 CHANNELS_GROUP_NAME = "{model}.{id}"
+REDIS_ORG_STATUS_KEY = "metadeploy:org_status:{org_id}"
+REDIS_ORG_FACTS_KEY = "metadeploy:org_facts:{org_id}"
+REDIS_PREFLIGHT_LOCK_KEY = "metadeploy:preflight_lock:{org_id}:{plan_id}"
+REDIS_SUBSCRIPTION_AUTH_KEY = "metadeploy:ws_auth:{digest}"
+REDIS_REPLAY_LOG_KEY = "metadeploy:replay:{group}"
+REDIS_QUEUE_POSITION_KEY = "metadeploy:queue_position:{id}"
+REDIS_ENQUEUER_LOCK_KEY = "metadeploy:enqueuer:lock"
+REDIS_ENQUEUER_REQUESTED_KEY = "metadeploy:enqueuer:requested"
+REDIS_STEP_DURATION_KEY = "metadeploy:eta:step:{id}"
+REDIS_PLAN_RUN_TIME_KEY = "metadeploy:eta:plan:{id}"
+REDIS_JOB_ETA_KEY = "metadeploy:eta:job:{id}"
+REDIS_QUEUE_WAIT_KEY = "metadeploy:eta:queue_wait"
+REDIS_RETENTION_CHECKPOINT_KEY = "metadeploy:retention:{name}"
+REDIS_MAINTENANCE_LOCK_KEY = "metadeploy:maintenance:lock"
+REDIS_MAINTENANCE_STATS_KEY = "metadeploy:maintenance:last_tick"
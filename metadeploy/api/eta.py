@@ -0,0 +1,183 @@
+"""
+Estimates of how long Jobs will wait and run.
+
+`JobFlowCallback` records a StepDuration for every step that succeeds, and
+`run_flows` stamps `Job.started_at` when a worker picks a Job up. From the
+most recent ETA_WINDOW samples of each we take percentiles of:
+
+- how long each step runs,
+- how long a whole Job of each plan runs,
+- how long Jobs wait between being created and being started.
+
+The percentiles are cached for ETA_CACHE_TIMEOUT seconds. The resulting
+finish time of each Job is cached too, for ETA_JOB_CACHE_TIMEOUT seconds or
+until the Job starts or finishes another step, so serializing a Job again (for
+every subscriber of a push, say) costs a single cache round trip.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .constants import (
+    REDIS_JOB_ETA_KEY,
+    REDIS_PLAN_RUN_TIME_KEY,
+    REDIS_QUEUE_WAIT_KEY,
+    REDIS_STEP_DURATION_KEY,
+)
+from .models import Job, StepDuration
+
+PERCENTILES = (50, 90)
+
+
+def percentile(values, pct):
+    """Linearly interpolated percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize(values):
+    """Percentiles of `values`, or an empty dict if there are none."""
+    values = sorted(values)
+    if not values:
+        return {}
+    return {pct: percentile(values, pct) for pct in PERCENTILES}
+
+
+def record_step_duration(job, step_id, seconds):
+    StepDuration.objects.create(job=job, step_id=step_id, duration=seconds)
+
+
+def step_durations(step_ids):
+    """Run-time percentiles of each of `step_ids`, keyed by step id."""
+    keys = {REDIS_STEP_DURATION_KEY.format(id=id_): id_ for id_ in step_ids}
+    stats = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [id_ for id_ in step_ids if id_ not in stats]
+    if missing:
+        samples = defaultdict(list)
+        recent = (
+            StepDuration.objects.filter(step_id__in=missing)
+            .annotate(
+                row=Window(
+                    RowNumber(),
+                    partition_by=F("step_id"),
+                    order_by=F("created_at").desc(),
+                )
+            )
+            .filter(row__lte=settings.ETA_WINDOW)
+            .values_list("step_id", "duration")
+        )
+        for step_id, duration in recent:
+            samples[str(step_id)].append(duration)
+        computed = {id_: summarize(samples[id_]) for id_ in missing}
+        cache.set_many(
+            {
+                REDIS_STEP_DURATION_KEY.format(id=id_): value
+                for id_, value in computed.items()
+            },
+            timeout=settings.ETA_CACHE_TIMEOUT,
+        )
+        stats.update(computed)
+    return stats
+
+
+def plan_run_time(plan_id):
+    """Percentiles of how long complete Jobs of the plan took to run."""
+    key = REDIS_PLAN_RUN_TIME_KEY.format(id=plan_id)
+    stats = cache.get(key)
+    if stats is None:
+        recent = (
+            Job.objects.filter(plan_id=plan_id, status=Job.Status.complete)
+            .exclude(started_at=None)
+            .exclude(success_at=None)
+            .order_by("-created_at")
+            .values_list("started_at", "success_at")[: settings.ETA_WINDOW]
+        )
+        stats = summarize(
+            (success_at - started_at).total_seconds()
+            for started_at, success_at in recent
+        )
+        cache.set(key, stats, timeout=settings.ETA_CACHE_TIMEOUT)
+    return stats
+
+
+def queue_wait():
+    """Percentiles of how long Jobs waited for a worker."""
+    stats = cache.get(REDIS_QUEUE_WAIT_KEY)
+    if stats is None:
+        # Release tests don't go through the queue:
+        recent = (
+            Job.objects.filter(is_release_test=False)
+            .exclude(started_at=None)
+            .order_by("-started_at")
+            .values_list("created_at", "started_at")[: settings.ETA_WINDOW]
+        )
+        stats = summarize(
+            max((started_at - created_at).total_seconds(), 0)
+            for created_at, started_at in recent
+        )
+        cache.set(REDIS_QUEUE_WAIT_KEY, stats, timeout=settings.ETA_CACHE_TIMEOUT)
+    return stats
+
+
+def remaining_run_time(job, now):
+    """Seconds `job` is expected to keep running once started, or None."""
+    # Uses the steps prefetched by JobViewSet, if any:
+    step_ids = [str(step.id) for step in job.steps.all()]
+    if not step_ids:
+        return None
+    remaining = [id_ for id_ in step_ids if id_ not in job.results]
+    stats = step_durations(remaining)
+    if all(stats[id_] for id_ in remaining):
+        return sum(stats[id_][50] for id_ in remaining)
+    # Some step has never run before, so go by the plan as a whole:
+    stats = plan_run_time(job.plan_id)
+    if not stats:
+        return None
+    elapsed = (now - job.started_at).total_seconds() if job.started_at else 0
+    return max(stats[50] - elapsed, 0)
+
+
+def expected_finish(job, now):
+    """When `job` is expected to finish, or None."""
+    run_time = remaining_run_time(job, now)
+    if run_time is None:
+        return None
+    wait = 0
+    if job.started_at is None:
+        waited = (now - job.created_at).total_seconds()
+        wait = max(queue_wait().get(50, 0) - waited, 0)
+    return now + timedelta(seconds=wait + run_time)
+
+
+def estimate(job):
+    """Seconds until `job` is expected to finish, or None if there is no basis
+    for a guess.
+    """
+    if job.status != Job.Status.started:
+        return None
+    now = timezone.now()
+    key = REDIS_JOB_ETA_KEY.format(id=job.id)
+    progress = (job.started_at is not None, len(job.results))
+    cached = cache.get(key)
+    if cached is not None and cached["progress"] == progress:
+        finish = cached["finish"]
+    else:
+        finish = expected_finish(job, now)
+        cache.set(
+            key,
+            {"progress": progress, "finish": finish},
+            timeout=settings.ETA_JOB_CACHE_TIMEOUT,
+        )
+    if finish is None:
+        return None
+    return round(max((finish - now).total_seconds(), 0))
@@ -1,4 +1,6 @@
 import logging
+import threading
+import time
 from io import StringIO
 
 import bleach
@@ -13,13 +15,20 @@ from .result_spool_logger import ResultSpoolLogger
 logger = logging.getLogger(__name__)
 
 
-class StopFlowException(Exception):
-    pass
+class StopFlowException(BaseException):
+    """The Job was canceled.
+
+    Like KeyboardInterrupt, this isn't an Exception: when a cancellation
+    interrupts a running task (see `metadeploy.api.cancellation`), neither
+    `except Exception` in the task's code nor CumulusCI's TaskRunner may take it
+    for a failure of the task and carry on.
+    """
 
 
 class BasicFlowCallback(FlowCallback):
-    def __init__(self, ctx):
+    def __init__(self, ctx, cancel_watcher=None):
         self.context = ctx  # will be either a preflight or a job...
+        self.cancel_watcher = cancel_watcher
 
     def _get_step_id(self, **filters):
         try:
@@ -36,10 +45,19 @@ class BasicFlowCallback(FlowCallback):
             raise StopFlowException("Job canceled.")
 
     def _flow_canceled(self):
+        if self.cancel_watcher and self.cancel_watcher.is_canceled():
+            return True
         return cache.get(REDIS_JOB_CANCEL_KEY.format(id=self.context.id))
 
 
 class JobFlowCallback(BasicFlowCallback):
+    def __init__(self, ctx, cancel_watcher=None):
+        super().__init__(ctx, cancel_watcher=cancel_watcher)
+        # Steps may run in parallel threads (see metadeploy.api.parallel), so
+        # keep track of each thread's task, and update results one at a time:
+        self.task = threading.local()
+        self.results_lock = threading.RLock()
+
     def pre_flow(self, coordinator):
         logger = logging.getLogger("cumulusci")
         self.string_buffer = StringIO()
@@ -48,7 +66,9 @@ class JobFlowCallback(BasicFlowCallback):
         self.handler.setFormatter(logging.Formatter())
         logger.addHandler(self.handler)
 
-        self.result_handler = ResultSpoolLogger(result=self.context)
+        self.result_handler = ResultSpoolLogger(
+            result=self.context, lock=self.results_lock
+        )
         self.result_handler.setFormatter(
             coloredlogs.ColoredFormatter(fmt="%(asctime)s %(message)s")
         )
@@ -77,21 +97,38 @@ class JobFlowCallback(BasicFlowCallback):
     def pre_task(self, step):
         super().pre_task(step)
         self.set_current_key_by_step(step)
+        self.task.started_at = time.monotonic()
+        if self.cancel_watcher:
+            self.cancel_watcher.task_started()
 
     def post_task(self, step, result):
+        from .eta import record_step_duration
+
+        if self.cancel_watcher:
+            self.cancel_watcher.task_finished()
+        started_at = getattr(self.task, "started_at", None)
         job_id = self._get_step_id(step_num=step.step_num)
         if job_id:
-            if job_id not in self.context.results:
-                self.context.results[job_id] = [{}]
-            if result.exception:
-                self.context.results[job_id][0].update(
-                    {"status": ERROR, "message": bleach.clean(str(result.exception))}
+            with self.results_lock:
+                if job_id not in self.context.results:
+                    self.context.results[job_id] = [{}]
+                if result.exception:
+                    self.context.results[job_id][0].update(
+                        {
+                            "status": ERROR,
+                            "message": bleach.clean(str(result.exception)),
+                        }
+                    )
+                else:
+                    self.context.results[job_id][0].update({"status": OK})
+                self.context.log = obscure_salesforce_log(self.string_buffer.getvalue())
+                self.context.save()
+            if not result.exception and started_at is not None:
+                record_step_duration(
+                    self.context, job_id, time.monotonic() - started_at
                 )
-            else:
-                self.context.results[job_id][0].update({"status": OK})
-            self.context.log = obscure_salesforce_log(self.string_buffer.getvalue())
-            self.context.save()
         self.set_current_key_by_step(None)
+        self.task.started_at = None
 
     def set_current_key_by_step(self, step):
         if step is not None:
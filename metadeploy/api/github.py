@@ -12,14 +12,27 @@ from cumulusci.utils import download_extract_github, temporary_dir
 from metadeploy.api.models import Product
 
 
+def get_repo_api(repo_owner, repo_name):
+    repo_url_ending = f"/{repo_owner}/{repo_name}"
+    product = Product.objects.get(repo_url__endswith=repo_url_ending)
+    return get_github_api_for_repo(None, product.repo_url)
+
+
+def resolve_commit(repo_owner, repo_name, commit_ish=None):
+    """The SHA of the commit that `commit_ish` (by default, the default
+    branch) points to right now."""
+    repository = get_repo_api(repo_owner, repo_name).repository(repo_owner, repo_name)
+    if commit_ish is None:
+        commit_ish = repository.default_branch
+    return repository.commit(commit_ish).sha
+
+
 @contextlib.contextmanager
 def local_github_checkout(repo_owner, repo_name, commit_ish=None):
     with temporary_dir() as repo_root:
         # pretend it's a git clone to satisfy cci
         os.mkdir(".git")
-        repo_url_ending = f"/{repo_owner}/{repo_name}"
-        product = Product.objects.get(repo_url__endswith=repo_url_ending)
-        repo = get_github_api_for_repo(None, product.repo_url)
+        repo = get_repo_api(repo_owner, repo_name)
         if commit_ish is None:
             commit_ish = repo.repository(repo_owner, repo_name).default_branch
 
@@ -0,0 +1,87 @@
+"""
+Skipping Package steps whose version the org already has.
+
+People often rerun a plan on an org that has some of its packages already,
+and each Package step can take minutes to reinstall a version that's there.
+For plans with `skip_installed_packages`, `Job.run` takes stock of the org's
+installed packages once, before the flow starts, and skips the Package steps
+that are already satisfied. The inventory is usually free: the preflight has
+just taken it (see `metadeploy.api.org_facts`).
+
+Only steps that install a given version of a namespaced package with
+InstallPackageVersion are considered; "latest", betas and 04t ids would have
+to be resolved first. A step is only skipped when none of the steps it
+depends on (see `Plan.step_dependencies`) is going to run, since those could
+change what's installed. If taking stock fails, nothing is skipped.
+"""
+
+import logging
+import re
+
+from cumulusci.core.exceptions import CumulusCIException
+
+logger = logging.getLogger(__name__)
+
+INSTALL_TASK_CLASSES = {
+    "cumulusci.tasks.salesforce.InstallPackageVersion",
+    "cumulusci.tasks.salesforce.install_package_version.InstallPackageVersion",
+}
+VERSION = re.compile(r"\d+(\.\d+)*")
+
+
+def package_target(step, project_config):
+    """The (namespace, version) a Package step installs, if that's fixed."""
+    if step.kind != step.Kind.managed or step.task_class not in INSTALL_TASK_CLASSES:
+        return None
+    options = (step.task_config or {}).get("options") or {}
+    namespace = options.get("namespace") or project_config.project__package__namespace
+    version = options.get("version")
+    if isinstance(version, (int, float)):
+        version = str(version)
+    if not namespace or not isinstance(version, str) or not VERSION.fullmatch(version):
+        return None
+    return namespace, version
+
+
+def skip_installed_packages(plan, steps, org_config):
+    """Skip the Package steps whose version `org_config` has installed.
+
+    `steps` are the plan's StepSpecs, whose `skip` is set for the steps that
+    are satisfied. Returns a message for each of those, by Step id.
+    """
+    specs = {str(spec.step_num): spec for spec in steps}
+    targets = {
+        step: package_target(step, specs[step.step_num].project_config)
+        for step in plan.steps.all()
+        if step.step_num in specs and not specs[step.step_num].skip
+    }
+    if not any(targets.values()):
+        return {}
+    try:
+        # Takes stock once, unless the preflight already has:
+        org_config.installed_packages
+    except Exception:
+        logger.exception(f"Could not list the packages installed for plan {plan.id}")
+        return {}
+
+    dependencies = plan.step_dependencies()
+    skipped = {}
+    for step, target in targets.items():
+        if target is None or any(
+            not specs[step_num].skip
+            for step_num in dependencies.get(step.step_num, ())
+            if step_num in specs
+        ):
+            continue
+        namespace, version = target
+        try:
+            installed = org_config.has_minimum_package_version(namespace, version)
+        except CumulusCIException:
+            # Several packages share the namespace:
+            continue
+        if installed:
+            specs[step.step_num].skip = True
+            skipped[
+                str(step.id)
+            ] = f"{namespace} {version} or newer is already installed."
+    return skipped
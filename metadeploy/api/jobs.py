@@ -18,36 +18,60 @@ import os
 import sys
 import traceback
 import uuid
+from collections import defaultdict
 from datetime import timedelta
-from typing import Union
+from typing import Optional, Union
 
-from asgiref.sync import async_to_sync
+import django_rq
 from cumulusci.core.config import OrgConfig, ServiceConfig
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.utils import timezone
 from django_rq import job as django_rq_job
+from redis.exceptions import LockError
 from rq.exceptions import ShutDownImminentException
 from rq.worker import StopRequested
 
 from .cci_configs import MetaDeployCCI, extract_user_and_repo
 from .cleanup import cleanup_user_data
+from .constants import (
+    REDIS_ENQUEUER_LOCK_KEY,
+    REDIS_ENQUEUER_REQUESTED_KEY,
+    REDIS_PREFLIGHT_LOCK_KEY,
+)
 from .flows import StopFlowException
-from .github import local_github_checkout
-from .models import ORG_TYPES, Job, Plan, PreflightResult, ScratchOrg
-from .push import job_started, preflight_started, report_error
+from .github import local_github_checkout, resolve_commit
+from .models import (
+    ORG_TYPES,
+    Job,
+    Plan,
+    PreflightResult,
+    ScratchOrg,
+    preflight_expiry_cutoff,
+)
+from .org_status import invalidate_org_status
+from .publisher import publish
+from .push import job_started, preflight_started, preflights_expired, report_error
 from .salesforce import create_scratch_org as create_scratch_org_on_sf
 from .salesforce import delete_scratch_org as delete_scratch_org_on_sf
+from .scheduler import clear_queue_position, schedule_jobs, update_queue_positions
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
-sync_report_error = async_to_sync(report_error)
+
+
+def sync_report_error(user):
+    publish(report_error, user)
+
+
+# keep failed jobs for 7 days
+FAILURE_TTL = 7 * 3600 * 24
 
 
 def job(*args, **kw):
-    # keep failed jobs for 7 days
-    kw["failure_ttl"] = 7 * 3600 * 24
+    kw["failure_ttl"] = FAILURE_TTL
     return django_rq_job(*args, **kw)
 
 
@@ -93,14 +117,23 @@ def finalize_result(result: Union[Job, PreflightResult]):
         # ShutDownImminentException or StopRequested exception.
         # So we want to mark any job that's not done by then as canceled
         # by catching that exception as it propagates back up.
-        result.status = result.Status.canceled
-        result.canceled_at = timezone.now()
-        end_time = result.canceled_at
+        # Jobs get a few more chances though: they go back to the scheduler,
+        # and carry on from the first step they haven't completed.
         log_status = JobLogStatus.TERMINATED
         log_msg = f"{result.__class__.__name__} {result.id} interrupted by dyno restart"
-        result.exception = (
-            "The installation job was interrupted. Please retry the installation."
-        )
+        if isinstance(result, Job) and result.resume_count < settings.JOB_MAX_RESUMES:
+            end_time = timezone.now()
+            result.resume_count += 1
+            result.enqueued_at = None
+            result.job_id = None
+            log_msg += ", will resume"
+        else:
+            result.status = result.Status.canceled
+            result.canceled_at = timezone.now()
+            end_time = result.canceled_at
+            result.exception = (
+                "The installation job was interrupted. Please retry the installation."
+            )
         raise
     except StopFlowException as e:
         # User requested cancellation of job
@@ -146,6 +179,15 @@ def finalize_result(result: Union[Job, PreflightResult]):
         )
         result.save()
 
+        if isinstance(result, Job) and result.status == result.Status.complete:
+            # Keep the plan's average fresh between nightly recalculations:
+            try:
+                calculate_average_plan_runtime(result.plan_id)
+            except Exception:
+                logger.exception(
+                    f"Could not update the average duration of plan {result.plan_id}"
+                )
+
 
 @contextlib.contextmanager
 def report_errors_to(user):
@@ -177,60 +219,51 @@ def prepend_python_path(path):
         sys.path = prev_path
 
 
-def run_flows(
-    *,
-    plan: Plan,
-    skip_steps: list[str],
-    result_class: Union[type[Job], type[PreflightResult]],
-    result_id: int,
-):
-    """
-    This operates with side effects; it changes things in a Salesforce
-    org, and then records the results of those operations on to a
-    `result`.
+class FlowSession(contextlib.ExitStack):
+    """Checkouts of a product's repo, each with a CumulusCI runtime connected
+    to the org, for flows that run one after the other on that org.
 
-    Args:
-        plan (Plan): The Plan instance for the flow you're running.
-        skip_steps (List[str]): The strings in the list should be valid
-            step_num values for steps in this flow.
-        result_class (Union[Type[Job], Type[PreflightResult]]): The type
-            of the instance onto which to record the results of running
-            steps in the flow. Either a PreflightResult or a Job, as
-            appropriate.
-        result_id (int): the PK of the result instance to get.
+    The Jobs of a batch share one session, so each commit is only checked out,
+    and the org's connection set up, once. The checkouts are removed when the
+    session is closed.
     """
-    result = result_class.objects.get(pk=result_id)
-    scratch_org = None
-    if not result.user:
-        # This means we're in a ScratchOrg.
-        scratch_org = ScratchOrg.objects.get(org_id=result.org_id)
 
-    repo_url = plan.version.product.repo_url
-    commit_ish = plan.commit_ish or plan.version.commit_ish
-
-    with contextlib.ExitStack() as stack:
-        stack.enter_context(finalize_result(result))
-        if result.user:
-            stack.enter_context(report_errors_to(result.user))
-        if scratch_org:
-            stack.enter_context(delete_org_on_error(scratch_org))
+    current_org = "current_org"
+
+    def __init__(self):
+        super().__init__()
+        self._contexts = {}
+
+    def connect(self, *, result, plan, commit_ish, scratch_org=None):
+        """Return the MetaDeployCCI for `commit_ish`, set up for `plan`."""
+        ctx = self._contexts.get(commit_ish)
+        if ctx is None:
+            ctx = self._contexts[commit_ish] = self._connect(
+                result=result,
+                plan=plan,
+                commit_ish=commit_ish,
+                scratch_org=scratch_org,
+            )
+        ctx.project_config.plan = plan
+        return ctx
 
+    def _connect(self, *, result, plan, commit_ish, scratch_org):
         # Let's clone the repo locally:
-        repo_user, repo_name = extract_user_and_repo(repo_url)
-        repo_root = stack.enter_context(
+        repo_user, repo_name = extract_user_and_repo(plan.version.product.repo_url)
+        repo_root = self.enter_context(
             local_github_checkout(repo_user, repo_name, commit_ish)
         )
 
         # Get cwd into Python path, so that the tasks below can import
         # from the checked-out repo:
-        stack.enter_context(prepend_python_path(os.path.abspath(repo_root)))
+        self.enter_context(prepend_python_path(os.path.abspath(repo_root)))
 
         # There's a lot of setup to make configs and keychains, link
         # them properly, and then eventually pass them into a flow,
         # which we then run:
-        ctx = MetaDeployCCI(repo_root=repo_root, plan=plan)
+        ctx = MetaDeployCCI(repo_root=repo_root, plan=plan, commit=commit_ish)
 
-        current_org = "current_org"
+        current_org = self.current_org
         if settings.METADEPLOY_FAST_FORWARD:  # pragma: no cover
             org_config = OrgConfig({}, name=current_org, keychain=ctx.keychain)
         elif scratch_org:
@@ -266,14 +299,88 @@ def run_flows(
         )
         ctx.keychain.set_service("connected_app", "metadeploy", connected_app)
         ctx.keychain._default_services["connected_app"] = "metadeploy"
+        return ctx
 
+
+def run_flows(
+    *,
+    plan: Plan,
+    skip_steps: list[str],
+    result_class: Union[type[Job], type[PreflightResult]],
+    result_id: int,
+    resume: bool = False,
+    session: Optional[FlowSession] = None,
+):
+    """
+    This operates with side effects; it changes things in a Salesforce
+    org, and then records the results of those operations on to a
+    `result`.
+
+    Args:
+        plan (Plan): The Plan instance for the flow you're running.
+        skip_steps (List[str]): The strings in the list should be valid
+            step_num values for steps in this flow.
+        result_class (Union[Type[Job], Type[PreflightResult]]): The type
+            of the instance onto which to record the results of running
+            steps in the flow. Either a PreflightResult or a Job, as
+            appropriate.
+        result_id (int): the PK of the result instance to get.
+        resume (bool): Whether this Job was interrupted before, and should
+            skip the steps it already completed at the same commit.
+        session (FlowSession): Checkouts and org connection to share with
+            the other Jobs of a batch. By default the flow sets up its own.
+    """
+    result = result_class.objects.get(pk=result_id)
+    if isinstance(result, Job):
+        clear_queue_position(result)
+    scratch_org = None
+    if not result.user:
+        # This means we're in a ScratchOrg.
+        scratch_org = ScratchOrg.objects.get(org_id=result.org_id)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(finalize_result(result))
+        if result.user:
+            stack.enter_context(report_errors_to(result.user))
+        if scratch_org:
+            stack.enter_context(delete_org_on_error(scratch_org))
+        if session is None:
+            session = stack.enter_context(FlowSession())
+
+        # Everything below is at the commit the ref points to now, even if
+        # the ref moves on while the flow runs:
+        repo_user, repo_name = extract_user_and_repo(plan.version.product.repo_url)
+        commit_ish = resolve_commit(
+            repo_user, repo_name, plan.commit_ish or plan.version.commit_ish
+        )
+        completed_steps = set()
+        if isinstance(result, Job):
+            if resume and result.commit_ish == commit_ish:
+                completed_steps = result.completed_steps()
+                logger.info(
+                    f"Resuming Job {result.id}, skipping {len(completed_steps)} "
+                    "completed steps"
+                )
+            elif resume:
+                # The plan has moved on since, so start over:
+                result.results = {}
+            result.started_at = timezone.now()
+            result.commit_ish = commit_ish
+            Job.objects.filter(pk=result.pk).update(
+                started_at=result.started_at, commit_ish=commit_ish
+            )
+
+        ctx = session.connect(
+            result=result, plan=plan, commit_ish=commit_ish, scratch_org=scratch_org
+        )
         steps = [
             step.to_spec(
-                project_config=ctx.project_config, skip=step.step_num in skip_steps
+                project_config=ctx.project_config,
+                skip=step.step_num in skip_steps or str(step.id) in completed_steps,
             )
             for step in plan.steps.all()
         ]
-        org = ctx.keychain.get_org(current_org)
+        org = ctx.keychain.get_org(session.current_org)
         if not settings.METADEPLOY_FAST_FORWARD:
             result.run(ctx, plan, steps, org)
 
@@ -281,24 +388,134 @@ def run_flows(
 run_flows_job = job(run_flows)
 
 
+def run_batch(job_ids: list[str]):
+    """Run a batch of Jobs on one org, in order, sharing one FlowSession.
+
+    Each Job records its own results. Once one doesn't complete, the rest
+    of the batch is canceled, or, if the worker is restarting, goes back to
+    the scheduler along with it.
+    """
+    pending = list(Job.objects.filter(pk__in=job_ids).order_by("batch_position"))
+    with FlowSession() as session:
+        while pending:
+            job_ = pending.pop(0)
+            try:
+                run_flows(
+                    plan=job_.plan,
+                    skip_steps=job_.skip_steps(),
+                    result_class=Job,
+                    result_id=job_.id,
+                    resume=job_.resume_count > 0,
+                    session=session,
+                )
+            except (StopRequested, ShutDownImminentException):
+                job_.refresh_from_db()
+                if job_.status == Job.Status.started:
+                    # It will resume, so the rest will run after it:
+                    Job.objects.filter(pk__in=[j.pk for j in pending]).update(
+                        enqueued_at=None, job_id=None
+                    )
+                else:
+                    cancel_rest_of_batch(pending)
+                raise
+            except Exception:
+                cancel_rest_of_batch(pending)
+                raise
+            job_.refresh_from_db()
+            if job_.status != Job.Status.complete:
+                # E.g. canceled:
+                cancel_rest_of_batch(pending)
+                return
+
+
+def cancel_rest_of_batch(jobs):
+    for job_ in jobs:
+        job_.status = Job.Status.canceled
+        job_.canceled_at = timezone.now()
+        job_.exception = "An earlier plan in this batch did not complete."
+        # Saved one by one, to notify the org's subscribers:
+        job_.save()
+
+
 def enqueuer():
     logger.debug("Enqueuer live")
-    for j in Job.objects.filter(enqueued_at=None):
-        j.invalidate_related_preflight()
-        rq_job = run_flows_job.delay(
-            plan=j.plan,
-            skip_steps=j.skip_steps(),
-            result_class=Job,
-            result_id=j.id,
-        )
-        j.job_id = rq_job.id
-        j.enqueued_at = rq_job.enqueued_at
-        j.save()
+    # Maintenance ticks and requested runs must not hand the same Job to RQ
+    # twice, so only one runs at a time:
+    lock = cache.lock(
+        REDIS_ENQUEUER_LOCK_KEY, timeout=settings.JOB_SCHEDULER_LOCK_TIMEOUT
+    )
+    if not lock.acquire(blocking_timeout=settings.JOB_SCHEDULER_LOCK_WAIT):
+        logger.info("Skipping enqueuer, another run is still going")
+        return 0
+    try:
+        return enqueue_scheduled_jobs()
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("Enqueuer outlived its lock")
+
+
+def enqueue_scheduled_jobs():
+    queue = django_rq.get_queue("default")
+    scheduled = schedule_jobs(queue)
+    for j in scheduled:
+        if j.batch_id is not None:
+            # The rest of the batch goes along with its first pending Job:
+            batch = list(
+                j.batch().filter(
+                    status=Job.Status.started, batch_position__gte=j.batch_position
+                )
+            )
+            for batched in batch:
+                batched.invalidate_related_preflight()
+            # One RQ job for all of them, with time for each:
+            rq_job = queue.enqueue_call(
+                run_batch,
+                kwargs={"job_ids": [str(batched.id) for batched in batch]},
+                timeout=settings.METADEPLOY_JOB_TIMEOUT * len(batch),
+                failure_ttl=FAILURE_TTL,
+            )
+        else:
+            batch = [j]
+            j.invalidate_related_preflight()
+            rq_job = run_flows_job.delay(
+                plan=j.plan,
+                skip_steps=j.skip_steps(),
+                result_class=Job,
+                result_id=j.id,
+                resume=j.resume_count > 0,
+            )
+        for batched in batch:
+            batched.job_id = rq_job.id
+            batched.enqueued_at = rq_job.enqueued_at
+            batched.save()
+    update_queue_positions(queue)
+    return len(scheduled)
 
 
 enqueuer_job = job(enqueuer)
 
 
+def requested_enqueuer():
+    cache.delete(REDIS_ENQUEUER_REQUESTED_KEY)
+    return enqueuer()
+
+
+requested_enqueuer_job = job("short")(requested_enqueuer)
+
+
+def request_enqueuer():
+    """Have the enqueuer run soon, rather than on the next maintenance tick.
+
+    Requests made before it has started share one run.
+    """
+    if cache.add(
+        REDIS_ENQUEUER_REQUESTED_KEY, True, timeout=settings.JOB_SCHEDULER_LOCK_TIMEOUT
+    ):
+        requested_enqueuer_job.delay()
+
+
 # Aliased to expire_user_tokens_job for backwards compatibility
 expire_user_tokens_job = cleanup_user_data_job = job(cleanup_user_data)
 
@@ -307,34 +524,118 @@ def preflight(preflight_result_id):
     # Because the FieldTracker interferes with transparently serializing models across
     # the Redis boundary, we have to pass a primitive value to this function,
     preflight_result = PreflightResult.objects.get(pk=preflight_result_id)
-    run_flows(
-        plan=preflight_result.plan,
-        skip_steps=[],
-        result_class=PreflightResult,
-        result_id=preflight_result.id,
+
+    # Only one preflight runs for an org and plan at a time. One that had to
+    # wait for another takes over its results, if it finished after this one
+    # was requested, instead of checking the org all over again:
+    lock = cache.lock(
+        REDIS_PREFLIGHT_LOCK_KEY.format(
+            org_id=preflight_result.org_id, plan_id=preflight_result.plan_id
+        ),
+        timeout=settings.METADEPLOY_JOB_TIMEOUT,
     )
+    locked = lock.acquire(blocking=False)
+    waited = timezone.now() - preflight_result.created_at
+    if not locked and waited < timedelta(seconds=settings.PREFLIGHT_LOCK_WAIT):
+        # Leave the worker to other jobs, and look again in a while:
+        django_rq.get_scheduler("default").enqueue_in(
+            timedelta(seconds=settings.PREFLIGHT_LOCK_RETRY_DELAY),
+            preflight,
+            preflight_result_id,
+            timeout=settings.METADEPLOY_JOB_TIMEOUT,
+        )
+        return
+    try:
+        twin = PreflightResult.objects.completed_since(preflight_result)
+        if twin is not None:
+            logger.info(
+                f"PreflightResult {preflight_result.id} shares the results of "
+                f"PreflightResult {twin.id}"
+            )
+            with finalize_result(preflight_result):
+                preflight_result.results = twin.results
+                preflight_result.log = twin.log
+            return
+        run_flows(
+            plan=preflight_result.plan,
+            skip_steps=[],
+            result_class=PreflightResult,
+            result_id=preflight_result.id,
+        )
+    finally:
+        if locked:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning(
+                    f"PreflightResult {preflight_result.id} outlived its lock"
+                )
 
 
 preflight_job = job(preflight)
 
 
+EXPIRE_PREFLIGHTS_SQL = """
+WITH stale AS (
+    SELECT id, status
+    FROM {table}
+    WHERE is_valid AND created_at <= %(cutoff)s
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE {table}
+SET
+    is_valid = false,
+    status = CASE
+        WHEN stale.status = %(started)s THEN %(canceled)s ELSE stale.status
+    END,
+    edited_at = %(now)s
+FROM stale
+WHERE {table}.id = stale.id
+RETURNING {table}.id, {table}.org_id, stale.status
+"""
+
+
 def expire_preflights():
-    now = timezone.now()
-    preflight_lifetime_ago = now - timedelta(
-        minutes=settings.PREFLIGHT_LIFETIME_MINUTES
-    )
-    preflights_to_invalidate = PreflightResult.objects.filter(
-        created_at__lte=preflight_lifetime_ago,
-        is_valid=True,
+    """Invalidate every preflight older than PREFLIGHT_LIFETIME_MINUTES in one
+    statement, then notify subscribers one org at a time.
+
+    If the status is "started" then we can assume the preflight is stalled
+    (e.g. from a dyno restart) and needs to be set to "canceled" too.
+    """
+    sql = EXPIRE_PREFLIGHTS_SQL.format(
+        table=connection.ops.quote_name(PreflightResult._meta.db_table)
     )
-    for preflight in preflights_to_invalidate:
-        # If the status is "Started" then we can assume this job
-        # is stalled (e.g. from a dyno restart) and needs
-        # to be set to a "canceled" status
-        if preflight.status == PreflightResult.Status.started:
-            preflight.status = PreflightResult.Status.canceled
-        preflight.is_valid = False
-        preflight.save()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            {
+                "cutoff": preflight_expiry_cutoff(),
+                "started": PreflightResult.Status.started,
+                "canceled": PreflightResult.Status.canceled,
+                "now": timezone.now(),
+            },
+        )
+        rows = cursor.fetchall()
+
+    by_org = defaultdict(lambda: ([], []))
+    for id_, org_id, previous_status in rows:
+        was_started = previous_status == PreflightResult.Status.started
+        preflight = PreflightResult(
+            id=id_,
+            org_id=org_id,
+            is_valid=False,
+            status=PreflightResult.Status.canceled if was_started else previous_status,
+        )
+        expired, canceled = by_org[org_id]
+        expired.append(preflight)
+        if was_started:
+            canceled.append(preflight)
+
+    for org_id, (expired, canceled) in by_org.items():
+        if canceled:
+            invalidate_org_status(org_id)
+        publish(preflights_expired, expired, canceled)
+    return len(rows)
 
 
 expire_preflights_job = job(expire_preflights)
@@ -353,17 +654,19 @@ def create_scratch_org(org_pk):
 
     if plan.requires_preflight:
         preflight_result = run_preflight_checks_sync(org)
-        async_to_sync(preflight_started)(org, preflight_result)
+        publish(preflight_started, org, preflight_result)
 
     if plan.required_step_ids.count() == plan.steps.count():
         # Start installation job automatically if both:
         # - Plan has no preflight
         # - All plan steps are required
         job = run_plan_steps(org, release_test=False)
-        # This is already called on `save()`, but the new Job isn't in the
-        # database yet because it's in an atomic transaction.
-        job.push_to_org_subscribers(is_new=True, changed={})
-        async_to_sync(job_started)(org, job)
+        if not settings.PUSH_OUTBOX_ENABLED:
+            # This is already called on `save()`, but the new Job isn't in the
+            # database yet because it's in an atomic transaction. The outbox
+            # only relays that push once the transaction commits.
+            job.push_to_org_subscribers(is_new=True, changed={})
+        publish(job_started, org, job)
 
 
 create_scratch_org_job = job(create_scratch_org)
@@ -381,16 +684,60 @@ def delete_scratch_org(scratch_org, should_delete_locally=True):
 delete_scratch_org_job = job(delete_scratch_org)
 
 
-def calculate_average_plan_runtime():
-    """Plan.average_duration is a slow query, so we
-    get its value for each plan via this method and store its value
-    on Plan.calculated_average_duration.
+AVERAGE_DURATION_SQL = """
+UPDATE {plan_table}
+SET calculated_average_duration = floor(stats.duration)::integer
+FROM (
+    SELECT
+        plan_id,
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY duration) AS duration
+    FROM (
+        SELECT
+            plan_id,
+            extract(epoch FROM success_at - enqueued_at) AS duration,
+            row_number() OVER (
+                PARTITION BY plan_id ORDER BY created_at DESC
+            ) AS recency
+        FROM {job_table}
+        WHERE
+            status = %(status)s
+            AND success_at IS NOT NULL
+            AND enqueued_at IS NOT NULL
+            {plan_filter}
+    ) AS recent
+    WHERE recency <= %(window)s
+    GROUP BY plan_id
+    HAVING count(*) >= %(minimum)s
+) AS stats
+WHERE
+    {plan_table}.id = stats.plan_id
+    AND stats.duration > 0
+    AND {plan_table}.calculated_average_duration
+        IS DISTINCT FROM floor(stats.duration)::integer
+"""
+
+
+def calculate_average_plan_runtime(plan_id=None):
+    """Plan.average_duration is a slow query, so we store the same median on
+    Plan.calculated_average_duration for every plan at once, with a single
+    windowed query. Pass `plan_id` to only refresh that one plan.
     """
-    for plan in Plan.objects.all():
-        duration_seconds = plan.average_duration
-        if duration_seconds:
-            plan.calculated_average_duration = int(duration_seconds)
-            plan.save()
+    params = {
+        "status": Job.Status.complete,
+        "window": settings.AVERAGE_JOB_WINDOW,
+        "minimum": settings.MINIMUM_JOBS_FOR_AVERAGE,
+    }
+    plan_filter = ""
+    if plan_id is not None:
+        plan_filter = "AND plan_id = %(plan_id)s"
+        params["plan_id"] = Plan._meta.pk.get_db_prep_value(plan_id, connection)
+    sql = AVERAGE_DURATION_SQL.format(
+        plan_table=connection.ops.quote_name(Plan._meta.db_table),
+        job_table=connection.ops.quote_name(Job._meta.db_table),
+        plan_filter=plan_filter,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
 
 
 calculate_average_plan_runtime_job = job(calculate_average_plan_runtime)
@@ -0,0 +1,82 @@
+"""
+The minutely maintenance tick.
+
+Expiring preflights, handing pending Jobs to RQ and cleaning up user data used
+to be three separate cron jobs on the `short` queue. They now run one after
+another in a single RQ job, `maintenance_job`, under a lock in Redis so a slow
+tick is never overlapped by the next one (and Jobs are never handed to RQ
+twice). Every tick logs how long each sweep took and how many rows it touched,
+and keeps the latest figures in the cache, see `get_last_tick`.
+
+MAINTENANCE_TASKS lists the sweeps to run, by their old cron job names.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import LockError
+
+from .cleanup import cleanup_user_data
+from .constants import REDIS_MAINTENANCE_LOCK_KEY, REDIS_MAINTENANCE_STATS_KEY
+from .jobs import enqueuer, expire_preflights, job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {
+    "expire_preflight_results": expire_preflights,
+    "enqueue_jobs": enqueuer,
+    "cleanup_user_data": cleanup_user_data,
+}
+
+
+def run_task(name, func):
+    started = time.monotonic()
+    stats = {"ok": True}
+    try:
+        stats["rows"] = func()
+    except Exception:
+        logger.exception(f"Maintenance task {name} failed")
+        stats["ok"] = False
+    stats["duration"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def maintenance_tick():
+    """Run every sweep in MAINTENANCE_TASKS, unless a tick is already running.
+
+    Returns the per-sweep stats, or None if the tick was skipped.
+    """
+    lock = cache.lock(
+        REDIS_MAINTENANCE_LOCK_KEY, timeout=settings.MAINTENANCE_LOCK_TIMEOUT
+    )
+    if not lock.acquire(blocking=False):
+        logger.info("Skipping maintenance tick, the previous one is still running")
+        return None
+    try:
+        results = {
+            name: run_task(name, TASKS[name]) for name in settings.MAINTENANCE_TASKS
+        }
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # It expired while we were working, and may belong to the next tick:
+            logger.warning("Maintenance tick outlived its lock")
+
+    cache.set(REDIS_MAINTENANCE_STATS_KEY, results, timeout=None)
+    logger.info(
+        "Maintenance tick "
+        + ", ".join(f"{name} {stats['duration']}s" for name, stats in results.items()),
+        extra={"context": {"event": "maintenance", "tasks": results}},
+    )
+    return results
+
+
+maintenance_job = job(maintenance_tick)
+
+
+def get_last_tick():
+    """The per-sweep stats of the most recent tick."""
+    return cache.get(REDIS_MAINTENANCE_STATS_KEY)
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...eta import plan_run_time, queue_wait
+from ...models import Job, Plan
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.0f}s"
+
+
+class Command(BaseCommand):
+    help = (
+        "Report recent queue waits and job run times, and how many workers "
+        "that load needs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Look at jobs created in this many past hours",
+        )
+
+    def handle(self, *args, hours, **options):
+        since = timezone.now() - timedelta(hours=hours)
+        recent = Job.objects.filter(created_at__gte=since, is_release_test=False)
+        wait = queue_wait()
+        lines = [
+            f"Queue wait p50:     {format_seconds(wait.get(50))}",
+            f"Queue wait p90:     {format_seconds(wait.get(90))}",
+            "",
+        ]
+
+        busy_seconds = 0
+        for plan in Plan.objects.filter(job__in=recent).distinct():
+            count = recent.filter(plan=plan).count()
+            run_time = plan_run_time(plan.id)
+            if run_time:
+                busy_seconds += count * run_time[50]
+            lines.append(
+                f"{plan}: {count} jobs, run time "
+                f"p50 {format_seconds(run_time.get(50))}, "
+                f"p90 {format_seconds(run_time.get(90))}"
+            )
+
+        # Little's law: the average number of jobs running at once is the
+        # arrival rate times how long each one runs.
+        lines += [
+            "",
+            f"Jobs created:       {recent.count()} in {hours}h",
+            f"Workers busy:       {busy_seconds / (hours * 3600):.2f} on average",
+        ]
+        self.stdout.write("\n".join(lines))
@@ -0,0 +1,46 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...outbox import relay_outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Send committed push notifications from the outbox to the channel layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PUSH_OUTBOX_BATCH_SIZE,
+            help="Number of outbox rows to send per batch",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.PUSH_OUTBOX_POLL_INTERVAL,
+            help="Seconds to wait when the outbox is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Relay a single batch and exit",
+        )
+
+    def handle(self, *args, batch_size, interval, once, **options):
+        while True:
+            close_old_connections()
+            try:
+                relayed = relay_outbox(batch_size)
+            except Exception:
+                logger.exception("Error relaying push events")
+                relayed = 0
+            if once:
+                return
+            if relayed < batch_size:
+                time.sleep(interval)
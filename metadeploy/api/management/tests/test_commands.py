@@ -34,6 +34,7 @@ def test_run_plan(plan_factory):
 
     with ExitStack() as stack:
         stack.enter_context(patch("metadeploy.api.jobs.local_github_checkout"))
+        stack.enter_context(patch("metadeploy.api.jobs.resolve_commit"))
         stack.enter_context(
             patch("metadeploy.api.salesforce.OrgConfig.refresh_oauth_token")
         )
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0121_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="queue_weight",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text=(
+                    "Share of job slots this product gets when jobs are waiting, "
+                    "relative to other products."
+                ),
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0122_product_queue_weight"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="started_at",
+            field=models.DateTimeField(
+                blank=True, help_text="The time a worker picked the job up.", null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="StepDuration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("duration", models.FloatField(help_text="In seconds.")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="step_durations",
+                        to="api.job",
+                    ),
+                ),
+                (
+                    "step",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="durations",
+                        to="api.step",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["step", "-created_at"],
+                        name="stepduration_step_recent_idx",
+                    )
+                ],
+            },
+        ),
+    ]
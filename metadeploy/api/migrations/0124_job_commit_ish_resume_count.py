@@ -0,0 +1,35 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0123_job_started_at_stepduration"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="commit_ish",
+            field=models.CharField(
+                blank=True,
+                help_text=(
+                    "The commit the Job ran against. A resumed Job only skips the "
+                    "steps it completed at this same commit."
+                ),
+                max_length=256,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="resume_count",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text=(
+                    "How many times the Job was resumed after its worker restarted."
+                ),
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:00
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0124_job_commit_ish_resume_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="parallel_steps",
+            field=models.BooleanField(
+                default=False,
+                help_text=(
+                    "Run steps that don't depend on each other at the same time. "
+                    "See the steps' depends_on."
+                ),
+            ),
+        ),
+        migrations.AddField(
+            model_name="step",
+            name="depends_on",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=64),
+                blank=True,
+                default=list,
+                help_text=(
+                    "The step_nums of the earlier steps this one waits for, when the "
+                    "plan runs steps in parallel. Inferred from the step's kind if left "
+                    "empty."
+                ),
+                size=None,
+            ),
+        ),
+    ]
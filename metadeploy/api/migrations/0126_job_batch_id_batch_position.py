@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0125_plan_parallel_steps_step_depends_on"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="batch_id",
+            field=models.UUIDField(
+                blank=True,
+                db_index=True,
+                help_text=(
+                    "Jobs created together to install several plans on one org share "
+                    "a batch_id, and run one after the other in one worker."
+                ),
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="batch_position",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Where the Job runs in its batch."
+            ),
+        ),
+    ]
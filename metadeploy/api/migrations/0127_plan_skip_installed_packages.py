@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0126_job_batch_id_batch_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="skip_installed_packages",
+            field=models.BooleanField(
+                default=False,
+                help_text=(
+                    "Skip Package steps whose version the org already has installed, "
+                    "or a newer one."
+                ),
+            ),
+        ),
+    ]
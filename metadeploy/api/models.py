@@ -1,16 +1,12 @@
 import logging
 import uuid
+from datetime import timedelta
 from statistics import median
 from typing import Union
 
-from asgiref.sync import async_to_sync
 from colorfield.fields import ColorField
 from cumulusci.core.config import FlowConfig
-from cumulusci.core.flowrunner import (
-    FlowCoordinator,
-    PreflightFlowCoordinator,
-    StepSpec,
-)
+from cumulusci.core.flowrunner import FlowCoordinator, StepSpec
 from cumulusci.core.tasks import BaseTask
 from cumulusci.core.utils import import_class
 from django.conf import settings
@@ -21,8 +17,9 @@ from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Count, F, Func, JSONField, Q
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from hashid_field import HashidAutoField
 from model_utils import Choices, FieldTracker
@@ -33,8 +30,14 @@ from sfdo_template_helpers.fields import MarkdownField as BaseMarkdownField
 from sfdo_template_helpers.slugs import AbstractSlug, SlugMixin
 
 from .belvedere_utils import convert_to_18
-from .constants import ERROR, HIDE, OPTIONAL, ORGANIZATION_DETAILS, SKIP
+from .cancellation import CancelWatcher
+from .constants import ERROR, HIDE, OK, OPTIONAL, ORGANIZATION_DETAILS, SKIP
 from .flows import JobFlowCallback, PreflightFlowCallback
+from .inventory import skip_installed_packages
+from .org_facts import forget_org_facts, recall_org_facts, remember_org_facts
+from .org_status import invalidate_org_status
+from .parallel import ParallelFlowCoordinator, ParallelPreflightFlowCoordinator
+from .publisher import publish
 from .push import (
     notify_org_changed,
     notify_org_result_changed,
@@ -149,7 +152,7 @@ class UserManager(BaseUserManager):
 class User(HashIdMixin, AbstractUser):
     objects = UserManager()
 
-    def subscribable_by(self, user, session):
+    def subscribable_by(self, user, session, scratch_org=None):
         return self == user
 
     @property
@@ -314,6 +317,13 @@ class Product(HashIdMixin, SlugMixin, AllowedListAccessMixin, TranslatableModel)
     layout = models.CharField(
         choices=PRODUCT_LAYOUTS, default=PRODUCT_LAYOUTS.Default, max_length=64
     )
+    queue_weight = models.PositiveSmallIntegerField(
+        default=1,
+        help_text=_(
+            "Share of job slots this product gets when jobs are waiting, "
+            "relative to other products."
+        ),
+    )
 
     slug_class = ProductSlug
     slug_field_name = "title"
@@ -512,6 +522,20 @@ class Plan(HashIdMixin, SlugMixin, AllowedListAccessMixin, TranslatableModel):
         validators=[MinValueValidator(0)],
         help_text="The duration between the enqueueing of a job and its successful completion.",
     )
+    parallel_steps = models.BooleanField(
+        default=False,
+        help_text=(
+            "Run steps that don't depend on each other at the same time. See the "
+            "steps' depends_on."
+        ),
+    )
+    skip_installed_packages = models.BooleanField(
+        default=False,
+        help_text=(
+            "Skip Package steps whose version the org already has installed, or a "
+            "newer one."
+        ),
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -578,6 +602,41 @@ class Plan(HashIdMixin, SlugMixin, AllowedListAccessMixin, TranslatableModel):
             f"{self.plan_template.product.slug}:plan:{self.plan_template.name}",
         )
 
+    def step_dependencies(self):
+        """Map each step's step_num to the step_nums it waits for, when the plan
+        runs steps in parallel.
+
+        Steps can list these in `depends_on`. For those that don't, they are
+        inferred from the step's kind: package installs, one-time Apex and
+        other tasks wait for every step before them, and every step after them
+        waits for them. In between, metadata waits for earlier metadata from
+        the same source, and data for all earlier metadata.
+        """
+        dependencies = {}
+        barrier = None
+        metadata = []
+        for step in self.steps.all():
+            if step.depends_on:
+                # Only earlier steps, so a typo can't deadlock the Job:
+                depends_on = set(step.depends_on) & dependencies.keys()
+            elif step.kind == Step.Kind.metadata:
+                depends_on = {s.step_num for s in metadata if s.source == step.source}
+            elif step.kind == Step.Kind.data:
+                depends_on = {s.step_num for s in metadata}
+            else:
+                depends_on = set(dependencies)
+            if barrier and not step.depends_on:
+                depends_on.add(barrier)
+            dependencies[step.step_num] = depends_on
+
+            if step.kind == Step.Kind.metadata:
+                metadata.append(step)
+            elif step.kind != Step.Kind.data:
+                barrier = step.step_num
+                # Everything before is covered by waiting for the barrier:
+                metadata = []
+        return dependencies
+
     def get_absolute_url(self):
         # See src/js/utils/routes.ts
         return f"/products/{self.version.product.slug}/{self.version.label}/{self.slug}"
@@ -657,6 +716,15 @@ class Step(HashIdMixin, TranslatableModel):
     )
     task_config = JSONField(default=dict, blank=True)
     source = JSONField(blank=True, null=True)
+    depends_on = ArrayField(
+        models.CharField(max_length=64),
+        default=list,
+        blank=True,
+        help_text=(
+            "The step_nums of the earlier steps this one waits for, when the plan "
+            "runs steps in parallel. Inferred from the step's kind if left empty."
+        ),
+    )
 
     class Meta:
         ordering = (DottedArray(F("step_num")),)
@@ -719,6 +787,11 @@ class Job(HashIdMixin, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     edited_at = models.DateTimeField(auto_now=True)
     enqueued_at = models.DateTimeField(null=True)
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="The time a worker picked the job up.",
+    )
     job_id = models.UUIDField(null=True)
     status = models.CharField(choices=Status, max_length=64, default=Status.started)
     org_id = models.CharField(null=True, blank=True, max_length=18)
@@ -750,6 +823,31 @@ class Job(HashIdMixin, models.Model):
         related_name="msa_jobs",
     )
     is_release_test = models.BooleanField(default=False)
+    commit_ish = models.CharField(
+        max_length=256,
+        null=True,
+        blank=True,
+        help_text=(
+            "The commit the Job ran against. A resumed Job only skips the steps "
+            "it completed at this same commit."
+        ),
+    )
+    resume_count = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="How many times the Job was resumed after its worker restarted.",
+    )
+    batch_id = models.UUIDField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text=(
+            "Jobs created together to install several plans on one org share a "
+            "batch_id, and run one after the other in one worker."
+        ),
+    )
+    batch_position = models.PositiveSmallIntegerField(
+        default=0, help_text="Where the Job runs in its batch."
+    )
 
     @property
     def org_name(self):
@@ -773,12 +871,12 @@ class Job(HashIdMixin, models.Model):
             f"{self.plan.slug}/jobs/{self.id}"
         )
 
-    def subscribable_by(self, user, session):
+    def subscribable_by(self, user, session, scratch_org=None):
         # Restrict this to public Jobs, staff users, Job owners, or users who have a
         # valid scratch_org `uuid` in their session (matching this Job):
         if self.is_public or user.is_staff or user == self.user:
             return True
-        scratch_org = ScratchOrg.objects.get_from_session(session)
+        scratch_org = scratch_org or ScratchOrg.objects.get_from_session(session)
         return scratch_org and scratch_org.org_id == self.org_id
 
     def skip_steps(self):
@@ -786,14 +884,29 @@ class Job(HashIdMixin, models.Model):
             step.step_num for step in set(self.plan.steps.all()) - set(self.steps.all())
         ]
 
+    def completed_steps(self):
+        """The ids of the steps this Job has already run successfully."""
+        return {
+            step_id
+            for step_id, step_results in self.results.items()
+            if step_results and step_results[0].get("status") == OK
+        }
+
+    def batch(self):
+        """This Job and the ones batched with it, in the order they run."""
+        if self.batch_id is None:
+            return Job.objects.filter(pk=self.pk)
+        return Job.objects.filter(batch_id=self.batch_id).order_by("batch_position")
+
     def _push_if_condition(self, condition, fn):
         if condition:
-            async_to_sync(fn)(self)
+            publish(fn, self)
 
     def push_to_org_subscribers(self, is_new, changed):
-        self._push_if_condition(
-            is_new or "status" in changed, notify_org_result_changed
-        )
+        org_status_changed = is_new or "status" in changed
+        if org_status_changed:
+            invalidate_org_status(self.org_id)
+        self._push_if_condition(org_status_changed, notify_org_result_changed)
 
     def push_if_results_changed(self, changed):
         results_has_changed = "results" in changed and self.results != {}
@@ -825,6 +938,14 @@ class Job(HashIdMixin, models.Model):
 
         ret = super().save(*args, **kwargs)
 
+        if (is_new and self.enqueued_at is None) or (
+            "status" in changed and self.status != Job.Status.started
+        ):
+            from .jobs import request_enqueuer
+
+            # There's a Job waiting, or room for one in the queue:
+            transaction.on_commit(request_enqueuer)
+
         try:
             self.push_to_org_subscribers(is_new, changed)
             self.push_if_results_changed(changed)
@@ -854,19 +975,116 @@ class Job(HashIdMixin, models.Model):
             preflight.save()
 
     def run(self, ctx, plan, steps, org):
-        flow_coordinator = FlowCoordinator.from_steps(
-            ctx.project_config, steps, name="default", callbacks=JobFlowCallback(self)
-        )
-        flow_coordinator.run(org)
+        # Pick up what the preflight just found out about the org:
+        recall_org_facts(self.org_id, org)
+        if plan.skip_installed_packages:
+            skipped = skip_installed_packages(plan, steps, org)
+            for step_id, message in skipped.items():
+                self.results[step_id] = [{"status": SKIP, "message": message}]
+            if skipped:
+                self.save()
+        try:
+            with CancelWatcher(self.id) as cancel_watcher:
+                callbacks = JobFlowCallback(self, cancel_watcher=cancel_watcher)
+                if plan.parallel_steps:
+                    flow_coordinator = ParallelFlowCoordinator.from_steps(
+                        ctx.project_config, steps, name="default", callbacks=callbacks
+                    )
+                    flow_coordinator.dependencies = plan.step_dependencies()
+                else:
+                    flow_coordinator = FlowCoordinator.from_steps(
+                        ctx.project_config, steps, name="default", callbacks=callbacks
+                    )
+                flow_coordinator.run(org)
+        finally:
+            # A preflight may have run meanwhile, and seen the org half-changed:
+            forget_org_facts(self.org_id)
+
+
+class StepDuration(models.Model):
+    """How long a Step took to run successfully in one Job.
+
+    Recorded by `JobFlowCallback`, and used by `metadeploy.api.eta` to estimate
+    how long Jobs have left.
+    """
+
+    job = models.ForeignKey(
+        Job, on_delete=models.CASCADE, related_name="step_durations"
+    )
+    step = models.ForeignKey(Step, on_delete=models.CASCADE, related_name="durations")
+    duration = models.FloatField(help_text="In seconds.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=("step", "-created_at"), name="stepduration_step_recent_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.step_id}: {self.duration:.1f}s"
+
+
+def preflight_expiry_cutoff():
+    """Preflights created at or before this time have expired."""
+    return timezone.now() - timedelta(minutes=settings.PREFLIGHT_LIFETIME_MINUTES)
 
 
 class PreflightResultQuerySet(models.QuerySet):
     def most_recent(self, *, org_id, plan, is_valid_and_complete=True):
         kwargs = {"org_id": org_id, "plan": plan}
         if is_valid_and_complete:
-            kwargs.update({"is_valid": True, "status": PreflightResult.Status.complete})
+            kwargs.update(
+                {
+                    "is_valid": True,
+                    "status": PreflightResult.Status.complete,
+                    # Don't wait for expire_preflights to catch up:
+                    "created_at__gt": preflight_expiry_cutoff(),
+                }
+            )
         return self.filter(**kwargs).order_by("-created_at").first()
 
+    def reusable(self, *, org_id, plan, user=None):
+        """A preflight a new request for the same org and plan can share.
+
+        That's one still running, or one that completed in the last
+        PREFLIGHT_REUSE_SECONDS (double clicks, several tabs).
+        """
+        fresh = timezone.now() - timedelta(seconds=settings.PREFLIGHT_REUSE_SECONDS)
+        return (
+            self.filter(
+                org_id=org_id,
+                plan=plan,
+                user=user,
+                is_valid=True,
+                created_at__gt=preflight_expiry_cutoff(),
+            )
+            .filter(
+                Q(status=PreflightResult.Status.started)
+                | Q(status=PreflightResult.Status.complete, success_at__gt=fresh)
+            )
+            .order_by("-created_at")
+            .first()
+        )
+
+    def completed_since(self, preflight):
+        """A preflight for the same org and plan that completed after
+        `preflight` was requested, so its results are as good as new."""
+        return (
+            self.filter(
+                org_id=preflight.org_id,
+                plan_id=preflight.plan_id,
+                user_id=preflight.user_id,
+                is_valid=True,
+                status=PreflightResult.Status.complete,
+                success_at__gte=preflight.created_at,
+            )
+            .exclude(pk=preflight.pk)
+            .order_by("-success_at")
+            .first()
+        )
+
 
 class PreflightResult(models.Model):
     Status = Choices("started", "complete", "failed", "canceled")
@@ -910,12 +1128,21 @@ class PreflightResult(models.Model):
         if self.user:
             return self.user.instance_url
 
-    def subscribable_by(self, user, session):
+    @property
+    def is_expired(self):
+        """Whether the preflight is past PREFLIGHT_LIFETIME_MINUTES, even if
+        expire_preflights hasn't marked it invalid yet.
+        """
+        return (
+            self.created_at is not None and self.created_at <= preflight_expiry_cutoff()
+        )
+
+    def subscribable_by(self, user, session, scratch_org=None):
         # Restrict this to staff users, Preflight owners and users who have a valid
         # scratch_org `uuid` in their session (matching this Preflight):
         if user.is_staff or self.user == user:
             return True
-        scratch_org = ScratchOrg.objects.get_from_session(session)
+        scratch_org = scratch_org or ScratchOrg.objects.get_from_session(session)
         return scratch_org and scratch_org.org_id == self.org_id
 
     def has_any_errors(self):
@@ -946,12 +1173,13 @@ class PreflightResult(models.Model):
 
     def _push_if_condition(self, condition, fn):
         if condition:
-            async_to_sync(fn)(self)
+            publish(fn, self)
 
     def push_to_org_subscribers(self, is_new, changed):
-        self._push_if_condition(
-            is_new or "status" in changed, notify_org_result_changed
-        )
+        org_status_changed = is_new or "status" in changed
+        if org_status_changed:
+            invalidate_org_status(self.org_id)
+        self._push_if_condition(org_status_changed, notify_org_result_changed)
 
     def push_if_completed(self, changed):
         has_completed = (
@@ -994,7 +1222,7 @@ class PreflightResult(models.Model):
 
     def run(self, ctx, plan, steps, org):
         flow_config = FlowConfig({"checks": plan.preflight_checks, "steps": {}})
-        flow_coordinator = PreflightFlowCoordinator(
+        flow_coordinator = ParallelPreflightFlowCoordinator(
             ctx.project_config,
             flow_config,
             name="preflight",
@@ -1002,6 +1230,7 @@ class PreflightResult(models.Model):
         )
         flow_coordinator.steps = steps
         flow_coordinator.run(org)
+        remember_org_facts(self.org_id, org)
 
 
 class ScratchOrgQuerySet(models.QuerySet):
@@ -1014,6 +1243,8 @@ class ScratchOrgQuerySet(models.QuerySet):
         or from a URL query string (`GetScratchOrgIdFromQueryStringMiddleware`).
         """
         uuid = session.get("scratch_org_id")
+        if not uuid:
+            return None
         try:
             return self.get(uuid=uuid)
         except (ValidationError, ScratchOrg.DoesNotExist):
@@ -1064,7 +1295,7 @@ class ScratchOrg(HashIdMixin, models.Model):
             super().save()
         return ret
 
-    def subscribable_by(self, user, session):
+    def subscribable_by(self, user, session, scratch_org=None):
         # Restrict this to staff users or users who have a valid scratch_org `uuid` in
         # their session for this org:
         if user.is_staff:
@@ -1081,9 +1312,7 @@ class ScratchOrg(HashIdMixin, models.Model):
         self, *args, error=None, should_delete_on_sf=True, should_notify=True, **kwargs
     ):
         if should_notify:
-            async_to_sync(notify_org_changed)(
-                self, error=error, _type="SCRATCH_ORG_DELETED"
-            )
+            publish(notify_org_changed, self, error=error, _type="SCRATCH_ORG_DELETED")
         if should_delete_on_sf and self.org_id:
             self.queue_delete()
         else:
@@ -1093,13 +1322,13 @@ class ScratchOrg(HashIdMixin, models.Model):
         # This is not really necessary, since we're going to delete the org soon...
         self.status = ScratchOrg.Status.failed
         self.save()
-        async_to_sync(notify_org_changed)(self, error=error)
+        publish(notify_org_changed, self, error=error)
         self.delete(should_notify=False)
 
     def fail_job(self):
         self.status = ScratchOrg.Status.failed
         self.save()
-        async_to_sync(notify_org_changed)(self)
+        publish(notify_org_changed, self)
         self.queue_delete(should_delete_locally=False)
 
     def complete(self, org_config):
@@ -1108,7 +1337,7 @@ class ScratchOrg(HashIdMixin, models.Model):
         self.org_id = convert_to_18(org_config.org_id)
         self.expires_at = org_config.expires
         self.save()
-        async_to_sync(notify_org_changed)(self, _type="SCRATCH_ORG_CREATED")
+        publish(notify_org_changed, self, _type="SCRATCH_ORG_CREATED")
 
     def get_refreshed_org_config(self, org_name=None, keychain=None):
         org_config = refresh_access_token(
@@ -1175,3 +1404,24 @@ class Translation(models.Model):
 
     class Meta:
         unique_together = (("context", "slug", "lang"),)
+
+
+class OutboxMessage(models.Model):
+    """A push event waiting to be sent to the channel layer.
+
+    These are written in the same transaction as the change they describe (see
+    `metadeploy.api.outbox`), and relayed by the `relay_push_events` command once
+    committed. `event` is the push coroutine to run, and `args` and `kwargs` the
+    arguments to run it with, with model instances stored by model and pk.
+    `claimed_at` is set while a relay is sending the event.
+    """
+
+    event = models.CharField(max_length=256)
+    args = JSONField(encoder=DjangoJSONEncoder, default=list)
+    kwargs = JSONField(encoder=DjangoJSONEncoder, default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.event
@@ -0,0 +1,62 @@
+"""
+A short-lived cache of facts about an org, shared by preflights and Jobs.
+
+A preflight and the Job that follows it, often seconds apart, both used to ask
+the org the same questions, e.g. which packages are installed, which takes a
+query per package. CumulusCI's OrgConfig already caches the answers for as long
+as the OrgConfig lives, in the attributes listed in FACTS.
+
+After a preflight, `remember_org_facts` copies whatever it found out into the
+cache for ORG_FACTS_CACHE_TIMEOUT seconds (never longer than the preflight
+itself is valid). A Job starting on the org picks them up with
+`recall_org_facts` and then forgets them, since it's about to change the org.
+CumulusCI resets its own copy whenever a task changes what's installed.
+
+Preflights never read the cache: people rerun them after fixing their org.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .constants import REDIS_ORG_FACTS_KEY
+
+FACTS = (
+    "_installed_packages",
+    "_is_person_accounts_enabled",
+    "_latest_api_version",
+)
+
+
+def get_timeout():
+    return min(
+        settings.ORG_FACTS_CACHE_TIMEOUT, settings.PREFLIGHT_LIFETIME_MINUTES * 60
+    )
+
+
+def remember_org_facts(org_id, org_config):
+    """Cache the facts `org_config` has looked up about the org."""
+    facts = {
+        name: getattr(org_config, name)
+        for name in FACTS
+        if getattr(org_config, name, None) is not None
+    }
+    if facts:
+        cache.set(
+            REDIS_ORG_FACTS_KEY.format(org_id=org_id), facts, timeout=get_timeout()
+        )
+
+
+def recall_org_facts(org_id, org_config):
+    """Fill in the facts cached for the org on `org_config`, and forget them.
+
+    Returns the names of the facts that were cached.
+    """
+    facts = cache.get(REDIS_ORG_FACTS_KEY.format(org_id=org_id)) or {}
+    forget_org_facts(org_id)
+    for name, value in facts.items():
+        setattr(org_config, name, value)
+    return list(facts)
+
+
+def forget_org_facts(org_id):
+    cache.delete(REDIS_ORG_FACTS_KEY.format(org_id=org_id))
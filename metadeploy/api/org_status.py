@@ -0,0 +1,71 @@
+"""
+Cached org status documents.
+
+The org status (the org's currently running Job and PreflightResult, if any) is
+read on every `/api/orgs/` poll and sent with every ORG_CHANGED push. It only
+changes when a Job or PreflightResult for the org changes status, so we keep a
+serialized copy per org in the cache, invalidate it on those changes and refresh
+it when the ORG_CHANGED push is built.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .constants import REDIS_ORG_STATUS_KEY
+
+
+def serialize_org_status(org_id):
+    from .models import Job, PreflightResult
+    from .serializers import OrgSerializer
+
+    current_job = (
+        Job.objects.filter(org_id=org_id, status=Job.Status.started)
+        .select_related("plan__version__product")
+        .first()
+    )
+    current_preflight = PreflightResult.objects.filter(
+        org_id=org_id, status=PreflightResult.Status.started
+    ).first()
+    serializer = OrgSerializer(
+        {
+            "org_id": org_id,
+            "current_job": current_job,
+            "current_preflight": current_preflight,
+        }
+    )
+    return dict(serializer.data)
+
+
+def get_org_status(org_id):
+    """Return the status document for `org_id`, from the cache if possible."""
+    key = REDIS_ORG_STATUS_KEY.format(org_id=org_id)
+    data = cache.get(key)
+    if data is None:
+        data = serialize_org_status(org_id)
+        cache.set(key, data, timeout=settings.ORG_STATUS_CACHE_TIMEOUT)
+    return data
+
+
+def refresh_org_status(org_id):
+    """Serialize the status for `org_id` from the database, and cache it.
+
+    If called inside a transaction, the result is only cached once the
+    transaction commits, so the cache never holds uncommitted state.
+    """
+    key = REDIS_ORG_STATUS_KEY.format(org_id=org_id)
+    data = serialize_org_status(org_id)
+    transaction.on_commit(
+        lambda: cache.set(key, data, timeout=settings.ORG_STATUS_CACHE_TIMEOUT)
+    )
+    return data
+
+
+def invalidate_org_status(*org_ids):
+    keys = [REDIS_ORG_STATUS_KEY.format(org_id=org_id) for org_id in org_ids if org_id]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Also clear anything cached from the old state while the change was
+    # uncommitted:
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,145 @@
+"""
+Transactional outbox for push notifications.
+
+With PUSH_OUTBOX_ENABLED, `publish` doesn't talk to the channel layer at all.
+It stores the push event, that is the push coroutine and its arguments, as an
+OutboxMessage row using the caller's database connection, so it commits or
+rolls back together with the change it describes. Model instances are stored
+as their model and pk only, so recording an event doesn't serialize anything.
+
+The `relay_push_events` management command then claims committed rows in
+batches, loads the instances again and runs the push coroutines, which is
+where the messages are built and sent. A push about a row that's been deleted
+in the meantime only gets its pk and foreign keys.
+"""
+
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxMessage
+from .push import collect_messages, error_message, push_messages
+
+logger = logging.getLogger(__name__)
+
+
+def _pk(value):
+    # HashidAutoField values aren't JSON; their string form looks them up.
+    return None if value is None else str(value)
+
+
+def encode(value):
+    """The JSON form of a push coroutine argument."""
+    if isinstance(value, models.Model):
+        return {
+            "__model__": value._meta.label_lower,
+            "pk": _pk(value.pk),
+            "fks": {
+                field.attname: _pk(getattr(value, field.attname))
+                for field in value._meta.concrete_fields
+                if field.is_relation
+            },
+        }
+    if isinstance(value, (list, tuple, models.QuerySet)):
+        return [encode(item) for item in value]
+    if isinstance(value, BaseException):
+        return error_message(value)
+    return value
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict) and "__model__" in value:
+        model = apps.get_model(value["__model__"])
+        instance = model.objects.filter(pk=value["pk"]).first()
+        if instance is None:
+            instance = model(pk=value["pk"], **value["fks"])
+        return instance
+    return value
+
+
+def record(fn, *args, **kwargs):
+    """Store the push event `fn(*args, **kwargs)`, to be sent once committed."""
+    OutboxMessage.objects.create(
+        event=f"{fn.__module__}.{fn.__qualname__}",
+        args=encode(args),
+        kwargs={key: encode(value) for key, value in kwargs.items()},
+    )
+
+
+def send(row):
+    """Run the push event of `row`. Returns whether all its messages were sent."""
+    fn = import_string(row.event)
+    args = decode(row.args)
+    kwargs = {key: decode(value) for key, value in row.kwargs.items()}
+    messages = async_to_sync(collect_messages)(fn, *args, **kwargs)
+    return async_to_sync(push_messages)(messages) == len(messages)
+
+
+def claim_batch(batch_size):
+    """Mark up to `batch_size` committed outbox rows as taken by this relay.
+
+    The claim is committed before anything is sent, so no row lock is held while
+    talking to the channel layer. Rows claimed by a relay that hasn't finished
+    within PUSH_OUTBOX_CLAIM_TIMEOUT seconds are claimed again.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=settings.PUSH_OUTBOX_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        batch = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(Q(claimed_at=None) | Q(claimed_at__lt=expired))
+            .order_by("id")[:batch_size]
+        )
+        OutboxMessage.objects.filter(id__in=[row.id for row in batch]).update(
+            claimed_at=now
+        )
+    return batch
+
+
+def relay_outbox(batch_size=None):
+    """Send one batch of committed outbox events, oldest first.
+
+    Rows are claimed first (see `claim_batch`), so several relays can run at
+    once. An event that fails doesn't hold up the rest of the batch; it is
+    released to be retried on a later batch, up to PUSH_OUTBOX_MAX_ATTEMPTS
+    times. Returns the number of rows handled.
+    """
+    batch = claim_batch(batch_size or settings.PUSH_OUTBOX_BATCH_SIZE)
+
+    # Within a batch, identical events only need to go out once:
+    duplicates = {}
+    for row in batch:
+        key = (row.event, repr(row.args), repr(row.kwargs))
+        duplicates.setdefault(key, []).append(row)
+
+    done = set()
+    failed = set()
+    for first, *rest in duplicates.values():
+        ids = {row.id for row in (first, *rest)}
+        try:
+            sent = send(first)
+        except Exception:
+            logger.exception(f"Push event failed: {first.event}")
+            sent = False
+        if sent:
+            done.update(ids)
+        elif first.attempts + 1 >= settings.PUSH_OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Dropping push event {first.id} after failed attempts")
+            done.update(ids)
+        else:
+            failed.update(ids)
+
+    OutboxMessage.objects.filter(id__in=done).delete()
+    OutboxMessage.objects.filter(id__in=failed).update(
+        attempts=F("attempts") + 1, claimed_at=None
+    )
+    return len(done)
@@ -0,0 +1,283 @@
+"""
+Running independent plan steps and preflight checks at the same time.
+
+Plans with `parallel_steps` run under `ParallelFlowCoordinator` instead of
+CumulusCI's FlowCoordinator. Each step starts as soon as the steps it depends
+on (see `Plan.step_dependencies`) have finished, on a pool of
+PARALLEL_STEPS_MAX_WORKERS threads. After the first failure no more steps are
+started; the ones already running finish, and then the failure is raised as
+FlowCoordinator would raise it.
+
+The threads share the worker's current directory. Every CumulusCI task runs
+in its project's repo root, which for most steps is the directory the Job
+runs in anyway, but some tasks `os.chdir` elsewhere while they run, e.g. to
+build a deployment in a temporary directory. Those (EXCLUSIVE_TASK_CLASSES),
+and steps from another repository (a `source`), run on their own: they wait
+for the running steps to finish, and nothing else starts until they're done.
+
+A canceled Job starts no more steps either. The steps already running aren't
+interrupted, since the cancellation signal only reaches the main thread (see
+`metadeploy.api.cancellation`). Once they have finished, StopFlowException is
+raised.
+
+Preflights run under `ParallelPreflightFlowCoordinator`, which evaluates all
+of a plan's checks on a pool of PREFLIGHT_CHECKS_MAX_WORKERS threads, see
+there.
+"""
+
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cumulusci.core.flowrunner import (
+    CachedTaskRunner,
+    FlowCoordinator,
+    PreflightFlowCoordinator,
+    TaskCache,
+)
+from cumulusci.tasks.metadata.modify import RemoveElementsXPath
+from cumulusci.tasks.salesforce.BaseSalesforceMetadataApiTask import (
+    BaseSalesforceMetadataApiTask,
+)
+from cumulusci.tasks.salesforce.EnsureRecordTypes import EnsureRecordTypes
+from cumulusci.tasks.salesforce.update_dependencies import UpdateDependencies
+from django.conf import settings
+from django.db import connection
+
+from .flows import StopFlowException
+
+# Tasks that change the current directory while they run. Deploys (and
+# uninstalls) build their package in a temporary directory, and so do
+# dependency updates of unmanaged code:
+EXCLUSIVE_TASK_CLASSES = (
+    BaseSalesforceMetadataApiTask,
+    EnsureRecordTypes,
+    RemoveElementsXPath,
+    UpdateDependencies,
+)
+
+
+def close_connection_after(func):
+    """Run `func` in a pool thread, which has its own database connection."""
+
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connection.close()
+
+    return wrapper
+
+
+class ParallelFlowCoordinator(FlowCoordinator):
+    # Maps each step_num to the step_nums it waits for:
+    dependencies = None
+    # How often to check for a cancellation while steps are running:
+    cancel_poll_interval = 1.0
+
+    def run(self, org_config):
+        # This is FlowCoordinator.run, apart from how the steps are run:
+        self.org_config = org_config
+        line = f"Initializing flow: {self.__class__.__name__}"
+        if self.name:
+            line = f"{line} ({self.name})"
+        self._rule()
+        self.logger.info(line)
+        self.logger.info(self.flow_config.description)
+        self._rule(new_line=True)
+
+        self._init_org()
+        self._rule(fill="-")
+        self.logger.info("Organization:")
+        self.logger.info(f"  Username: {org_config.username}")
+        self.logger.info(f"    Org Id: {org_config.org_id}")
+        self.logger.info(f"  Instance: {org_config.instance_name}")
+        self._rule(fill="-", new_line=True)
+
+        self.callbacks.pre_flow(self)
+
+        self._rule(fill="-")
+        self.logger.info("Steps:")
+        for line in self.get_summary().splitlines():
+            self.logger.info(line)
+        self._rule(fill="-", new_line=True)
+
+        self.logger.info(
+            f"Starting execution, up to {settings.PARALLEL_STEPS_MAX_WORKERS} "
+            "steps at a time"
+        )
+        self._rule(new_line=True)
+
+        try:
+            self._run_steps()
+            flow_name = f"'{self.name}' " if self.name else ""
+            self.logger.info(
+                f"Completed flow {flow_name}on org {org_config.name} successfully!"
+            )
+        finally:
+            self.callbacks.post_flow(self)
+
+    def runs_alone(self, step):
+        """Whether `step` may not run at the same time as any other step."""
+        if step.project_config is not self.project_config:
+            return True
+        task_class = step.task_class
+        return isinstance(task_class, type) and issubclass(
+            task_class, EXCLUSIVE_TASK_CLASSES
+        )
+
+    def is_canceled(self):
+        cancel_watcher = getattr(self.callbacks, "cancel_watcher", None)
+        return cancel_watcher is not None and cancel_watcher.is_canceled()
+
+    def _run_steps(self):
+        step_nums = {str(step.step_num) for step in self.steps}
+        dependencies = {
+            step_num: set(depends_on) & step_nums
+            for step_num, depends_on in (self.dependencies or {}).items()
+        }
+        pending = list(self.steps)
+        running = {}
+        finished = set()
+        error = None
+        canceled = False
+
+        with ThreadPoolExecutor(
+            max_workers=settings.PARALLEL_STEPS_MAX_WORKERS,
+            thread_name_prefix="metadeploy-step",
+        ) as executor:
+            try:
+                while pending or running:
+                    if error is None and not canceled:
+                        for step in [
+                            step
+                            for step in pending
+                            if dependencies.get(str(step.step_num), set()) <= finished
+                        ]:
+                            if running and (
+                                self.runs_alone(step)
+                                or any(map(self.runs_alone, running.values()))
+                            ):
+                                # The steps after it wait their turn, too:
+                                break
+                            pending.remove(step)
+                            future = executor.submit(
+                                close_connection_after(self._run_step), step
+                            )
+                            running[future] = step
+                    if not running:
+                        break
+                    done, _ = wait(
+                        running,
+                        timeout=self.cancel_poll_interval,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        finished.add(str(running.pop(future).step_num))
+                        if error is None and not future.cancelled():
+                            error = future.exception()
+                    if not canceled and self.is_canceled():
+                        canceled = True
+                        # Drop what hasn't started, and let the rest finish:
+                        for future in running:
+                            future.cancel()
+            except BaseException:
+                # E.g. the worker is shutting down: don't start what's queued.
+                for future in running:
+                    future.cancel()
+                raise
+
+        if canceled:
+            raise StopFlowException("Job canceled.")
+        if error is not None:
+            raise error
+
+
+class SharedTaskCache(TaskCache):
+    """A TaskCache that checks evaluated in parallel can share.
+
+    Checks often call the same task with the same options, e.g. to list the
+    installed packages. Whichever check gets there first runs it, and the
+    others wait for its result instead of querying the org again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._locks = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+
+    def lock_for(self, cache_key):
+        with self._locks_lock:
+            return self._locks[cache_key]
+
+    def __getattr__(self, task_name):
+        return SharedTaskRunner(self, task_name)
+
+
+class SharedTaskRunner(CachedTaskRunner):
+    def __call__(self, **options):
+        cache_key = (self.task_name, tuple(sorted(options.items())))
+        with self.cache.lock_for(cache_key):
+            return super().__call__(**options)
+
+
+class ParallelPreflightFlowCoordinator(PreflightFlowCoordinator):
+    """Evaluate the preflight checks concurrently.
+
+    Most checks wait on a Salesforce query of their own, so the preflight
+    takes as long as its slowest check instead of the sum of all of them.
+
+    PreflightFlowCoordinator.run still walks the checks one by one, building
+    `preflight_results` in its usual order. The first time it asks for a
+    check's result, all of the checks are handed to the pool at once. After
+    that each `evaluate_check` just waits for the result of its own check. A
+    check that raises does so at the same point as it would have run
+    sequentially, and the checks not yet started are dropped.
+    """
+
+    _evaluations = None
+
+    def evaluate_check(self, check, jinja2_context):
+        if self._evaluations is None:
+            self._evaluations = self._evaluate_all_checks()
+        future = self._evaluations[id(check), id(jinja2_context["project_config"])]
+        try:
+            return future.result()
+        except BaseException:
+            for other in self._evaluations.values():
+                other.cancel()
+            raise
+
+    def _evaluate_all_checks(self):
+        checks = [
+            (check, self.project_config) for check in self.flow_config.checks or []
+        ]
+        for step in self.steps:
+            checks += [
+                (check, step.project_config)
+                for check in step.task_config.get("checks", [])
+            ]
+
+        # Replace the caches the run started with ones the threads can share:
+        for project_config in {self.project_config} | {pc for _, pc in checks}:
+            self._task_caches[project_config] = SharedTaskCache(self, project_config)
+
+        executor = ThreadPoolExecutor(
+            max_workers=settings.PREFLIGHT_CHECKS_MAX_WORKERS,
+            thread_name_prefix="metadeploy-check",
+        )
+        evaluate = close_connection_after(super().evaluate_check)
+        evaluations = {}
+        for check, project_config in checks:
+            key = (id(check), id(project_config))
+            if key in evaluations:
+                continue
+            jinja2_context = {
+                "tasks": self._task_caches[project_config],
+                "project_config": project_config,
+                "org_config": self.org_config,
+            }
+            evaluations[key] = executor.submit(evaluate, check, jinja2_context)
+        # The threads exit once they have worked through the checks:
+        executor.shutdown(wait=False)
+        return evaluations
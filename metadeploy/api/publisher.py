@@ -0,0 +1,162 @@
+"""
+Hand-off of push notifications from synchronous code.
+
+Model saves, cleanup jobs and the job runner all need to fire the coroutines in
+``push.py`` from plain sync code. Wrapping each call in ``async_to_sync`` spins up
+a fresh event loop (and a fresh channel layer connection) for every push, right on
+the critical path of a running flow.
+
+Instead, sync code calls :func:`publish`. Processes that have started a
+:class:`BackgroundPublisher` hand the event to a thread with its own event loop
+and a bounded queue, so the caller returns immediately. The RQ work horses do
+(see ``metadeploy.rq_worker``), each for the one job it runs. Everywhere else
+``publish`` behaves exactly like ``async_to_sync(fn)(*args)`` did.
+
+When the transactional outbox is enabled (see ``outbox.py``), ``publish`` stores
+the event instead and the relay process sends it. That takes no serializing, so
+it needs no publisher.
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import queue
+import threading
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import models
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BackgroundPublisher:
+    """Runs push coroutines, in order, on a dedicated thread and event loop."""
+
+    def __init__(self, maxsize=0):
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(
+            target=self._run, name="metadeploy-push-publisher", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                item = self.queue.get()
+                try:
+                    if item is _STOP:
+                        return
+                    fn, args, kwargs = item
+                    loop.run_until_complete(fn(*args, **kwargs))
+                except Exception:
+                    logger.exception("Error sending push notification")
+                finally:
+                    self.queue.task_done()
+        finally:
+            loop.close()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(*args, **kwargs)`` to be awaited on the publisher thread.
+
+        Only blocks when the queue is full, and then for at most
+        PUSH_PUBLISHER_PUT_TIMEOUT seconds before dropping the event.
+        """
+        try:
+            self.queue.put(
+                (fn, args, kwargs), timeout=settings.PUSH_PUBLISHER_PUT_TIMEOUT
+            )
+        except queue.Full:
+            logger.error(f"Push publisher queue is full, dropping {fn.__name__}")
+            return False
+        return True
+
+    def drain(self, timeout=None):
+        """Wait until every queued event has been sent.
+
+        Returns False if the timeout expired first.
+        """
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(
+                lambda: not self.queue.unfinished_tasks, timeout
+            )
+
+    def stop(self, timeout=None):
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+
+    @property
+    def is_alive(self):
+        return self.pid == os.getpid() and self.thread.is_alive()
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """Return the publisher running in this process, if any.
+
+    A publisher inherited through ``fork()`` (as RQ does for every job) has no
+    thread behind it, so it doesn't count.
+    """
+    publisher = _publisher
+    if publisher is not None and publisher.is_alive:
+        return publisher
+    return None
+
+
+def start_publisher():
+    global _publisher
+    with _publisher_lock:
+        publisher = get_publisher()
+        if publisher is None:
+            publisher = _publisher = BackgroundPublisher(
+                maxsize=settings.PUSH_PUBLISHER_QUEUE_SIZE
+            )
+        return publisher
+
+
+def drain_publisher(timeout=None):
+    publisher = get_publisher()
+    if publisher is not None and not publisher.drain(timeout):
+        logger.warning(
+            f"Timed out draining push publisher, "
+            f"{publisher.queue.unfinished_tasks} events not sent"
+        )
+
+
+def _snapshot(value):
+    # The caller carries on mutating (or deleting) the instance while the event
+    # waits in the queue, so the push coroutine gets a copy taken right now.
+    if isinstance(value, models.Model):
+        return copy.copy(value)
+    return value
+
+
+def publish(fn, *args, **kwargs):
+    """Run the push coroutine ``fn`` without making the caller wait for it.
+
+    With PUSH_OUTBOX_ENABLED, the event is written to the outbox instead, and
+    only sent once the surrounding transaction has committed.
+    """
+    if settings.PUSH_OUTBOX_ENABLED:
+        from .outbox import record
+
+        record(fn, *args, **kwargs)
+        return
+    publisher = get_publisher()
+    if publisher is None:
+        async_to_sync(fn)(*args, **kwargs)
+        return
+    publisher.submit(
+        fn,
+        *(_snapshot(arg) for arg in args),
+        **{key: _snapshot(value) for key, value in kwargs.items()},
+    )
@@ -25,30 +25,73 @@ Websocket notifications you can subscribe to:
         JOB_STARTED
 """
 import logging
+from contextvars import ContextVar
 
 from asgiref.sync import sync_to_async
 from channels.layers import get_channel_layer
 from django.utils.translation import gettext_lazy as _
 
-from ..consumer_utils import get_set_message_semaphore
+from ..consumer_utils import append_to_replay_log, get_set_message_semaphore
 from .constants import CHANNELS_GROUP_NAME
 from .hash_url import convert_org_id_to_key
 
 logger = logging.getLogger("metadeploy.api.push")
 
+# Set while collecting messages for the outbox, see collect_messages:
+collected_messages = ContextVar("collected_messages", default=None)
+
 
 async def push_message(group_name, message):
     """Send a message to a group using the default channel layer.
 
     Checks a semaphore to see if the same message was sent very recently; if so, don't send.
+    Messages that are sent are also added to the group's replay log, and carry their
+    sequence id there as "seq".
     """
+    collected = collected_messages.get()
+    if collected is not None:
+        collected.append((group_name, message))
+        return
     channel_layer = get_channel_layer()
     action_type = message.get("content", {}).get("type")
     if await get_set_message_semaphore(channel_layer, message):
         logger.debug(f"Push message: group={group_name} type={action_type}")
+        seq = await append_to_replay_log(channel_layer, group_name, message)
+        if seq is not None:
+            message = {**message, "seq": seq}
         await channel_layer.group_send(group_name, message)
 
 
+async def collect_messages(fn, *args, **kwargs):
+    """Await the push coroutine `fn`, returning the messages it would have sent.
+
+    Nothing is sent to the channel layer.
+    """
+    messages = []
+    token = collected_messages.set(messages)
+    try:
+        await fn(*args, **kwargs)
+    finally:
+        collected_messages.reset(token)
+    return messages
+
+
+async def push_messages(messages):
+    """Send a batch of `(group_name, message)` pairs, in order.
+
+    Stops at the first failure; returns how many messages were sent.
+    """
+    sent = 0
+    for group_name, message in messages:
+        try:
+            await push_message(group_name, message)
+        except Exception:
+            logger.exception(f"Push message failed: group={group_name}")
+            break
+        sent += 1
+    return sent
+
+
 # Events sent via this method are serialized manually,
 # and therefore may not have access to user/session context in the serializer
 async def push_message_about_instance(instance, message, group_name=None):
@@ -80,6 +123,11 @@ async def user_token_expired(user):
     await push_message_about_instance(user, message)
 
 
+async def user_tokens_expired(users):
+    for user in users:
+        await user_token_expired(user)
+
+
 async def preflight_completed(preflight):
     from .serializers import PreflightResultSerializer
 
@@ -120,6 +168,18 @@ async def preflight_invalidated(preflight):
     )
 
 
+async def preflights_expired(preflights, canceled):
+    """Events for preflights of one org that `expire_preflights` invalidated
+    together. `canceled` are the ones among them that had stalled while running.
+    """
+    if canceled and canceled[0].org_id:
+        await notify_org_result_changed(canceled[0])
+    for preflight in canceled:
+        await preflight_canceled(preflight)
+    for preflight in preflights:
+        await preflight_invalidated(preflight)
+
+
 async def report_error(user):
     message = {
         "type": "BACKEND_ERROR",
@@ -169,21 +229,23 @@ async def notify_org_result_changed(result):
 
 @sync_to_async
 def serialize_org(org_id):
-    from .models import Job, PreflightResult
-    from .serializers import OrgSerializer
-
-    current_job = Job.objects.filter(org_id=org_id, status=Job.Status.started).first()
-    current_preflight = PreflightResult.objects.filter(
-        org_id=org_id, status=PreflightResult.Status.started
-    ).first()
-    serializer = OrgSerializer(
-        {
-            "org_id": org_id,
-            "current_job": current_job,
-            "current_preflight": current_preflight,
-        }
-    )
-    return serializer.data
+    from .org_status import refresh_org_status
+
+    return refresh_org_status(org_id)
+
+
+def error_message(error):
+    # unwrap the error in the case that there's only one,
+    # which is the most common case:
+    try:
+        prepared_message = error.content
+        if isinstance(prepared_message, list) and len(prepared_message) == 1:
+            prepared_message = prepared_message[0]
+        if isinstance(prepared_message, dict):
+            prepared_message = prepared_message.get("message", prepared_message)
+        return str(prepared_message)
+    except AttributeError:
+        return str(error)
 
 
 async def notify_org(scratch_org, type_, payload=None, error=None):
@@ -193,18 +255,7 @@ async def notify_org(scratch_org, type_, payload=None, error=None):
             "plan": str(scratch_org.plan.id),
         }
         if error:
-            # unwrap the error in the case that there's only one,
-            # which is the most common case:
-            try:
-                prepared_message = error.content
-                if isinstance(prepared_message, list) and len(prepared_message) == 1:
-                    prepared_message = prepared_message[0]
-                if isinstance(prepared_message, dict):
-                    prepared_message = prepared_message.get("message", prepared_message)
-                prepared_message = str(prepared_message)
-            except AttributeError:
-                prepared_message = str(error)
-            payload["message"] = prepared_message
+            payload["message"] = error_message(error)
 
     message = {
         "type": type_,
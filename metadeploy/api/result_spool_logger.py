@@ -1,13 +1,26 @@
+import threading
 from logging import Handler
 
 from ansi2html import Ansi2HTMLConverter
 
 
 class ResultSpoolLogger(Handler):
-    def __init__(self, *args, result=None, **kwargs):
+    def __init__(self, *args, result=None, lock=None, **kwargs):
         self.result = result
-        self.current_key = None
+        # Steps may run in parallel threads, each logging under its own key:
+        self._local = threading.local()
         super().__init__(*args, **kwargs)
+        if lock is not None:
+            # Shared with everything else that updates the result's results:
+            self.lock = lock
+
+    @property
+    def current_key(self):
+        return getattr(self._local, "current_key", None)
+
+    @current_key.setter
+    def current_key(self, value):
+        self._local.current_key = value
 
     def emit(self, record):
         if self.current_key is None:
@@ -0,0 +1,123 @@
+"""
+Bounded deletion and scrubbing of old data.
+
+`cleanup_user_data` runs every minute, so none of its steps may hold locks on
+the busy tables for long. The steps here work through their rows in batches
+of RETENTION_BATCH_SIZE, each in its own short transaction, pausing
+RETENTION_BATCH_PAUSE seconds in between, and stop once they have used up
+RETENTION_TIME_BUDGET seconds. Wherever they stopped is checkpointed in the
+cache, and the next run carries on from there.
+"""
+
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .constants import REDIS_RETENTION_CHECKPOINT_KEY
+from .models import Job, PreflightResult, User
+
+logger = logging.getLogger(__name__)
+
+
+def run_in_batches(name, queryset, order_field, process):
+    """Call `process(pks)` on batches of the rows in `queryset`, oldest by
+    `order_field` first, until there are none left or time runs out.
+
+    `process` must take the rows out of `queryset`, and may return a dict of
+    counts to add to the metrics. Returns those metrics.
+    """
+    checkpoint_key = REDIS_RETENTION_CHECKPOINT_KEY.format(name=name)
+    position = (cache.get(checkpoint_key) or {}).get("position")
+    if position is not None:
+        queryset = queryset.filter(**{f"{order_field}__gte": position})
+    batches = queryset.select_for_update(skip_locked=True).order_by(order_field, "pk")
+
+    started = time.monotonic()
+    counts = Counter(batches=0, rows=0)
+    complete = False
+    while time.monotonic() - started < settings.RETENTION_TIME_BUDGET:
+        with transaction.atomic():
+            batch = list(
+                batches.values_list("pk", order_field)[: settings.RETENTION_BATCH_SIZE]
+            )
+            if not batch:
+                complete = True
+                break
+            counts.update(process([pk for pk, _ in batch]) or {})
+        counts["batches"] += 1
+        counts["rows"] += len(batch)
+        position = batch[-1][1]
+        time.sleep(settings.RETENTION_BATCH_PAUSE)
+
+    metrics = {
+        **counts,
+        "complete": complete,
+        "duration": round(time.monotonic() - started, 3),
+    }
+    cache.set(
+        checkpoint_key,
+        {**metrics, "position": None if complete else position},
+        timeout=None,
+    )
+    logger.info(
+        f"Retention {name}: {counts['rows']} rows in {counts['batches']} batches",
+        extra={"context": {"event": "retention", "task": name, **metrics}},
+    )
+    return metrics
+
+
+def _delete_users(pks):
+    # Detach the users' jobs and preflights with plain UPDATEs, so the delete
+    # below doesn't collect them in Python:
+    jobs = Job.objects.filter(user_id__in=pks).update(user=None)
+    preflights = PreflightResult.objects.filter(user_id__in=pks).update(user=None)
+    deleted, _ = User.objects.filter(pk__in=pks).delete()
+    return {
+        "jobs_detached": jobs,
+        "preflights_detached": preflights,
+        "objects_deleted": deleted,
+    }
+
+
+def delete_old_users():
+    """Delete old users.
+
+    Deletes users who have not logged in for 30 days, unless they have the is_staff flag.
+    """
+    month_ago = timezone.now() - timedelta(days=30)
+    return run_in_batches(
+        "old_users",
+        User.objects.filter(is_staff=False, last_login__lte=month_ago),
+        "last_login",
+        _delete_users,
+    )
+
+
+def clear_old_exceptions():
+    """Update Job and PreflightRecords over 90 days old to clear the exception field.
+
+    (This field may contain customer metadata such as custom schema names from the org.)
+    """
+    ninety_days_ago = timezone.now() - timedelta(days=90)
+    cleared = 0
+    for name, model in (
+        ("job_exceptions", Job),
+        ("preflight_exceptions", PreflightResult),
+    ):
+        cleared += run_in_batches(
+            name,
+            model.objects.filter(
+                created_at__lte=ninety_days_ago, exception__isnull=False
+            ),
+            "created_at",
+            lambda pks, model=model: {
+                "cleared": model.objects.filter(pk__in=pks).update(exception=None)
+            },
+        )["rows"]
+    return cleared
@@ -0,0 +1,178 @@
+"""
+Fair-share scheduling of Jobs onto the RQ queue.
+
+The enqueuer used to hand every new Job straight to the `default` RQ queue,
+which runs them first come, first served: one product's release could keep
+everyone else's installs waiting. Now Jobs stay pending in the database and
+the enqueuer only tops the RQ queue up to JOB_SCHEDULER_QUEUE_DEPTH Jobs
+(preflights and scratch orgs in the queue don't count). It runs on every
+maintenance tick, and also whenever a Job is created or stops running (see
+`metadeploy.api.jobs.request_enqueuer`), so a free slot doesn't wait for the
+next tick. It picks which Jobs go next:
+
+- Products take turns in proportion to their `queue_weight`, counting the
+  Jobs they already have running or queued.
+- Within a product, the org with the fewest Jobs running goes first, then the
+  oldest Job.
+- No org runs more than JOB_SCHEDULER_MAX_PER_ORG Jobs at once, and no
+  product more than JOB_SCHEDULER_MAX_PER_PRODUCT.
+- A batch of Jobs is handed over as one, with its first pending Job.
+
+Each run also records every waiting Job's position in line, see
+`get_queue_position`.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .constants import REDIS_QUEUE_POSITION_KEY
+from .models import Job
+
+
+def get_pending_jobs():
+    """The Jobs waiting to be handed to RQ.
+
+    Of a batch, only the first pending Job is included: the rest go along
+    with it. Jobs canceled (or otherwise finished) before they got there are
+    left out.
+    """
+    jobs = (
+        Job.objects.filter(enqueued_at=None, status=Job.Status.started)
+        .select_related("plan__version__product")
+        .order_by("batch_position", "created_at")
+    )
+    pending = []
+    batches = set()
+    for job in jobs:
+        if job.batch_id is None:
+            pending.append(job)
+        elif job.batch_id not in batches:
+            batches.add(job.batch_id)
+            pending.append(job)
+    return sorted(pending, key=lambda job: job.created_at)
+
+
+def get_in_flight():
+    """(product id, org id) for each RQ job that hasn't finished.
+
+    The Jobs of a batch run as one.
+    """
+    return [
+        (product_id, org_id)
+        for product_id, org_id, _ in Job.objects.filter(status=Job.Status.started)
+        .exclude(enqueued_at=None)
+        .exclude(job_id=None)
+        .values_list("plan__version__product_id", "org_id", "job_id")
+        .distinct()
+    ]
+
+
+def fair_share_order(pending, in_flight, limit=None):
+    """Return the `pending` Jobs in the order they should be dispatched.
+
+    Jobs held back by the per-org or per-product caps are left out. At most
+    `limit` Jobs are returned.
+    """
+    per_product = Counter(product_id for product_id, _ in in_flight)
+    per_org = Counter(org_id for _, org_id in in_flight)
+    order = []
+
+    def product(job):
+        return job.plan.version.product
+
+    def is_eligible(job):
+        return (
+            per_org[job.org_id] < settings.JOB_SCHEDULER_MAX_PER_ORG
+            and per_product[product(job).id] < settings.JOB_SCHEDULER_MAX_PER_PRODUCT
+        )
+
+    def share(job):
+        # How far over its fair share the product would be with this job:
+        product_ = product(job)
+        return (
+            (per_product[product_.id] + 1) / max(product_.queue_weight, 1),
+            per_org[job.org_id],
+            job.created_at,
+        )
+
+    candidates = list(pending)
+    while candidates and (limit is None or len(order) < limit):
+        eligible = [job for job in candidates if is_eligible(job)]
+        if not eligible:
+            break
+        job = min(eligible, key=share)
+        candidates.remove(job)
+        order.append(job)
+        per_product[product(job).id] += 1
+        per_org[job.org_id] += 1
+    return order
+
+
+def queued_jobs(queue):
+    """How many entries in `queue` are Jobs (a batch being one)."""
+    return (
+        Job.objects.filter(job_id__in=queue.get_job_ids())
+        .values("job_id")
+        .distinct()
+        .count()
+    )
+
+
+def schedule_jobs(queue):
+    """Return the pending Jobs to hand to `queue` now, in order."""
+    slots = settings.JOB_SCHEDULER_QUEUE_DEPTH - queued_jobs(queue)
+    if slots <= 0:
+        return []
+    return fair_share_order(
+        list(get_pending_jobs()), list(get_in_flight()), limit=slots
+    )
+
+
+def update_queue_positions(queue):
+    """Record how many entries are ahead of each Job that hasn't started yet.
+
+    Jobs already in the RQ queue are counted from its head. Pending Jobs come
+    after everything in it, in the order the scheduler would pick them if
+    nothing else arrived.
+    """
+    queued_ids = queue.get_job_ids()
+    positions = {
+        str(job.id): queued_ids.index(str(job.job_id)) + 1
+        for job in Job.objects.filter(job_id__in=queued_ids)
+    }
+    pending = list(get_pending_jobs())
+    order = fair_share_order(pending, list(get_in_flight()))
+    # Jobs held back by the caps go last:
+    scheduled = {job.id for job in order}
+    held_back = [job for job in pending if job.id not in scheduled]
+    for i, job in enumerate(order + held_back):
+        positions[str(job.id)] = len(queued_ids) + i + 1
+    # The rest of a batch waits along with its first pending Job:
+    batches = {job.batch_id: positions[str(job.id)] for job in pending if job.batch_id}
+    for job in Job.objects.filter(enqueued_at=None, batch_id__in=batches):
+        positions.setdefault(str(job.id), batches[job.batch_id])
+    cache.set_many(
+        {
+            REDIS_QUEUE_POSITION_KEY.format(id=id_): position
+            for id_, position in positions.items()
+        },
+        timeout=settings.JOB_SCHEDULER_POSITION_TIMEOUT,
+    )
+
+
+def get_queue_position(job):
+    """The Job's place in line as of the last enqueuer run, or None."""
+    if job.status != Job.Status.started:
+        return None
+    return cache.get(REDIS_QUEUE_POSITION_KEY.format(id=job.id))
+
+
+def clear_queue_position(job):
+    cache.delete(REDIS_QUEUE_POSITION_KEY.format(id=job.id))
+
+
+def queue_length(queue):
+    """Everything waiting to run: the RQ queue plus Jobs not yet handed to it."""
+    return len(queue) + Job.objects.filter(enqueued_at=None).count()
@@ -1,6 +1,8 @@
+import uuid
 from collections import OrderedDict
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
@@ -9,6 +11,7 @@ from rest_framework.relations import PKOnlyObject
 from rest_framework.utils.urls import replace_query_param
 
 from .constants import ERROR, HIDE, WARN
+from .eta import estimate
 from .models import (
     ORG_TYPES,
     SUPPORTED_ORG_TYPES,
@@ -23,6 +26,7 @@ from .models import (
     Version,
 )
 from .paginators import ProductPaginator
+from .scheduler import get_queue_position
 
 User = get_user_model()
 
@@ -384,6 +388,8 @@ class JobSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
     version_label = serializers.SerializerMethodField()
     version_is_most_recent = serializers.SerializerMethodField()
     plan_slug = serializers.SerializerMethodField()
+    queue_position = serializers.SerializerMethodField()
+    eta = serializers.SerializerMethodField()
 
     plan = serializers.PrimaryKeyRelatedField(
         queryset=Plan.objects.all(), pk_field=serializers.CharField()
@@ -415,6 +421,8 @@ class JobSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
             "enqueued_at",
             "job_id",
             "status",
+            "queue_position",
+            "eta",
             "org_name",
             "org_type",
             "is_production_org",
@@ -428,6 +436,8 @@ class JobSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
             "user_can_edit",
             "message",
             "error_message",
+            "batch_id",
+            "batch_position",
         )
         extra_kwargs = {
             "created_at": {"read_only": True},
@@ -436,6 +446,8 @@ class JobSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
             "job_id": {"read_only": True},
             "status": {"read_only": True},
             "org_type": {"read_only": True},
+            "batch_id": {"read_only": True},
+            "batch_position": {"read_only": True},
         }
 
     def requesting_user_has_rights(self, include_staff=True):
@@ -465,6 +477,12 @@ class JobSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
     def get_user_can_edit(self, obj):
         return self.requesting_user_has_rights(include_staff=False)
 
+    def get_queue_position(self, obj):
+        return get_queue_position(obj)
+
+    def get_eta(self, obj):
+        return estimate(obj)
+
     def get_creator(self, obj):
         if obj.user and self.requesting_user_has_rights():
             return LimitedUserSerializer(instance=obj.user).data
@@ -608,17 +626,53 @@ class JobSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
         return data
 
 
+class JobBatchSerializer(serializers.Serializer):
+    """Several plans of one version to install on one org, one after the other.
+
+    Each plan gets a Job of its own, validated as if it had been created by
+    itself.
+    """
+
+    jobs = JobSerializer(many=True)
+
+    def validate_jobs(self, value):
+        if len(value) < 2:
+            raise serializers.ValidationError(_("A batch needs at least two plans."))
+        plans = [job["plan"] for job in value]
+        if len(set(plans)) < len(plans):
+            raise serializers.ValidationError(_("A batch can't repeat a plan."))
+        if len({plan.version_id for plan in plans}) > 1:
+            raise serializers.ValidationError(
+                _("All plans in a batch must be from the same version.")
+            )
+        return value
+
+    def create(self, validated_data):
+        batch_id = uuid.uuid4()
+        with transaction.atomic():
+            return [
+                JobSerializer(context=self.context).create(
+                    {**data, "batch_id": batch_id, "batch_position": position}
+                )
+                for position, data in enumerate(validated_data["jobs"])
+            ]
+
+
 class PreflightResultSerializer(ErrorWarningCountMixin, serializers.ModelSerializer):
     id = serializers.CharField(read_only=True)
     plan = IdOnlyField(read_only=True)
     user = IdOnlyField(read_only=True)
+    is_valid = serializers.SerializerMethodField()
     is_ready = serializers.SerializerMethodField()
     error_count = serializers.SerializerMethodField()
     warning_count = serializers.SerializerMethodField()
 
+    def get_is_valid(self, obj):
+        return obj.is_valid and not obj.is_expired
+
     def get_is_ready(self, obj):
         return (
-            obj.is_valid
+            self.get_is_valid(obj)
             and obj.status == PreflightResult.Status.complete
             and self._count_status_in_results(obj.results, ERROR) == 0
         )
@@ -645,7 +699,6 @@ class PreflightResultSerializer(ErrorWarningCountMixin, serializers.ModelSeriali
             "org_id": {"read_only": True},
             "created_at": {"read_only": True},
             "edited_at": {"read_only": True},
-            "is_valid": {"read_only": True},
             "status": {"read_only": True},
             "results": {"read_only": True},
         }
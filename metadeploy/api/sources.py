@@ -0,0 +1,105 @@
+"""
+A cache of the other repositories that steps include with a `source`.
+
+CumulusCI fetches a GitHub source by downloading the archive of its commit
+into the project's own cache, which lives in the Job's checkout and goes with
+it. So every run of a plan downloaded every source again.
+
+`CachedGitHubSource` keeps each source's files in SOURCE_ARCHIVE_CACHE_DIR
+instead, under the owner, name and resolved commit SHA of the repository, so
+they're downloaded once per worker and commit. Each run still gets a copy of
+its own, where CumulusCI expects it in the project's cache, since tasks write
+to the project (its `.cci` directory, for one). The project config on top of
+the copy is built for each run too, since it carries the run's plan, keychain
+and included sources.
+
+Archives that haven't been used for SOURCE_ARCHIVE_CACHE_MAX_AGE seconds are
+removed whenever a new one is downloaded.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from cumulusci.core.source import GitHubSource
+from cumulusci.utils import download_extract_github
+from django.conf import settings
+
+
+def archive_path(repo_owner, repo_name, commit):
+    return os.path.join(
+        settings.SOURCE_ARCHIVE_CACHE_DIR, repo_owner, repo_name, commit
+    )
+
+
+def extract_archive(gh, repo_owner, repo_name, commit):
+    """Download the archive of `commit`, unless it's there already.
+
+    Returns the directory it's extracted in.
+    """
+    path = archive_path(repo_owner, repo_name, commit)
+    if os.path.isdir(path):
+        # Mark it used, so it isn't pruned:
+        os.utime(path)
+        return path
+    prune_archives()
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    # Extract next to it and move it in place, so no one sees half of it:
+    partial = tempfile.mkdtemp(dir=parent, prefix=f".{commit}-")
+    try:
+        zip_file = download_extract_github(gh, repo_owner, repo_name, ref=commit)
+        zip_file.extractall(partial)
+        os.rename(partial, path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+        # Someone else got there first.
+    finally:
+        shutil.rmtree(partial, ignore_errors=True)
+    return path
+
+
+def prune_archives(max_age=None):
+    """Remove the archives that haven't been used for `max_age` seconds."""
+    if max_age is None:
+        max_age = settings.SOURCE_ARCHIVE_CACHE_MAX_AGE
+    cutoff = time.time() - max_age
+    root = settings.SOURCE_ARCHIVE_CACHE_DIR
+    if not os.path.isdir(root):
+        return
+    for repo_owner in os.listdir(root):
+        for repo_name in os.listdir(os.path.join(root, repo_owner)):
+            parent = os.path.join(root, repo_owner, repo_name)
+            for commit in os.listdir(parent):
+                path = os.path.join(parent, commit)
+                if commit.startswith(".") or os.path.getmtime(path) >= cutoff:
+                    continue
+                # Move it out of the way first, so no one sees half of it:
+                expired = tempfile.mkdtemp(dir=parent, prefix=f".{commit}-")
+                try:
+                    os.rename(path, os.path.join(expired, commit))
+                except OSError:
+                    pass  # Someone else got there first.
+                shutil.rmtree(expired, ignore_errors=True)
+
+
+class CachedGitHubSource(GitHubSource):
+    def fetch(self):
+        """Construct the project config of the commit, on a copy of the cached
+        archive in the project's cache."""
+        archive = extract_archive(self.gh, self.repo_owner, self.repo_name, self.commit)
+        path = self.project_config.cache_dir / "projects" / self.repo_name / self.commit
+        if not path.is_dir():
+            shutil.copytree(archive, path)
+        return self.project_config.construct_subproject_config(
+            repo_info={
+                "root": os.path.realpath(path),
+                "owner": self.repo_owner,
+                "name": self.repo_name,
+                "url": self.url,
+                "commit": self.commit,
+                "branch": self.branch,
+            }
+        )
@@ -0,0 +1,132 @@
+import time
+
+import pytest
+from cumulusci.salesforce_api.metadata import BaseMetadataApiCall
+from cumulusci.utils.waiting import poll
+from django.core.cache import cache
+
+from ..cancellation import CancelWatcher, request_cancel
+from ..constants import REDIS_JOB_CANCEL_KEY
+from ..flows import JobFlowCallback, StopFlowException
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_request_cancel__between_tasks():
+    with CancelWatcher("abc123") as watcher:
+        callbacks = JobFlowCallback(None, cancel_watcher=watcher)
+        time.sleep(0.1)  # let the watcher subscribe
+        request_cancel("abc123")
+
+        assert wait_for(watcher.is_canceled)
+        assert callbacks._flow_canceled()
+
+    # Cleared once the Job is over:
+    assert cache.get(REDIS_JOB_CANCEL_KEY.format(id="abc123")) is None
+
+
+def test_request_cancel__interrupts_task():
+    calls = []
+
+    def deploy_done():
+        calls.append(time.monotonic())
+        return len(calls) > 5
+
+    with CancelWatcher("abc123") as watcher:
+        watcher.poll_interval = 0.1
+        watcher.task_started()
+        time.sleep(0.1)
+        request_cancel("abc123")
+
+        with pytest.raises(StopFlowException):
+            # A long running task, waiting for Salesforce:
+            poll(deploy_done)
+
+        assert len(calls) <= 2
+        assert not watcher.interruptible
+
+
+class PendingDeploy(BaseMetadataApiCall):
+    """A deploy that stays pending on Salesforce, as ApiDeploy sees it."""
+
+    soap_envelope_start = "start"
+    soap_envelope_status = "status"
+    check_interval = 0.05
+
+    def __init__(self):
+        self.status = None
+        self.check_num = 1
+        self.checks = 0
+
+    def _build_envelope_start(self):
+        return self.soap_envelope_start
+
+    def _build_envelope_status(self):
+        return self.soap_envelope_status
+
+    def _call_mdapi(self, headers, envelope, refresh=None):
+        return envelope
+
+    def _process_response_start(self, response):
+        self.status = "Pending"
+        return response
+
+    def _process_response_status(self, response):
+        self.checks += 1
+        return response
+
+
+def test_request_cancel__interrupts_deploy():
+    deploy = PendingDeploy()
+
+    with CancelWatcher("abc123") as watcher:
+        watcher.poll_interval = 0.1
+        watcher.task_started()
+        time.sleep(0.1)
+        request_cancel("abc123")
+
+        with pytest.raises(StopFlowException):
+            deploy._get_response()
+
+        assert deploy.status == "Pending"
+        assert deploy.checks < 20
+
+
+def test_request_cancel__waits_for_safe_point():
+    with CancelWatcher("abc123") as watcher:
+        watcher.poll_interval = 0.1
+        watcher.task_started()
+        time.sleep(0.1)
+        request_cancel("abc123")
+
+        # Not interrupted outside of CumulusCI's wait loops:
+        for _ in range(10):
+            time.sleep(0.05)
+
+        assert watcher.is_canceled()
+        assert watcher.interruptible
+
+
+def test_cancel_watcher__counts_tasks():
+    watcher = CancelWatcher("abc123")
+    # Steps of a parallel plan:
+    watcher.task_started()
+    watcher.task_started()
+    watcher.task_finished()
+
+    assert watcher.interruptible
+    watcher.task_finished()
+    assert not watcher.interruptible
+
+
+def test_request_cancel__sets_ttl(settings):
+    settings.JOB_CANCEL_TIMEOUT = 60
+    request_cancel("def456")
+
+    assert 0 < cache.ttl(REDIS_JOB_CANCEL_KEY.format(id="def456")) <= 60
+    cache.delete(REDIS_JOB_CANCEL_KEY.format(id="def456"))
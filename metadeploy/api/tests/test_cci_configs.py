@@ -27,3 +27,25 @@ def test_project_config():
         )
 
     assert subproject_config.plan is project_config.plan is plan
+
+
+def test_include_source(mocker):
+    CachedGitHubSource = mocker.patch("metadeploy.api.cci_configs.CachedGitHubSource")
+    universal_config = UniversalConfig()
+    plan = mock.Mock()
+    plan.version.product.repo_url = "https://github.com/SFDO-Tooling/CumulusCI-Test"
+    spec = {"github": "https://github.com/SFDO-Tooling/CumulusCI-Test-Dep"}
+
+    with temporary_dir() as path:
+        touch("cumulusci.yml")
+        project_config = MetadeployProjectConfig(
+            universal_config, repo_root=path, plan=plan
+        )
+        included = project_config.include_source(spec)
+        assert project_config.include_source(spec) is included
+
+    CachedGitHubSource.assert_called_once()
+    assert included is CachedGitHubSource.return_value.fetch.return_value
+    [parsed_spec] = project_config.included_sources
+    assert CachedGitHubSource.call_args[0] == (project_config, parsed_spec)
+    assert included.source is CachedGitHubSource.return_value
@@ -43,6 +43,31 @@ def test_expire_oauth_tokens_with_started_job(job_factory):
     assert job.user.social_account.extra_data != {}
 
 
+@pytest.mark.django_db
+def test_expire_oauth_tokens__batched(mocker, user_factory, preflight_result_factory):
+    publish = mocker.patch("metadeploy.api.cleanup.publish")
+    half_hour_ago = timezone.now() - timedelta(minutes=30)
+    users = [user_factory() for _ in range(3)]
+    staff_user = user_factory(is_staff=True)
+    busy_user = user_factory()
+    preflight_result_factory(user=busy_user, org_id=busy_user.org_id)
+    for user in users + [staff_user, busy_user]:
+        user.socialaccount_set.update(last_login=half_hour_ago)
+
+    expire_oauth_tokens()
+
+    publish.assert_called_once()
+    assert {user.id for user in publish.call_args[0][1]} == {
+        user.id for user in users + [staff_user]
+    }
+    for user in users:
+        assert user.valid_token_for is None
+        assert user.social_account.extra_data == {}
+    assert staff_user.valid_token_for is None
+    assert staff_user.social_account.extra_data != {}
+    assert busy_user.valid_token_for is not None
+
+
 @pytest.mark.django_db
 def test_delete_old_users(user_factory):
     two_months_ago = timezone.now() - timedelta(days=60)
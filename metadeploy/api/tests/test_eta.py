@@ -0,0 +1,138 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from ..eta import estimate, percentile, record_step_duration, step_durations
+from ..models import Job
+
+
+@pytest.fixture
+def no_cache(mocker):
+    cache = mocker.patch("metadeploy.api.eta.cache")
+    cache.get_many.return_value = {}
+    cache.get.return_value = None
+    return cache
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([10], 90) == 10
+    assert percentile([10, 20, 30, 40], 50) == 25
+
+
+@pytest.mark.django_db
+class TestStepDurations:
+    def test_window(self, settings, no_cache, step_factory, job_factory):
+        settings.ETA_WINDOW = 3
+        step = step_factory()
+        job = job_factory(plan=step.plan)
+        for seconds in (100, 1, 2, 3):
+            record_step_duration(job, step.id, seconds)
+
+        stats = step_durations([str(step.id)])
+
+        # The oldest sample has dropped out of the window:
+        assert stats == {str(step.id): {50: 2, 90: 2.8}}
+        no_cache.set_many.assert_called_once()
+
+    def test_cached(self, no_cache, step_factory):
+        step = step_factory()
+        no_cache.get_many.return_value = {
+            f"metadeploy:eta:step:{step.id}": {50: 5, 90: 9}
+        }
+
+        assert step_durations([str(step.id)]) == {str(step.id): {50: 5, 90: 9}}
+        no_cache.set_many.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestEstimate:
+    def test_remaining_steps(self, no_cache, plan_factory, step_factory, job_factory):
+        plan = plan_factory()
+        steps = [step_factory(plan=plan, step_num=str(i)) for i in range(3)]
+        job = job_factory(
+            plan=plan,
+            steps=steps,
+            started_at=timezone.now(),
+            results={str(steps[0].id): [{"status": "ok"}]},
+        )
+        for step, seconds in zip(steps, (10, 20, 30)):
+            record_step_duration(job, step.id, seconds)
+
+        assert estimate(job) == 50
+
+    def test_queued(self, no_cache, plan_factory, step_factory, job_factory):
+        plan = plan_factory()
+        step = step_factory(plan=plan)
+        now = timezone.now()
+        earlier = job_factory(plan=plan, steps=[step], status=Job.Status.complete)
+        Job.objects.filter(pk=earlier.pk).update(
+            created_at=now - timedelta(minutes=10),
+            started_at=now - timedelta(minutes=8),
+        )
+        record_step_duration(earlier, step.id, 60)
+        job = job_factory(plan=plan, steps=[step])
+
+        assert estimate(job) == pytest.approx(180, abs=2)
+
+    def test_falls_back_to_plan(
+        self, no_cache, plan_factory, step_factory, job_factory
+    ):
+        plan = plan_factory()
+        step = step_factory(plan=plan)
+        now = timezone.now()
+        job_factory(
+            plan=plan,
+            status=Job.Status.complete,
+            started_at=now - timedelta(minutes=10),
+            success_at=now - timedelta(minutes=5),
+        )
+        job = job_factory(
+            plan=plan, steps=[step], started_at=now - timedelta(minutes=1)
+        )
+
+        assert estimate(job) == pytest.approx(240, abs=2)
+
+    def test_no_history(self, no_cache, plan_factory, step_factory, job_factory):
+        plan = plan_factory()
+        step = step_factory(plan=plan)
+        job = job_factory(plan=plan, steps=[step])
+
+        assert estimate(job) is None
+
+    def test_finished(self, no_cache, job_factory):
+        job = job_factory(status=Job.Status.complete)
+
+        assert estimate(job) is None
+
+    def test_cached(self, mocker, no_cache, job_factory):
+        job = job_factory(started_at=timezone.now())
+        no_cache.get.return_value = {
+            "progress": (True, 0),
+            "finish": timezone.now() + timedelta(seconds=100),
+        }
+        expected_finish = mocker.patch("metadeploy.api.eta.expected_finish")
+
+        assert estimate(job) == pytest.approx(100, abs=2)
+        assert not expected_finish.called
+
+        # Another step has finished since:
+        job.results = {"step": [{"status": "ok"}]}
+        expected_finish.return_value = None
+
+        assert estimate(job) is None
+        assert expected_finish.called
+
+
+@pytest.mark.django_db
+def test_job_timings_command(no_cache, job_factory):
+    now = timezone.now()
+    job_factory(
+        status=Job.Status.complete,
+        started_at=now - timedelta(hours=1),
+        success_at=now - timedelta(minutes=30),
+    )
+
+    call_command("job_timings", hours=1)
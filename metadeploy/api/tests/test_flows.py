@@ -98,6 +98,19 @@ class TestJobFlow:
         # Scratch orgs SHOULD call the Salesforce API to reset the user password
         scratch_org_coordinator.org_config.salesforce_client.restful.assert_called()
 
+    def test_post_task__records_duration(self, plan_factory, step_factory, job_factory):
+        plan = plan_factory()
+        step = step_factory(plan=plan, step_num="1")
+        job = job_factory(plan=plan, steps=[step], org_id="00Dxxxxxxxxxxxxxxx")
+        callbacks = JobFlowCallback(job)
+        stepspec = MagicMock(step_num=step.step_num)
+
+        callbacks.pre_flow(MagicMock())
+        callbacks.pre_task(stepspec)
+        callbacks.post_task(stepspec, MagicMock(exception=None))
+
+        assert job.step_durations.get().step == step
+
     def test_post_task__exception(
         self, mocker, user_factory, plan_factory, step_factory, job_factory
     ):
@@ -3,7 +3,7 @@ from unittest.mock import patch
 
 import pytest
 
-from ..github import local_github_checkout
+from ..github import local_github_checkout, resolve_commit
 
 
 @pytest.mark.django_db
@@ -23,3 +23,20 @@ def test_local_github_checkout(product_factory):
 
         with local_github_checkout("SalesforceFoundation", "gem") as repo_root:
             assert isinstance(repo_root, str)
+
+
+@pytest.mark.django_db
+def test_resolve_commit(mocker, product_factory):
+    product_factory(repo_url="https://github.com/SalesforceFoundation/gem")
+    get_github_api_for_repo = mocker.patch(
+        "metadeploy.api.github.get_github_api_for_repo"
+    )
+    repository = get_github_api_for_repo.return_value.repository.return_value
+    repository.default_branch = "main"
+    repository.commit.return_value.sha = "abc123"
+
+    assert resolve_commit("SalesforceFoundation", "gem", "v1.0") == "abc123"
+    repository.commit.assert_called_with("v1.0")
+
+    resolve_commit("SalesforceFoundation", "gem")
+    repository.commit.assert_called_with("main")
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, PropertyMock
+
+import pytest
+
+from ..inventory import package_target, skip_installed_packages
+from ..models import Step
+
+INSTALL = "cumulusci.tasks.salesforce.InstallPackageVersion"
+
+
+def spec(step):
+    return SimpleNamespace(
+        step_num=step.step_num,
+        skip=False,
+        project_config=SimpleNamespace(project__package__namespace="default"),
+    )
+
+
+def package_step(step_factory, plan, step_num, **options):
+    return step_factory(
+        plan=plan,
+        step_num=step_num,
+        kind=Step.Kind.managed,
+        task_class=INSTALL,
+        task_config={"options": options},
+    )
+
+
+@pytest.mark.django_db
+class TestPackageTarget:
+    def test_fixed_version(self, step_factory):
+        step = step_factory(
+            kind=Step.Kind.managed,
+            task_class=INSTALL,
+            task_config={"options": {"version": 1.2}},
+        )
+
+        assert package_target(step, spec(step).project_config) == ("default", "1.2")
+
+    @pytest.mark.parametrize("version", ["latest", "1.2 (Beta 3)", "04t000000000001"])
+    def test_unresolved_version(self, step_factory, version):
+        step = step_factory(
+            kind=Step.Kind.managed,
+            task_class=INSTALL,
+            task_config={"options": {"namespace": "foo", "version": version}},
+        )
+
+        assert package_target(step, spec(step).project_config) is None
+
+    def test_other_kind(self, step_factory):
+        step = step_factory(
+            kind=Step.Kind.metadata,
+            task_config={"options": {"namespace": "foo", "version": "1.2"}},
+        )
+
+        assert package_target(step, spec(step).project_config) is None
+
+
+@pytest.mark.django_db
+class TestSkipInstalledPackages:
+    def test_skips_satisfied(self, plan_factory, step_factory):
+        plan = plan_factory()
+        installed = package_step(
+            step_factory, plan, "1", namespace="foo", version="1.2"
+        )
+        missing = package_step(step_factory, plan, "2", namespace="bar", version="2.0")
+        # Installed, but comes after a step that will run:
+        after = package_step(step_factory, plan, "3", namespace="baz", version="1.0")
+        steps = [spec(step) for step in (installed, missing, after)]
+        org = MagicMock()
+        org.has_minimum_package_version.side_effect = lambda ns, v: ns != "bar"
+
+        skipped = skip_installed_packages(plan, steps, org)
+
+        assert skipped == {str(installed.id): "foo 1.2 or newer is already installed."}
+        assert [s.skip for s in steps] == [True, False, False]
+
+    def test_inventory_fails(self, plan_factory, step_factory):
+        plan = plan_factory()
+        step = package_step(step_factory, plan, "1", namespace="foo", version="1.2")
+        steps = [spec(step)]
+        org = MagicMock()
+        type(org).installed_packages = PropertyMock(side_effect=Exception)
+
+        assert skip_installed_packages(plan, steps, org) == {}
+        assert not steps[0].skip
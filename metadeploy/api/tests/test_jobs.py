@@ -1,4 +1,5 @@
 import json
+import uuid
 from contextlib import ExitStack
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
@@ -8,13 +9,14 @@ import pytz
 import vcr
 from cumulusci.salesforce_api.exceptions import MetadataParseError
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.timezone import make_aware
 from rq.worker import StopRequested
 
 from config.settings.base import MINIMUM_JOBS_FOR_AVERAGE
 from metadeploy.api.belvedere_utils import convert_to_18
-from metadeploy.api.constants import ERROR
+from metadeploy.api.constants import ERROR, REDIS_PREFLIGHT_LOCK_KEY
 
 from ..flows import StopFlowException
 from ..jobs import (
@@ -28,11 +30,22 @@ from ..jobs import (
     JobLogStatus,
     JobType,
     preflight,
+    request_enqueuer,
+    run_batch,
     run_flows,
 )
 from ..models import Job, PreflightResult
 
 
+@pytest.fixture(autouse=True)
+def resolve_commit(mocker):
+    # Keep the refs as they are, so the cassettes' downloads still match:
+    return mocker.patch(
+        "metadeploy.api.jobs.resolve_commit",
+        side_effect=lambda repo_owner, repo_name, commit_ish: commit_ish,
+    )
+
+
 @pytest.mark.django_db
 def test_report_error(mocker, job_factory, user_factory, plan_factory, step_factory):
     mocker.patch("metadeploy.api.jobs.local_github_checkout", side_effect=Exception)
@@ -100,6 +113,80 @@ def test_run_flows__preflight(
     assert run_flow.called
 
 
+@pytest.mark.django_db
+def test_run_flows__resume(
+    mocker, job_factory, user_factory, plan_factory, step_factory
+):
+    mocker.patch("cumulusci.core.flowrunner.FlowCoordinator.run")
+    to_spec = mocker.patch("metadeploy.api.models.Step.to_spec")
+
+    user = user_factory()
+    plan = plan_factory()
+    done = step_factory(plan=plan, step_num="1")
+    interrupted = step_factory(plan=plan, step_num="2")
+    job = job_factory(
+        user=user,
+        plan=plan,
+        org_id=user.org_id,
+        commit_ish=plan.commit_ish or plan.version.commit_ish,
+        resume_count=1,
+        results={
+            str(done.id): [{"status": "ok"}],
+            str(interrupted.id): [{"status": "error"}],
+        },
+    )
+
+    run_flows(
+        plan=plan,
+        skip_steps=[],
+        result_class=Job,
+        result_id=job.id,
+        resume=True,
+    )
+
+    skipped = [call.kwargs["skip"] for call in to_spec.call_args_list]
+    assert skipped == [True, False]
+
+
+@pytest.mark.django_db
+def test_run_flows__resume_ref_moved(
+    mocker, resolve_commit, job_factory, user_factory, plan_factory, step_factory
+):
+    mocker.patch("metadeploy.api.jobs.local_github_checkout")
+    mocker.patch("metadeploy.api.jobs.MetaDeployCCI")
+    mocker.patch("metadeploy.api.models.Job.run")
+    to_spec = mocker.patch("metadeploy.api.models.Step.to_spec")
+    resolve_commit.side_effect = None
+    resolve_commit.return_value = "def456"
+
+    user = user_factory()
+    plan = plan_factory()
+    done = step_factory(plan=plan, step_num="1")
+    step_factory(plan=plan, step_num="2")
+    job = job_factory(
+        user=user,
+        plan=plan,
+        org_id=user.org_id,
+        # The same ref, at another commit:
+        commit_ish="abc123",
+        resume_count=1,
+        results={str(done.id): [{"status": "ok"}]},
+    )
+
+    run_flows(
+        plan=plan,
+        skip_steps=[],
+        result_class=Job,
+        result_id=job.id,
+        resume=True,
+    )
+
+    skipped = [call.kwargs["skip"] for call in to_spec.call_args_list]
+    assert skipped == [False, False]
+    job.refresh_from_db()
+    assert job.commit_ish == "def456"
+
+
 @pytest.mark.django_db
 def test_enqueuer(mocker, job_factory):
     delay = mocker.patch("metadeploy.api.jobs.run_flows_job.delay")
@@ -116,6 +203,94 @@ def test_enqueuer(mocker, job_factory):
     assert job.job_id is not None
 
 
+@pytest.mark.django_db
+def test_enqueuer__locked(mocker):
+    lock = mocker.patch("metadeploy.api.jobs.cache.lock").return_value
+    lock.acquire.return_value = False
+    enqueue = mocker.patch("metadeploy.api.jobs.enqueue_scheduled_jobs")
+
+    assert enqueuer() == 0
+    assert not enqueue.called
+
+
+def test_request_enqueuer(mocker):
+    cache = mocker.patch("metadeploy.api.jobs.cache")
+    cache.add.side_effect = [True, False]
+    delay = mocker.patch("metadeploy.api.jobs.requested_enqueuer_job.delay")
+
+    request_enqueuer()
+    request_enqueuer()
+
+    # The second request shares the first one's run:
+    assert delay.call_count == 1
+
+
+@pytest.mark.django_db
+def test_enqueuer__batch(mocker, job_factory, plan_factory):
+    queue = mocker.patch("metadeploy.api.jobs.django_rq.get_queue").return_value
+    queue.__len__.return_value = 0
+    queue.get_job_ids.return_value = []
+    queue.enqueue_call.return_value.id = "294fc6d2-0f3c-4877-b849-54184724b6b2"
+    queue.enqueue_call.return_value.enqueued_at = timezone.now()
+    batch_id = uuid.uuid4()
+    plan = plan_factory()
+    jobs = [
+        job_factory(
+            plan=plan_factory(version=plan.version),
+            org_id="00Dxxxxxxxxxxxxxxx",
+            batch_id=batch_id,
+            batch_position=position,
+        )
+        for position in range(2)
+    ]
+    enqueuer()
+
+    assert queue.enqueue_call.call_count == 1
+    kwargs = queue.enqueue_call.call_args[1]
+    assert kwargs["kwargs"] == {"job_ids": [str(job.id) for job in jobs]}
+    assert kwargs["timeout"] == 2 * settings.METADEPLOY_JOB_TIMEOUT
+    for job in jobs:
+        job.refresh_from_db()
+        assert str(job.job_id) == "294fc6d2-0f3c-4877-b849-54184724b6b2"
+
+
+@pytest.mark.django_db
+def test_run_batch(mocker, job_factory, user_factory, plan_factory):
+    checkout = mocker.patch("metadeploy.api.jobs.local_github_checkout")
+    checkout.return_value.__enter__.return_value = "/tmp/checkout"
+    mocker.patch("metadeploy.api.jobs.MetaDeployCCI")
+    mocker.patch(
+        "metadeploy.api.models.Job.run",
+        side_effect=[None, StopFlowException("Job canceled.")],
+    )
+
+    user = user_factory()
+    version = plan_factory().version
+    batch_id = uuid.uuid4()
+    jobs = [
+        job_factory(
+            user=user,
+            plan=plan_factory(version=version),
+            org_id=user.org_id,
+            batch_id=batch_id,
+            batch_position=position,
+        )
+        for position in range(3)
+    ]
+    run_batch([str(job.id) for job in jobs])
+
+    # Checked out once, for all of them:
+    assert checkout.call_count == 1
+    for job in jobs:
+        job.refresh_from_db()
+    assert [job.status for job in jobs] == [
+        Job.Status.complete,
+        Job.Status.canceled,
+        Job.Status.canceled,
+    ]
+    assert jobs[2].exception == "An earlier plan in this batch did not complete."
+
+
 @pytest.mark.django_db
 def test_preflight(mocker, user_factory, plan_factory, preflight_result_factory):
     run_flows = mocker.patch("metadeploy.api.jobs.run_flows")
@@ -130,6 +305,73 @@ def test_preflight(mocker, user_factory, plan_factory, preflight_result_factory)
     assert run_flows.called
 
 
+@pytest.mark.django_db
+def test_preflight__shares_results(
+    mocker, user_factory, plan_factory, preflight_result_factory
+):
+    run_flows = mocker.patch("metadeploy.api.jobs.run_flows")
+
+    user = user_factory()
+    plan = plan_factory()
+    preflight_result = preflight_result_factory(
+        user=user, plan=plan, org_id=user.org_id
+    )
+    # Another preflight for the same org finished while this one was queued:
+    twin = preflight_result_factory(
+        user=user,
+        plan=plan,
+        org_id=user.org_id,
+        status=PreflightResult.Status.complete,
+        success_at=timezone.now(),
+        results={"plan": [{"status": ERROR, "message": "Nope"}]},
+        log="Checked",
+    )
+    preflight(preflight_result.pk)
+
+    assert not run_flows.called
+    preflight_result.refresh_from_db()
+    assert preflight_result.status == PreflightResult.Status.complete
+    assert preflight_result.results == twin.results
+    assert preflight_result.log == "Checked"
+
+
+@pytest.mark.django_db
+def test_preflight__locked(
+    mocker, user_factory, plan_factory, preflight_result_factory
+):
+    run_flows = mocker.patch("metadeploy.api.jobs.run_flows")
+    get_scheduler = mocker.patch("metadeploy.api.jobs.django_rq.get_scheduler")
+
+    user = user_factory()
+    plan = plan_factory()
+    preflight_result = preflight_result_factory(
+        user=user, plan=plan, org_id=user.org_id
+    )
+    lock = cache.lock(
+        REDIS_PREFLIGHT_LOCK_KEY.format(org_id=user.org_id, plan_id=plan.id),
+        timeout=10,
+    )
+    assert lock.acquire(blocking=False)
+    try:
+        preflight(preflight_result.pk)
+
+        # Another preflight is running, so this one looks again later:
+        assert not run_flows.called
+        enqueue_in = get_scheduler.return_value.enqueue_in
+        assert enqueue_in.call_args[0][1:] == (preflight, preflight_result.pk)
+
+        # Until it has waited long enough:
+        PreflightResult.objects.filter(pk=preflight_result.pk).update(
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+        preflight(preflight_result.pk)
+
+        assert run_flows.called
+        assert enqueue_in.call_count == 1
+    finally:
+        lock.release()
+
+
 @pytest.mark.django_db
 def test_preflight_failure(
     mocker, user_factory, plan_factory, preflight_result_factory
@@ -187,6 +429,44 @@ def test_expire_preflights(user_factory, plan_factory, preflight_result_factory)
     assert preflight4.is_valid
 
 
+@pytest.mark.django_db
+def test_expire_preflights__grouped_pushes(
+    mocker, plan_factory, preflight_result_factory
+):
+    publish = mocker.patch("metadeploy.api.jobs.publish")
+    long_ago = timezone.now() - timedelta(
+        minutes=settings.PREFLIGHT_LIFETIME_MINUTES + 1
+    )
+    plan = plan_factory()
+    stalled = preflight_result_factory(
+        plan=plan, org_id="00Dxxxxxxxxxxxxxx1", status=PreflightResult.Status.started
+    )
+    done = preflight_result_factory(
+        plan=plan, org_id="00Dxxxxxxxxxxxxxx1", status=PreflightResult.Status.complete
+    )
+    other_org = preflight_result_factory(
+        plan=plan, org_id="00Dxxxxxxxxxxxxxx2", status=PreflightResult.Status.complete
+    )
+    PreflightResult.objects.update(created_at=long_ago)
+
+    assert expire_preflights() == 3
+
+    assert publish.call_count == 2
+    pushes = {
+        call.args[1][0].org_id: (
+            {p.id for p in call.args[1]},
+            {p.id for p in call.args[2]},
+        )
+        for call in publish.call_args_list
+    }
+    assert pushes == {
+        "00Dxxxxxxxxxxxxxx1": ({stalled.id, done.id}, {stalled.id}),
+        "00Dxxxxxxxxxxxxxx2": ({other_org.id}, set()),
+    }
+    # Already expired preflights are left alone:
+    assert expire_preflights() == 0
+
+
 @pytest.mark.django_db
 def test_delete_org_on_error(scratch_org_factory):
     scratch_org = scratch_org_factory(org_id="00Dxxxxxxxxxxxxxxx")
@@ -199,7 +479,7 @@ def test_delete_org_on_error(scratch_org_factory):
 
 
 @pytest.mark.django_db
-def test_finalize_result_worker_died(job_factory, caplog):
+def test_finalize_result_worker_died(settings, job_factory, caplog):
     """
     Why do we raise and then catch a StopRequested you might ask? Well, because it's
     what RQ will internally raise on a SIGTERM, so we're essentially faking the "I got a
@@ -207,6 +487,7 @@ def test_finalize_result_worker_died(job_factory, caplog):
     and kill the tests. But we do want the context manager's except block to be
     triggered, so we can test its behavior.
     """
+    settings.JOB_MAX_RESUMES = 0
     job = job_factory(
         org_id="00Dxxxxxxxxxxxxxxx",
         plan__version__product__title="Test Product",
@@ -228,6 +509,27 @@ def test_finalize_result_worker_died(job_factory, caplog):
     assert "duration" in log_record.context
 
 
+@pytest.mark.django_db
+def test_finalize_result_worker_died__resumes(settings, job_factory, caplog):
+    settings.JOB_MAX_RESUMES = 1
+    job = job_factory(
+        org_id="00Dxxxxxxxxxxxxxxx",
+        enqueued_at=timezone.now(),
+        job_id="294fc6d2-0f3c-4877-b849-54184724b6b2",
+    )
+    with pytest.raises(StopRequested):
+        with finalize_result(job):
+            raise StopRequested()
+
+    job.refresh_from_db()
+    assert job.status == job.Status.started
+    assert job.resume_count == 1
+    # Back with the scheduler:
+    assert job.enqueued_at is None
+    assert job.job_id is None
+    assert any("will resume" in r.message for r in caplog.records)
+
+
 @pytest.mark.django_db
 def test_finalize_result_canceled_job(job_factory, caplog):
     # User-requested job cancellation.
@@ -657,3 +959,54 @@ class TestCalculateAveragePlanRuntime:
         calculate_average_plan_runtime()
         plan.refresh_from_db()
         assert plan.calculated_average_duration is None
+
+    def test_calculate_average_plan_runtime__window(
+        self, settings, plan_factory, job_factory
+    ):
+        settings.AVERAGE_JOB_WINDOW = 2
+        settings.MINIMUM_JOBS_FOR_AVERAGE = 2
+        plan = plan_factory()
+        enqueued_at = make_aware(datetime(2020, 1, 1, 0, 0, 0))
+        # Only the two most recent jobs count:
+        for minutes in (600, 10, 20):
+            job_factory(
+                plan=plan,
+                status="complete",
+                enqueued_at=enqueued_at,
+                success_at=enqueued_at + timedelta(minutes=minutes),
+            )
+
+        calculate_average_plan_runtime()
+
+        plan.refresh_from_db()
+        assert plan.calculated_average_duration == 15 * 60
+
+    def test_calculate_average_plan_runtime__one_plan(
+        self, settings, plan_factory, job_factory
+    ):
+        settings.MINIMUM_JOBS_FOR_AVERAGE = 1
+        plan, other_plan = plan_factory(), plan_factory()
+        enqueued_at = make_aware(datetime(2020, 1, 1, 0, 0, 0))
+        for p in (plan, other_plan):
+            job_factory(
+                plan=p,
+                status="complete",
+                enqueued_at=enqueued_at,
+                success_at=enqueued_at + timedelta(hours=1),
+            )
+
+        calculate_average_plan_runtime(plan.id)
+
+        plan.refresh_from_db()
+        other_plan.refresh_from_db()
+        assert plan.calculated_average_duration == 3600
+        assert other_plan.calculated_average_duration is None
+
+    def test_finalize_result__updates_average(self, mocker, job_factory):
+        calculate = mocker.patch("metadeploy.api.jobs.calculate_average_plan_runtime")
+        job = job_factory(org_id="00Dxxxxxxxxxxxxxxx")
+
+        with finalize_result(job):
+            pass
+
+        calculate.assert_called_once_with(job.plan_id)
@@ -0,0 +1,42 @@
+import pytest
+from django.core.cache import cache
+
+from .. import maintenance
+from ..constants import REDIS_MAINTENANCE_LOCK_KEY
+from ..maintenance import get_last_tick, maintenance_tick
+
+
+@pytest.fixture
+def tasks(mocker, settings):
+    settings.MAINTENANCE_TASKS = ["first", "second"]
+    first = mocker.Mock(return_value=3)
+    second = mocker.Mock(side_effect=ValueError)
+    mocker.patch.dict(maintenance.TASKS, {"first": first, "second": second})
+    cache.delete(REDIS_MAINTENANCE_LOCK_KEY)
+    return first, second
+
+
+def test_maintenance_tick(tasks):
+    first, second = tasks
+
+    results = maintenance_tick()
+
+    assert first.called
+    assert second.called
+    assert results["first"]["rows"] == 3
+    assert results["first"]["ok"]
+    assert not results["second"]["ok"]
+    assert "duration" in results["second"]
+    assert get_last_tick() == results
+
+
+def test_maintenance_tick__locked(tasks):
+    first, _ = tasks
+    lock = cache.lock(REDIS_MAINTENANCE_LOCK_KEY, timeout=10)
+    lock.acquire()
+    try:
+        assert maintenance_tick() is None
+    finally:
+        lock.release()
+
+    assert not first.called
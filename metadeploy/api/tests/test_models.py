@@ -496,6 +496,41 @@ class TestPlan:
         with pytest.raises(ValidationError):
             invalid_plan.clean()
 
+    def test_step_dependencies(self, plan_factory, step_factory):
+        plan = plan_factory()
+        for step_num, kind, source in (
+            ("1", Step.Kind.metadata, None),
+            ("2", Step.Kind.metadata, {"github": "other"}),
+            ("3", Step.Kind.metadata, None),
+            ("4", Step.Kind.data, None),
+            ("5", Step.Kind.managed, None),
+            ("6", Step.Kind.data, None),
+        ):
+            step_factory(plan=plan, step_num=step_num, kind=kind, source=source)
+
+        assert plan.step_dependencies() == {
+            "1": set(),
+            "2": set(),
+            "3": {"1"},
+            "4": {"1", "2", "3"},
+            "5": {"1", "2", "3", "4"},
+            "6": {"5"},
+        }
+
+    def test_step_dependencies__declared(self, plan_factory, step_factory):
+        plan = plan_factory()
+        step_factory(plan=plan, step_num="1", kind=Step.Kind.managed)
+        step_factory(plan=plan, step_num="2", kind=Step.Kind.data)
+        step_factory(plan=plan, step_num="3", depends_on=["2", "4"])
+        step_factory(plan=plan, step_num="4", kind=Step.Kind.data)
+
+        assert plan.step_dependencies() == {
+            "1": set(),
+            "2": {"1"},
+            "3": {"2"},
+            "4": {"1"},
+        }
+
 
 @pytest.mark.django_db
 class TestStep:
@@ -619,6 +654,25 @@ class TestJob:
         preflight.refresh_from_db()
         assert not preflight.is_valid
 
+    def test_run__skips_installed_packages(
+        self, mocker, plan_factory, step_factory, job_factory
+    ):
+        mocker.patch("metadeploy.api.models.FlowCoordinator")
+        mocker.patch("metadeploy.api.models.CancelWatcher")
+        plan = plan_factory(skip_installed_packages=True)
+        step = step_factory(plan=plan)
+        message = "foo 1.2 or newer is already installed."
+        mocker.patch(
+            "metadeploy.api.models.skip_installed_packages",
+            return_value={str(step.id): message},
+        )
+        job = job_factory(plan=plan, org_id="00Dxxxxxxxxxxxxxxx")
+
+        job.run(mock.MagicMock(), plan, [], mock.MagicMock())
+
+        job.refresh_from_db()
+        assert job.results == {str(step.id): [{"status": "skip", "message": message}]}
+
 
 @pytest.mark.django_db
 class TestScratchOrg:
@@ -646,7 +700,7 @@ class TestScratchOrg:
         with ExitStack() as stack:
             scratch_org = scratch_org_factory(org_id="00Dxxxxxxxxxxxxxxx")
             notify_org_changed = stack.enter_context(
-                mock.patch("metadeploy.api.models.async_to_sync")
+                mock.patch("metadeploy.api.models.publish")
             )
             scratch_org.delete()
 
@@ -656,7 +710,7 @@ class TestScratchOrg:
         with ExitStack() as stack:
             scratch_org_factory(org_id="00Dxxxxxxxxxxxxxxx")
             notify_org_changed = stack.enter_context(
-                mock.patch("metadeploy.api.models.async_to_sync")
+                mock.patch("metadeploy.api.models.publish")
             )
             ScratchOrg.objects.all().delete()
 
@@ -699,3 +753,31 @@ class TestPreflightResult:
 
         preflight_result.results = {"plan": [{"status": "warn"}, {"status": "error"}]}
         assert preflight_result.has_any_errors()
+
+    def test_expired_before_sweep(
+        self, settings, plan_factory, preflight_result_factory
+    ):
+        plan = plan_factory()
+        preflight = preflight_result_factory(
+            plan=plan,
+            org_id="00Dxxxxxxxxxxxxxxx",
+            status=PreflightResult.Status.complete,
+        )
+        assert not preflight.is_expired
+        assert (
+            PreflightResult.objects.most_recent(org_id=preflight.org_id, plan=plan)
+            == preflight
+        )
+
+        PreflightResult.objects.filter(pk=preflight.pk).update(
+            created_at=timezone.now()
+            - timedelta(minutes=settings.PREFLIGHT_LIFETIME_MINUTES + 1)
+        )
+        preflight.refresh_from_db()
+
+        assert preflight.is_valid
+        assert preflight.is_expired
+        assert (
+            PreflightResult.objects.most_recent(org_id=preflight.org_id, plan=plan)
+            is None
+        )
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+from django.core.cache import cache
+
+from ..constants import REDIS_ORG_FACTS_KEY
+from ..org_facts import forget_org_facts, recall_org_facts, remember_org_facts
+
+ORG_ID = "00Dxxxxxxxxxxxxxxx"
+
+
+def org_config(**facts):
+    return SimpleNamespace(
+        _installed_packages=None,
+        _is_person_accounts_enabled=None,
+        _latest_api_version=None,
+        **facts,
+    )
+
+
+def test_remember_and_recall():
+    forget_org_facts(ORG_ID)
+    packages = {"foo": ["1.0"]}
+    remember_org_facts(ORG_ID, org_config(_installed_packages=packages))
+
+    job_org_config = org_config()
+    assert recall_org_facts(ORG_ID, job_org_config) == ["_installed_packages"]
+    assert job_org_config._installed_packages == packages
+    assert job_org_config._is_person_accounts_enabled is None
+    # Only good for one Job:
+    assert cache.get(REDIS_ORG_FACTS_KEY.format(org_id=ORG_ID)) is None
+
+
+def test_remember__capped_at_preflight_lifetime(settings):
+    settings.ORG_FACTS_CACHE_TIMEOUT = 3600
+    settings.PREFLIGHT_LIFETIME_MINUTES = 1
+    remember_org_facts(ORG_ID, org_config(_is_person_accounts_enabled=False))
+
+    assert 0 < cache.ttl(REDIS_ORG_FACTS_KEY.format(org_id=ORG_ID)) <= 60
+    forget_org_facts(ORG_ID)
+
+
+def test_remember__nothing_learned():
+    forget_org_facts(ORG_ID)
+    remember_org_facts(ORG_ID, org_config())
+
+    assert recall_org_facts(ORG_ID, org_config()) == []
@@ -0,0 +1,59 @@
+import pytest
+from django.core.cache import cache
+
+from ..constants import REDIS_ORG_STATUS_KEY
+from ..models import Job
+from ..org_status import get_org_status, invalidate_org_status, refresh_org_status
+
+ORG_ID = "00Dxxxxxxxxxxxxxxx"
+
+
+@pytest.fixture
+def org_status_cache(settings, mocker):
+    settings.ORG_STATUS_CACHE_TIMEOUT = 60
+    store = {}
+    mocker.patch.object(cache, "get", side_effect=store.get)
+    mocker.patch.object(
+        cache, "set", side_effect=lambda key, value, timeout: store.update({key: value})
+    )
+    mocker.patch.object(
+        cache,
+        "delete_many",
+        side_effect=lambda keys: [store.pop(k, None) for k in keys],
+    )
+    return store
+
+
+@pytest.mark.django_db
+class TestOrgStatus:
+    def test_get_org_status__cached(self, org_status_cache, job_factory):
+        job = job_factory(org_id=ORG_ID)
+
+        data = get_org_status(ORG_ID)
+        assert data["current_job"]["id"] == str(job.id)
+        assert org_status_cache[REDIS_ORG_STATUS_KEY.format(org_id=ORG_ID)] == data
+
+        Job.objects.filter(id=job.id).update(status=Job.Status.complete)
+        # Served from the cache without hitting the database:
+        assert get_org_status(ORG_ID)["current_job"]["id"] == str(job.id)
+
+    def test_status_change_invalidates(self, org_status_cache, job_factory):
+        job = job_factory(org_id=ORG_ID)
+        assert get_org_status(ORG_ID)["current_job"] is not None
+
+        job.status = Job.Status.complete
+        job.save()
+
+        assert get_org_status(ORG_ID)["current_job"] is None
+
+    def test_refresh_org_status(
+        self, org_status_cache, django_capture_on_commit_callbacks, job_factory
+    ):
+        job = job_factory(org_id=ORG_ID)
+        invalidate_org_status(ORG_ID)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            data = refresh_org_status(ORG_ID)
+
+        assert data["current_job"]["id"] == str(job.id)
+        assert org_status_cache[REDIS_ORG_STATUS_KEY.format(org_id=ORG_ID)] == data
@@ -0,0 +1,141 @@
+from datetime import timedelta
+
+import pytest
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Job, OutboxMessage
+from ..outbox import record, relay_outbox
+from ..publisher import publish
+from ..push import notify_org_changed, notify_post_job, user_token_expired
+
+
+@pytest.mark.django_db
+class TestRecord:
+    def test_record(self, user_factory):
+        user = user_factory()
+
+        record(user_token_expired, user)
+
+        message = OutboxMessage.objects.get()
+        assert message.event == "metadeploy.api.push.user_token_expired"
+        assert message.args == [
+            {"__model__": "api.user", "pk": str(user.id), "fks": {}}
+        ]
+
+    def test_record__error(self, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+
+        record(notify_org_changed, scratch_org, error=ValueError("Oops"))
+
+        message = OutboxMessage.objects.get()
+        assert message.args[0]["fks"] == {"plan_id": str(scratch_org.plan_id)}
+        assert message.kwargs == {"error": "Oops"}
+
+    def test_publish__outbox(self, settings, mocker, job_factory):
+        settings.PUSH_OUTBOX_ENABLED = True
+        push_message = mocker.patch("metadeploy.api.push.get_channel_layer")
+        job = job_factory(org_id="00Dxxxxxxxxxxxxxxx")
+        OutboxMessage.objects.all().delete()
+
+        job.status = Job.Status.complete
+        job.save()
+
+        assert not push_message.called
+        messages = OutboxMessage.objects.all()
+        assert {message.event for message in messages} >= {
+            "metadeploy.api.push.notify_post_job"
+        }
+
+    def test_publish__rolled_back(self, settings, user_factory):
+        settings.PUSH_OUTBOX_ENABLED = True
+        user = user_factory()
+
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                publish(user_token_expired, user)
+                raise ValueError()
+
+        assert not OutboxMessage.objects.exists()
+
+
+@pytest.mark.django_db
+class TestRelayOutbox:
+    def test_empty(self):
+        assert relay_outbox() == 0
+
+    def test_relay(self, mocker, job_factory):
+        job = job_factory(status=Job.Status.complete)
+        OutboxMessage.objects.all().delete()
+        record(notify_post_job, job)
+        record(notify_post_job, job)
+        push_messages = mocker.patch(
+            "metadeploy.api.outbox.push_messages", return_value=1
+        )
+
+        assert relay_outbox() == 2
+
+        # The duplicate is only sent once:
+        assert push_messages.call_count == 1
+        [(group_name, message)] = push_messages.call_args[0][0]
+        assert group_name == f"job.{job.id}"
+        assert message["inner_type"] == "JOB_COMPLETED"
+        assert not OutboxMessage.objects.exists()
+
+    def test_relay__deleted(self, mocker, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        plan_id = str(scratch_org.plan.id)
+        OutboxMessage.objects.all().delete()
+        record(notify_org_changed, scratch_org, error="Oops", _type="DELETED")
+        scratch_org.delete(should_notify=False, should_delete_on_sf=False)
+        push_messages = mocker.patch(
+            "metadeploy.api.outbox.push_messages", return_value=1
+        )
+
+        assert relay_outbox() == 1
+
+        # It still knows its plan:
+        [(group_name, message)] = push_messages.call_args[0][0]
+        assert message["content"]["payload"]["plan"] == plan_id
+
+    def test_relay__failure(self, settings, mocker, user_factory):
+        settings.PUSH_OUTBOX_MAX_ATTEMPTS = 2
+        record(user_token_expired, user_factory())
+        mocker.patch("metadeploy.api.outbox.push_messages", return_value=0)
+
+        assert relay_outbox() == 0
+        message = OutboxMessage.objects.get()
+        assert message.attempts == 1
+        assert message.claimed_at is None
+
+        assert relay_outbox() == 1
+        assert not OutboxMessage.objects.exists()
+
+    def test_relay__failure_continues(self, mocker, user_factory):
+        failing = user_factory()
+        record(user_token_expired, failing)
+        record(user_token_expired, user_factory())
+        mocker.patch("metadeploy.api.outbox.push_messages", side_effect=[0, 1])
+
+        assert relay_outbox() == 1
+
+        # Only the failed event is left, ready to retry:
+        message = OutboxMessage.objects.get()
+        assert message.args[0]["pk"] == str(failing.id)
+        assert message.claimed_at is None
+
+    def test_relay__claimed(self, settings, mocker, user_factory):
+        settings.PUSH_OUTBOX_CLAIM_TIMEOUT = 60
+        record(user_token_expired, user_factory())
+        record(user_token_expired, user_factory())
+        claimed, expired = OutboxMessage.objects.order_by("id")
+        OutboxMessage.objects.filter(id=claimed.id).update(claimed_at=timezone.now())
+        OutboxMessage.objects.filter(id=expired.id).update(
+            claimed_at=timezone.now() - timedelta(minutes=5)
+        )
+        mocker.patch("metadeploy.api.outbox.push_messages", return_value=1)
+
+        assert relay_outbox() == 1
+
+        # Another relay is still sending the first one:
+        assert list(OutboxMessage.objects.values_list("id", flat=True)) == [claimed.id]
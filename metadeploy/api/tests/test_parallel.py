@@ -0,0 +1,162 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from cumulusci.tasks.salesforce import Deploy
+
+from ..flows import StopFlowException
+from ..parallel import ParallelFlowCoordinator, ParallelPreflightFlowCoordinator
+
+
+@pytest.fixture
+def coordinator(settings):
+    settings.PARALLEL_STEPS_MAX_WORKERS = 2
+    coordinator = ParallelFlowCoordinator.__new__(ParallelFlowCoordinator)
+    coordinator.project_config = MagicMock()
+    coordinator.callbacks = MagicMock(cancel_watcher=None)
+    coordinator.steps = [
+        MagicMock(step_num=str(i), project_config=coordinator.project_config)
+        for i in range(1, 5)
+    ]
+    coordinator.dependencies = {"1": set(), "2": set(), "3": {"1"}, "4": {"2", "3"}}
+    return coordinator
+
+
+def test_run_steps(coordinator):
+    started = []
+    running = set()
+    most_at_once = 0
+    lock = threading.Lock()
+
+    def run_step(step):
+        nonlocal most_at_once
+        with lock:
+            started.append(step.step_num)
+            running.add(step.step_num)
+            most_at_once = max(most_at_once, len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(step.step_num)
+
+    coordinator._run_step = run_step
+    coordinator._run_steps()
+
+    assert set(started[:2]) == {"1", "2"}
+    assert started[2:] == ["3", "4"]
+    assert most_at_once == 2
+
+
+def test_run_steps__failure(coordinator):
+    started = []
+
+    def run_step(step):
+        started.append(step.step_num)
+        if step.step_num == "1":
+            raise ValueError("Deploy failed")
+
+    coordinator._run_step = run_step
+    with pytest.raises(ValueError):
+        coordinator._run_steps()
+
+    # The steps waiting for the failed one never start:
+    assert "3" not in started
+    assert "4" not in started
+
+
+def test_run_steps__runs_alone(coordinator):
+    # A deploy changes the current directory while it runs:
+    coordinator.steps[1].task_class = Deploy
+    coordinator.dependencies = {}
+    running = set()
+    alongside = {}
+    lock = threading.Lock()
+
+    def run_step(step):
+        with lock:
+            running.add(step.step_num)
+            alongside[step.step_num] = set(running)
+        time.sleep(0.05)
+        with lock:
+            running.remove(step.step_num)
+            alongside[step.step_num] |= running
+
+    coordinator._run_step = run_step
+    coordinator._run_steps()
+
+    assert alongside["2"] == {"2"}
+    assert "2" not in alongside["1"] | alongside["3"] | alongside["4"]
+
+
+def test_run_steps__canceled(coordinator):
+    coordinator.cancel_poll_interval = 0.01
+    coordinator.callbacks.cancel_watcher = MagicMock()
+    coordinator.callbacks.cancel_watcher.is_canceled.return_value = False
+    started = []
+
+    def run_step(step):
+        started.append(step.step_num)
+        coordinator.callbacks.cancel_watcher.is_canceled.return_value = True
+        time.sleep(0.05)
+
+    coordinator._run_step = run_step
+    with pytest.raises(StopFlowException):
+        coordinator._run_steps()
+
+    # The running steps finish, and no more start:
+    assert set(started) == {"1", "2"}
+
+
+class TestParallelPreflightFlowCoordinator:
+    @pytest.fixture
+    def coordinator(self, settings):
+        settings.PREFLIGHT_CHECKS_MAX_WORKERS = 3
+
+        class Org:
+            # A stand-in for a Salesforce query (the sandboxed expressions
+            # won't call mocks). None of the three returns before all of
+            # them are running:
+            running = threading.Barrier(3, timeout=5)
+
+            def query(self, seconds):
+                self.running.wait()
+                time.sleep(seconds)
+                return seconds > 0.1
+
+        coordinator = ParallelPreflightFlowCoordinator.__new__(
+            ParallelPreflightFlowCoordinator
+        )
+        coordinator.logger = MagicMock()
+        coordinator.org_config = Org()
+        coordinator.project_config = MagicMock()
+        coordinator._task_caches = {}
+        coordinator.flow_config = MagicMock(
+            checks=[{"when": "org_config.query(0.2)", "action": "error"}]
+        )
+        coordinator.steps = [
+            MagicMock(
+                project_config=coordinator.project_config,
+                task_config={
+                    "checks": [
+                        {"when": "org_config.query(0.05)", "action": "skip"},
+                        {"when": "org_config.query(0.15)", "action": "hide"},
+                    ]
+                },
+            )
+        ]
+        return coordinator
+
+    def test_evaluate_check(self, coordinator):
+        context = {"project_config": coordinator.project_config}
+        checks = (
+            coordinator.flow_config.checks + coordinator.steps[0].task_config["checks"]
+        )
+
+        # One at a time, the first check would break the barrier:
+        results = [coordinator.evaluate_check(check, context) for check in checks]
+
+        assert results == [
+            {"status": "error", "message": None},
+            None,
+            {"status": "hide", "message": None},
+        ]
@@ -0,0 +1,113 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from .. import publisher as publisher_module
+from ..publisher import (
+    BackgroundPublisher,
+    drain_publisher,
+    get_publisher,
+    publish,
+    start_publisher,
+)
+
+
+@pytest.fixture
+def no_publisher(mocker):
+    mocker.patch.object(publisher_module, "_publisher", None)
+
+
+class TestBackgroundPublisher:
+    def test_submit_and_drain(self):
+        sent = []
+
+        async def push(value):
+            sent.append((value, threading.current_thread().name))
+
+        publisher = BackgroundPublisher()
+        try:
+            for i in range(3):
+                assert publisher.submit(push, i)
+            assert publisher.drain(timeout=5)
+        finally:
+            publisher.stop(timeout=5)
+
+        assert [value for value, _ in sent] == [0, 1, 2]
+        assert all(name == "metadeploy-push-publisher" for _, name in sent)
+
+    def test_error_does_not_kill_thread(self):
+        sent = []
+
+        async def broken():
+            raise ValueError("boom")
+
+        async def push():
+            sent.append(True)
+
+        publisher = BackgroundPublisher()
+        try:
+            publisher.submit(broken)
+            publisher.submit(push)
+            assert publisher.drain(timeout=5)
+        finally:
+            publisher.stop(timeout=5)
+
+        assert sent == [True]
+
+    def test_submit__full(self, settings):
+        settings.PUSH_PUBLISHER_PUT_TIMEOUT = 0
+        release = threading.Event()
+
+        async def blocked():
+            release.wait()
+
+        publisher = BackgroundPublisher(maxsize=1)
+        try:
+            publisher.submit(blocked)
+            publisher.submit(blocked)
+            assert not publisher.submit(blocked)
+        finally:
+            release.set()
+            publisher.stop(timeout=5)
+
+
+def test_publish__no_publisher(no_publisher):
+    fn = MagicMock()
+
+    async def push(*args, **kwargs):
+        fn(*args, **kwargs)
+
+    publish(push, 1, two=2)
+
+    fn.assert_called_once_with(1, two=2)
+
+
+@pytest.mark.django_db
+def test_publish__background(no_publisher, user_factory):
+    user = user_factory()
+    received = []
+
+    async def push(instance):
+        received.append(instance)
+
+    start_publisher()
+    try:
+        publish(push, user)
+        drain_publisher(timeout=5)
+    finally:
+        get_publisher().stop(timeout=5)
+
+    assert received == [user]
+    # The push gets a snapshot, not the caller's instance:
+    assert received[0] is not user
+
+
+def test_start_publisher__reuses(no_publisher):
+    publisher = start_publisher()
+    try:
+        assert start_publisher() is publisher
+        assert get_publisher() is publisher
+    finally:
+        publisher.stop(timeout=5)
+    assert get_publisher() is None
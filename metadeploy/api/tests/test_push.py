@@ -4,10 +4,13 @@ import pytest
 from asgiref.sync import sync_to_async
 from channels.layers import get_channel_layer
 
+from ..models import PreflightResult
 from ..push import (
+    collect_messages,
     job_started,
     notify_org_changed,
     notify_org_result_changed,
+    preflights_expired,
     report_error,
 )
 
@@ -130,3 +133,21 @@ async def test_job_started(mocker, scratch_org_factory, job_factory):
     gcl = mocker.patch("metadeploy.api.push.get_channel_layer", wraps=get_channel_layer)
     await job_started(soj, job)
     gcl.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_preflights_expired(mocker):
+    notify_org = mocker.patch(
+        "metadeploy.api.push.notify_org_result_changed", new=AsyncMock()
+    )
+    stalled = PreflightResult(id=1, org_id="00Dxxxxxxxxxxxxxxx", status="canceled")
+    done = PreflightResult(id=2, org_id="00Dxxxxxxxxxxxxxxx", status="complete")
+
+    messages = await collect_messages(preflights_expired, [stalled, done], [stalled])
+
+    notify_org.assert_called_once_with(stalled)
+    assert [(group, m["inner_type"]) for group, m in messages] == [
+        ("preflightresult.1", "PREFLIGHT_CANCELED"),
+        ("preflightresult.1", "PREFLIGHT_INVALIDATED"),
+        ("preflightresult.2", "PREFLIGHT_INVALIDATED"),
+    ]
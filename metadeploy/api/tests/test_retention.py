@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..constants import REDIS_RETENTION_CHECKPOINT_KEY
+from ..models import Job, User
+from ..retention import delete_old_users, run_in_batches
+
+
+@pytest.fixture(autouse=True)
+def retention_settings(settings):
+    settings.RETENTION_BATCH_SIZE = 2
+    settings.RETENTION_BATCH_PAUSE = 0
+    settings.RETENTION_TIME_BUDGET = 10
+    for name in ("old_users", "test"):
+        cache.delete(REDIS_RETENTION_CHECKPOINT_KEY.format(name=name))
+    return settings
+
+
+@pytest.mark.django_db
+def test_delete_old_users__batches(user_factory, job_factory):
+    two_months_ago = timezone.now() - timedelta(days=60)
+    old_users = [user_factory(last_login=two_months_ago) for _ in range(3)]
+    job = job_factory(user=old_users[0], org_id=old_users[0].org_id)
+
+    metrics = delete_old_users()
+
+    assert not User.objects.filter(pk__in=[user.pk for user in old_users]).exists()
+    job.refresh_from_db()
+    assert job.user is None
+    assert metrics["rows"] == 3
+    assert metrics["batches"] == 2
+    assert metrics["jobs_detached"] == 1
+    assert metrics["complete"]
+
+
+@pytest.mark.django_db
+def test_run_in_batches__time_budget(retention_settings, job_factory):
+    retention_settings.RETENTION_TIME_BUDGET = 0
+    job_factory(exception="Danger!")
+
+    metrics = run_in_batches(
+        "test",
+        Job.objects.exclude(exception=None),
+        "created_at",
+        lambda pks: {"cleared": Job.objects.filter(pk__in=pks).update(exception=None)},
+    )
+
+    assert metrics["rows"] == 0
+    assert not metrics["complete"]
+    assert Job.objects.exclude(exception=None).exists()
+
+
+@pytest.mark.django_db
+def test_run_in_batches__resumes_from_checkpoint(job_factory):
+    old_job = job_factory(exception="Danger!")
+    new_job = job_factory(exception="Danger!")
+    cache.set(
+        REDIS_RETENTION_CHECKPOINT_KEY.format(name="test"),
+        {"position": new_job.created_at},
+    )
+
+    run_in_batches(
+        "test",
+        Job.objects.exclude(exception=None),
+        "created_at",
+        lambda pks: {"cleared": Job.objects.filter(pk__in=pks).update(exception=None)},
+    )
+
+    old_job.refresh_from_db()
+    new_job.refresh_from_db()
+    assert old_job.exception == "Danger!"
+    assert new_job.exception is None
+    checkpoint = cache.get(REDIS_RETENTION_CHECKPOINT_KEY.format(name="test"))
+    assert checkpoint["position"] is None
+    assert checkpoint["cleared"] == 1
@@ -0,0 +1,141 @@
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import pytest
+
+from ..models import Job
+from ..scheduler import (
+    fair_share_order,
+    get_queue_position,
+    queue_length,
+    schedule_jobs,
+    update_queue_positions,
+)
+
+
+@pytest.fixture
+def scheduler_settings(settings):
+    settings.JOB_SCHEDULER_QUEUE_DEPTH = 5
+    settings.JOB_SCHEDULER_MAX_PER_ORG = 1
+    settings.JOB_SCHEDULER_MAX_PER_PRODUCT = 10
+    return settings
+
+
+def rq_queue(*job_ids):
+    queue = MagicMock()
+    queue.get_job_ids.return_value = list(job_ids)
+    return queue
+
+
+@pytest.mark.django_db
+class TestFairShareOrder:
+    def test_products_take_turns(self, scheduler_settings, job_factory, plan_factory):
+        busy_plan = plan_factory()
+        quiet_plan = plan_factory()
+        busy = [job_factory(plan=busy_plan) for _ in range(3)]
+        quiet = job_factory(plan=quiet_plan)
+
+        order = fair_share_order(busy + [quiet], [])
+
+        assert order[:2] == [busy[0], quiet]
+
+    def test_queue_weight(self, scheduler_settings, job_factory, plan_factory):
+        heavy_plan = plan_factory()
+        heavy_plan.version.product.queue_weight = 3
+        heavy_plan.version.product.save()
+        light_plan = plan_factory()
+        heavy = [job_factory(plan=heavy_plan) for _ in range(3)]
+        light = job_factory(plan=light_plan)
+
+        order = fair_share_order([light] + heavy, [])
+
+        assert order == [heavy[0], heavy[1], light, heavy[2]]
+
+    def test_caps(self, scheduler_settings, job_factory, plan_factory):
+        scheduler_settings.JOB_SCHEDULER_MAX_PER_PRODUCT = 2
+        plan = plan_factory()
+        product_id = plan.version.product_id
+        running = job_factory(plan=plan)
+        same_org = job_factory(plan=plan, org_id=running.org_id)
+        other_org = job_factory(plan=plan)
+        third_org = job_factory(plan=plan)
+
+        order = fair_share_order(
+            [same_org, other_org, third_org], [(product_id, running.org_id)]
+        )
+
+        assert order == [other_org]
+
+    def test_limit(self, scheduler_settings, job_factory):
+        jobs = [job_factory() for _ in range(3)]
+
+        assert fair_share_order(jobs, [], limit=2) == jobs[:2]
+
+
+@pytest.mark.django_db
+class TestScheduleJobs:
+    def test_fills_free_slots(self, scheduler_settings, job_factory):
+        scheduler_settings.JOB_SCHEDULER_QUEUE_DEPTH = 3
+        jobs = [job_factory() for _ in range(3)]
+        job_factory(enqueued_at="2020-01-01T00:00:00Z", job_id="rq-job")
+
+        # Only Jobs count, not e.g. preflights:
+        assert schedule_jobs(rq_queue("rq-job", "preflight-rq-job")) == jobs[:2]
+
+    def test_batch_goes_as_one(self, scheduler_settings, job_factory):
+        batch_id = uuid4()
+        first = job_factory(org_id="00Dbatch", batch_id=batch_id)
+        job_factory(org_id="00Dbatch", batch_id=batch_id, batch_position=1)
+        other = job_factory(org_id="00Dother")
+
+        assert schedule_jobs(rq_queue()) == [first, other]
+
+    def test_skips_canceled(self, scheduler_settings, job_factory):
+        job_factory(status=Job.Status.canceled)
+        job = job_factory()
+
+        assert schedule_jobs(rq_queue()) == [job]
+
+    def test_queue_full(self, scheduler_settings, job_factory):
+        job_ids = [f"rq-job-{i}" for i in range(5)]
+        for job_id in job_ids:
+            job_factory(enqueued_at="2020-01-01T00:00:00Z", job_id=job_id)
+        job_factory()
+
+        assert schedule_jobs(rq_queue(*job_ids)) == []
+
+    def test_queue_length(self, job_factory):
+        job_factory()
+        job_factory()
+
+        assert queue_length([None] * 3) == 5
+
+
+@pytest.mark.django_db
+class TestQueuePositions:
+    def test_update_queue_positions(self, scheduler_settings, mocker, job_factory):
+        cache = mocker.patch("metadeploy.api.scheduler.cache")
+        queued = job_factory(enqueued_at="2020-01-01T00:00:00Z", job_id="rq-job")
+        pending = job_factory()
+        held_back = job_factory(org_id=pending.org_id)
+        queue = MagicMock()
+        queue.get_job_ids.return_value = ["other-rq-job", "rq-job"]
+
+        update_queue_positions(queue)
+
+        positions = cache.set_many.call_args[0][0]
+        assert positions == {
+            f"metadeploy:queue_position:{queued.id}": 2,
+            f"metadeploy:queue_position:{pending.id}": 3,
+            f"metadeploy:queue_position:{held_back.id}": 4,
+        }
+
+    def test_get_queue_position(self, mocker, job_factory):
+        cache = mocker.patch("metadeploy.api.scheduler.cache")
+        cache.get.return_value = 3
+        job = job_factory()
+
+        assert get_queue_position(job) == 3
+
+        job.status = Job.Status.complete
+        assert get_queue_position(job) is None
@@ -0,0 +1,88 @@
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from ..sources import CachedGitHubSource, extract_archive
+
+
+@pytest.fixture
+def archive_dir(settings, tmp_path):
+    settings.SOURCE_ARCHIVE_CACHE_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def download(mocker):
+    def extract(path):
+        with open(os.path.join(path, "cumulusci.yml"), "w") as f:
+            f.write("project: {}\n")
+
+    zip_file = MagicMock()
+    zip_file.extractall.side_effect = extract
+    return mocker.patch(
+        "metadeploy.api.sources.download_extract_github", return_value=zip_file
+    )
+
+
+def source(project_config, commit="abc123"):
+    # Without looking anything up on GitHub:
+    source = CachedGitHubSource.__new__(CachedGitHubSource)
+    source.project_config = project_config
+    source.gh = MagicMock()
+    source.url = "https://github.com/test/dep"
+    source.repo_owner, source.repo_name = "test", "dep"
+    source.commit = commit
+    source.branch = None
+    return source
+
+
+def test_extract_archive(archive_dir, download):
+    path = extract_archive(MagicMock(), "test", "dep", "abc123")
+    assert extract_archive(MagicMock(), "test", "dep", "abc123") == path
+
+    assert download.call_count == 1
+    assert path == str(archive_dir / "test" / "dep" / "abc123")
+    assert os.listdir(path) == ["cumulusci.yml"]
+    # No partial extractions left behind:
+    assert os.listdir(archive_dir / "test" / "dep") == ["abc123"]
+
+
+def test_extract_archive__prune(settings, archive_dir, download):
+    settings.SOURCE_ARCHIVE_CACHE_MAX_AGE = 60
+    old = extract_archive(MagicMock(), "test", "dep", "abc123")
+    used = extract_archive(MagicMock(), "test", "dep", "def456")
+    long_ago = time.time() - 120
+    os.utime(old, (long_ago, long_ago))
+    os.utime(used, (long_ago, long_ago))
+
+    # Using an archive keeps it:
+    extract_archive(MagicMock(), "test", "dep", "def456")
+    extract_archive(MagicMock(), "test", "dep", "ghi789")
+
+    assert sorted(os.listdir(archive_dir / "test" / "dep")) == ["def456", "ghi789"]
+
+
+def project_config(cache_dir):
+    project_config = MagicMock(cache_dir=cache_dir)
+    project_config.construct_subproject_config.side_effect = (
+        lambda repo_info: SimpleNamespace(repo_root=repo_info["root"])
+    )
+    return project_config
+
+
+def test_fetch(archive_dir, download, tmp_path_factory):
+    first = source(project_config(tmp_path_factory.mktemp("first"))).fetch()
+    second = source(project_config(tmp_path_factory.mktemp("second"))).fetch()
+
+    # The same files, but a copy and a project config of each run's own:
+    assert download.call_count == 1
+    assert first.repo_root != second.repo_root
+    assert os.listdir(first.repo_root) == os.listdir(second.repo_root)
+    assert first.repo_root.endswith(os.path.join("projects", "dep", "abc123"))
+
+    # Another commit is another project:
+    source(project_config(tmp_path_factory.mktemp("third")), commit="def456").fetch()
+    assert download.call_count == 2
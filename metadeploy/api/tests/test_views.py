@@ -1,5 +1,5 @@
 from contextlib import ExitStack
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 from uuid import uuid4
@@ -7,6 +7,7 @@ from uuid import uuid4
 import django_rq
 import pytest
 from django.urls import reverse
+from django.utils import timezone
 
 from metadeploy.conftest import format_timestamp
 
@@ -48,6 +49,10 @@ class TestJobViewset:
             "created_at": format_timestamp(job.created_at),
             "enqueued_at": None,
             "job_id": None,
+            "queue_position": None,
+            "eta": None,
+            "batch_id": None,
+            "batch_position": 0,
             "status": "started",
             "org_name": "Sample Org",
             "org_type": "",
@@ -83,6 +88,10 @@ class TestJobViewset:
             "created_at": format_timestamp(job.created_at),
             "enqueued_at": None,
             "job_id": None,
+            "queue_position": None,
+            "eta": None,
+            "batch_id": None,
+            "batch_position": 0,
             "status": "started",
             "org_name": "Secret Org",
             "org_type": "",
@@ -116,6 +125,10 @@ class TestJobViewset:
             "created_at": format_timestamp(job.created_at),
             "enqueued_at": None,
             "job_id": None,
+            "queue_position": None,
+            "eta": None,
+            "batch_id": None,
+            "batch_position": 0,
             "status": "started",
             "org_name": None,
             "org_type": "",
@@ -152,6 +165,10 @@ class TestJobViewset:
             "created_at": format_timestamp(job.created_at),
             "enqueued_at": None,
             "job_id": None,
+            "queue_position": None,
+            "eta": None,
+            "batch_id": None,
+            "batch_position": 0,
             "status": "started",
             "org_name": None,
             "org_type": "",
@@ -182,6 +199,49 @@ class TestJobViewset:
         assert response.json()["org_type"] == "Developer Edition"
         assert response.json()["org_name"] == "Sample Org"
 
+    def test_create_batch(self, client, plan_factory, preflight_result_factory):
+        primary = plan_factory()
+        additional = plan_factory(version=primary.version)
+        for plan in (primary, additional):
+            preflight_result_factory(
+                plan=plan,
+                user=client.user,
+                status=PreflightResult.Status.complete,
+                org_id=client.user.org_id,
+            )
+        data = {
+            "jobs": [
+                {"plan": str(primary.id), "steps": []},
+                {"plan": str(additional.id), "steps": []},
+            ]
+        }
+        response = client.post(reverse("job-batch"), data=data, format="json")
+
+        assert response.status_code == 201
+        first, second = response.json()
+        assert first["plan"] == str(primary.id)
+        assert second["plan"] == str(additional.id)
+        assert first["batch_id"] is not None
+        assert first["batch_id"] == second["batch_id"]
+        assert [first["batch_position"], second["batch_position"]] == [0, 1]
+
+    def test_create_batch__other_version(
+        self, client, plan_factory, preflight_result_factory
+    ):
+        plans = [plan_factory(), plan_factory()]
+        for plan in plans:
+            preflight_result_factory(
+                plan=plan,
+                user=client.user,
+                status=PreflightResult.Status.complete,
+                org_id=client.user.org_id,
+            )
+        data = {"jobs": [{"plan": str(plan.id), "steps": []} for plan in plans]}
+        response = client.post(reverse("job-batch"), data=data, format="json")
+
+        assert response.status_code == 400
+        assert not Job.objects.exists()
+
     def test_destroy_job(self, client, job_factory):
         job = job_factory(user=client.user, org_id=client.user.org_id)
         response = client.delete(reverse("job-detail", kwargs={"pk": job.id}))
@@ -230,6 +290,10 @@ class TestJobViewset:
             "created_at": format_timestamp(job.created_at),
             "enqueued_at": None,
             "job_id": None,
+            "queue_position": None,
+            "eta": None,
+            "batch_id": None,
+            "batch_position": 0,
             "status": "started",
             "org_name": None,
             "org_type": "",
@@ -441,6 +505,41 @@ class TestPreflight:
 
         assert response.status_code == 201
 
+    def test_post__shares_running(self, client, plan_factory, preflight_result_factory):
+        plan = plan_factory()
+        preflight = preflight_result_factory(
+            plan=plan, user=client.user, org_id=client.user.org_id
+        )
+        response = client.post(reverse("plan-preflight", kwargs={"pk": plan.id}))
+
+        assert response.status_code == 200
+        assert response.json()["id"] == str(preflight.id)
+        assert PreflightResult.objects.count() == 1
+
+    def test_post__shares_just_completed(
+        self, client, plan_factory, preflight_result_factory, settings
+    ):
+        settings.PREFLIGHT_REUSE_SECONDS = 60
+        plan = plan_factory()
+        recent = preflight_result_factory(
+            plan=plan,
+            user=client.user,
+            org_id=client.user.org_id,
+            status=PreflightResult.Status.complete,
+            success_at=timezone.now() - timedelta(seconds=10),
+        )
+        response = client.post(reverse("plan-preflight", kwargs={"pk": plan.id}))
+
+        assert response.status_code == 200
+        assert response.json()["id"] == str(recent.id)
+
+        recent.success_at = timezone.now() - timedelta(seconds=120)
+        recent.save()
+        response = client.post(reverse("plan-preflight", kwargs={"pk": plan.id}))
+
+        assert response.status_code == 201
+        assert response.json()["id"] != str(recent.id)
+
     def test_get__good(self, client, plan_factory, preflight_result_factory):
         plan = plan_factory()
         preflight = preflight_result_factory(
@@ -527,6 +626,7 @@ class TestPreflight:
             plan=plan,
             user=client.user,
             org_id=client.user.org_id,
+            status=PreflightResult.Status.failed,
         )
 
         get_response = client.get(reverse("plan-preflight", kwargs={"pk": plan.id}))
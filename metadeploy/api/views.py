@@ -9,8 +9,7 @@ import django_rq
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import exceptions
-from django.core.cache import cache
-from django.db.models import Q
+from django.db.models import Q, prefetch_related_objects
 from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
@@ -19,7 +18,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from .constants import REDIS_JOB_CANCEL_KEY
+from .cancellation import request_cancel
 from .filters import PlanFilter, ProductFilter, VersionFilter
 from .jobs import preflight_job
 from .models import (
@@ -33,12 +32,14 @@ from .models import (
     SiteProfile,
     Version,
 )
+from .org_status import get_org_status
 from .paginators import ProductPaginator
 from .permissions import HasOrgOrReadOnly
+from .scheduler import queue_length
 from .serializers import (
     FullUserSerializer,
+    JobBatchSerializer,
     JobSerializer,
-    OrgSerializer,
     PlanSerializer,
     PreflightResultSerializer,
     ProductCategorySerializer,
@@ -137,8 +138,10 @@ class JobViewSet(
     def get_queryset(self):
         logger.info(">>> JobViewSet.get_queryset()")
         user = self.request.user
+        # Estimating how long a Job will run looks at its steps:
+        jobs = Job.objects.prefetch_related("steps")
         if user.is_staff:
-            return Job.objects.all()
+            return jobs.all()
 
         scratch_org = ScratchOrg.objects.get_from_session(self.request.session)
         filters = combine_filters(
@@ -149,10 +152,25 @@ class JobViewSet(
             ]
         )
 
-        return Job.objects.filter(filters)
+        return jobs.filter(filters)
 
     def perform_destroy(self, instance):
-        cache.set(REDIS_JOB_CANCEL_KEY.format(id=instance.id), True)
+        request_cancel(instance.id)
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Install several plans of one version on the org, one after the other.
+
+        They run in one worker, which checks out the repo and connects to the
+        org only once.
+        """
+        serializer = JobBatchSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        jobs = serializer.save()
+        prefetch_related_objects(jobs, "steps")
+        return Response(
+            self.get_serializer(jobs, many=True).data, status=status.HTTP_201_CREATED
+        )
 
 
 class ProductCategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -263,6 +281,13 @@ class PlanViewSet(FilterAllowedByOrgMixin, GetOneMixin, viewsets.ReadOnlyModelVi
         if not kwargs:
             return Response("", status=status.HTTP_403_FORBIDDEN)
 
+        # Share a preflight that's running or has only just finished, rather
+        # than check the org all over again:
+        preflight_result = PreflightResult.objects.reusable(plan=plan, **kwargs)
+        if preflight_result is not None:
+            serializer = PreflightResultSerializer(instance=preflight_result)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
         preflight_result = PreflightResult.objects.create(
             plan=plan,
             **kwargs,
@@ -313,7 +338,7 @@ class PlanViewSet(FilterAllowedByOrgMixin, GetOneMixin, viewsets.ReadOnlyModelVi
         # Check queue status
         # If overfull, return 503
         queue = django_rq.get_queue("default")
-        if len(queue) > settings.MAX_QUEUE_LENGTH:
+        if queue_length(queue) > settings.MAX_QUEUE_LENGTH:
             return Response(
                 {"detail": "Queue is overfull. Try again later."},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -341,19 +366,7 @@ class OrgViewSet(viewsets.ViewSet):
 
     @staticmethod
     def _prepare_org_serialization(org_id):
-        current_job = Job.objects.filter(
-            org_id=org_id, status=Job.Status.started
-        ).first()
-        current_preflight = PreflightResult.objects.filter(
-            org_id=org_id, status=PreflightResult.Status.started
-        ).first()
-        return OrgSerializer(
-            {
-                "org_id": org_id,
-                "current_job": current_job,
-                "current_preflight": current_preflight,
-            }
-        ).data
+        return get_org_status(org_id)
 
     def list(self, request):
         """
@@ -0,0 +1,114 @@
+"""
+An in-process stand-in for the Redis channel layer.
+
+``consumer_utils`` talks to Redis directly through ``channel_layer.connection()``
+for message semaphores and replay logs. ``LocalRedisChannelLayer`` is the
+in-memory channel layer plus just enough of that connection API to run the push
+pipeline end to end without a Redis server, e.g. in the
+``benchmark_websockets`` command.
+"""
+
+import time
+from collections import defaultdict
+
+from channels.layers import InMemoryChannelLayer
+
+
+class LocalRedisConnection:
+    """The subset of the aioredis connection API that consumer_utils uses."""
+
+    def __init__(self, layer):
+        self.values = layer.values
+        self.streams = layer.streams
+        self.expiry = layer.expiry
+
+    def _expire_keys(self):
+        now = time.monotonic()
+        for key, expires_at in list(self.expiry.items()):
+            if expires_at <= now:
+                self.values.pop(key, None)
+                self.streams.pop(key, None)
+                del self.expiry[key]
+
+    async def set(self, key, value, expire=0, exist=None):
+        self._expire_keys()
+        if exist == "SET_IF_NOT_EXIST" and key in self.values:
+            return False
+        self.values[key] = value
+        if expire:
+            self.expiry[key] = time.monotonic() + expire
+        return True
+
+    async def delete(self, key, *keys):
+        deleted = 0
+        for key in (key, *keys):
+            deleted += (self.values.pop(key, None) is not None) + (
+                self.streams.pop(key, None) is not None
+            )
+            self.expiry.pop(key, None)
+        return deleted
+
+    async def expire(self, key, timeout):
+        if key not in self.values and key not in self.streams:
+            return False
+        self.expiry[key] = time.monotonic() + timeout
+        return True
+
+    async def xadd(self, key, fields, message_id=b"*", max_len=None, exact_len=False):
+        self._expire_keys()
+        stream = self.streams[key]
+        ms = int(time.time() * 1000)
+        if stream and stream[-1][0][0] >= ms:
+            seq = (stream[-1][0][0], stream[-1][0][1] + 1)
+        else:
+            seq = (ms, 0)
+        stream.append((seq, {k.encode(): str(v).encode() for k, v in fields.items()}))
+        if max_len is not None:
+            del stream[:-max_len]
+        return f"{seq[0]}-{seq[1]}".encode()
+
+    async def xrange(self, key, start="-", stop="+", count=None):
+        self._expire_keys()
+        start = (0, 0) if start == "-" else tuple(int(n) for n in start.split("-"))
+        entries = [
+            (f"{seq[0]}-{seq[1]}".encode(), fields)
+            for seq, fields in self.streams.get(key, [])
+            if seq >= start
+        ]
+        return entries[:count] if count is not None else entries
+
+    async def xlen(self, key):
+        self._expire_keys()
+        return len(self.streams.get(key, []))
+
+
+class LocalConnectionContextManager:
+    connection_class = LocalRedisConnection
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    async def __aenter__(self):
+        return self.connection_class(self.layer)
+
+    async def __aexit__(self, *args, **kwargs):
+        pass
+
+
+class LocalRedisChannelLayer(InMemoryChannelLayer):
+    connection_context_class = LocalConnectionContextManager
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+        self.streams = defaultdict(list)
+        self.expiry = {}
+
+    def connection(self, index):
+        return self.connection_context_class(self)
+
+    async def flush(self):
+        self.values.clear()
+        self.streams.clear()
+        self.expiry.clear()
+        await super().flush()
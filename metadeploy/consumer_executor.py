@@ -0,0 +1,127 @@
+"""
+Thread pool for the database work done by websocket consumers.
+
+A bare ``@sync_to_async`` is thread sensitive, which funnels every call in the
+ASGI process through one thread: a single slow serializer then stalls every
+websocket served by that process. Consumer methods decorated with
+:func:`consumer_db_task` instead run on a small dedicated pool, limited to
+WEBSOCKET_DB_MAX_PENDING calls queued or running at once, and close their
+database connections the way ``channels.db.database_sync_to_async`` does.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorStats:
+    """Counters describing how busy the consumer pool is."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.pending = 0
+            self.completed = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def submitted(self):
+        with self.lock:
+            self.pending += 1
+
+    def started(self, wait):
+        with self.lock:
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def finished(self):
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "pending": self.pending,
+                "completed": self.completed,
+                "average_wait": self.total_wait / self.completed
+                if self.completed
+                else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+
+stats = ExecutorStats()
+
+_executor = None
+_executor_lock = threading.Lock()
+# One semaphore per event loop, since asyncio primitives are bound to a loop:
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.WEBSOCKET_DB_THREADS,
+                thread_name_prefix="metadeploy-consumer-db",
+            )
+        return _executor
+
+
+def get_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(
+            settings.WEBSOCKET_DB_MAX_PENDING
+        )
+    return semaphore
+
+
+def _run_in_thread(func, submitted_at, *args, **kwargs):
+    wait = time.monotonic() - submitted_at
+    stats.started(wait)
+    if wait > settings.WEBSOCKET_DB_WAIT_WARNING:
+        logger.warning(f"{func.__qualname__} waited {wait:.2f}s for a database thread")
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def consumer_db_task(func):
+    """Run the sync function `func` on the consumer pool, as a coroutine.
+
+    The time spent waiting, both for a free slot and for a free thread, is
+    counted as queue wait in `stats`.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        submitted_at = time.monotonic()
+        stats.submitted()
+        try:
+            async with get_semaphore():
+                return await sync_to_async(
+                    _run_in_thread, thread_sensitive=False, executor=get_executor()
+                )(func, submitted_at, *args, **kwargs)
+        finally:
+            stats.finished()
+
+    return wrapper
@@ -3,11 +3,21 @@ We presume that Channels is operating over a Redis channel_layer here, and use i
 explicitly.
 """
 
+import re
+import time
 from base64 import b64encode
-from json import dumps
+from json import dumps, loads
+
+from django.conf import settings
+
+from .api.constants import REDIS_REPLAY_LOG_KEY
+
+SEQ_RE = re.compile(r"^\d+-\d+$")
 
 
 def message_to_hash(message):
+    # The sequence id is added after the semaphore is set, so leave it out:
+    message = {key: value for key, value in message.items() if key != "seq"}
     message_hash = b64encode(dumps(message).encode("utf-8"))
     return b"semaphore:" + message_hash
 
@@ -25,3 +35,62 @@ async def clear_message_semaphore(channel_layer, message):
     msg_hash = message_to_hash(message)
     async with channel_layer.connection(0) as connection:
         return await connection.delete(msg_hash)
+
+
+async def append_to_replay_log(channel_layer, group_name, message):
+    """Add a message to the group's replay log.
+
+    The log is a capped Redis stream that expires WEBSOCKET_REPLAY_TTL seconds
+    after the last message. Returns the message's sequence id, or None when
+    replay is turned off.
+    """
+    if not settings.WEBSOCKET_REPLAY_LENGTH:
+        return None
+    key = REDIS_REPLAY_LOG_KEY.format(group=group_name)
+    async with channel_layer.connection(0) as connection:
+        seq = await connection.xadd(
+            key,
+            {"message": dumps(message)},
+            max_len=settings.WEBSOCKET_REPLAY_LENGTH,
+            exact_len=True,
+        )
+        await connection.expire(key, settings.WEBSOCKET_REPLAY_TTL)
+    return seq.decode("utf-8") if isinstance(seq, bytes) else seq
+
+
+async def read_replay_log(channel_layer, group_name, since):
+    """Return the group's messages from sequence id `since` on, in order.
+
+    Also returns whether those are known to be *all* the messages since then.
+    They aren't if the log may have expired or been trimmed in the meantime, in
+    which case the client should refetch instead.
+
+    The message with id `since` itself is included: sequence ids come from one
+    clock, so a client can resume every group from the last id it saw at all,
+    at the cost of seeing that one message twice.
+    """
+    if not settings.WEBSOCKET_REPLAY_LENGTH or not SEQ_RE.match(str(since)):
+        return [], False
+    since_ms = int(since.split("-")[0])
+    complete = since_ms >= (time.time() - settings.WEBSOCKET_REPLAY_TTL) * 1000
+    key = REDIS_REPLAY_LOG_KEY.format(group=group_name)
+    async with channel_layer.connection(0) as connection:
+        first = await connection.xrange(key, count=1)
+        entries = await connection.xrange(key, start=since)
+        length = await connection.xlen(key)
+    if first and _seq_key(first[0][0]) > _seq_key(since):
+        complete = complete and length < settings.WEBSOCKET_REPLAY_LENGTH
+    messages = []
+    for seq, fields in entries:
+        seq = seq.decode("utf-8") if isinstance(seq, bytes) else seq
+        message = loads(fields[b"message"])
+        message["seq"] = seq
+        messages.append(message)
+    return messages, complete
+
+
+def _seq_key(seq):
+    if isinstance(seq, bytes):
+        seq = seq.decode("utf-8")
+    ms, n = seq.split("-")
+    return int(ms), int(n)
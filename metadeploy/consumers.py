@@ -1,10 +1,15 @@
-from collections import namedtuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict, namedtuple
 from importlib import import_module
 
-from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
 from django.utils import translation
 from django.utils.translation import get_supported_language_variant
@@ -14,15 +19,68 @@ from django.utils.translation.trans_real import (
     parse_accept_lang_header,
 )
 
-from .api.constants import CHANNELS_GROUP_NAME
+from .api.constants import CHANNELS_GROUP_NAME, REDIS_SUBSCRIPTION_AUTH_KEY
 from .api.hash_url import convert_org_id_to_key
 from .api.models import ScratchOrg
-from .consumer_utils import clear_message_semaphore
+from .consumer_executor import consumer_db_task
+from .consumer_utils import clear_message_semaphore, read_replay_log
+
+logger = logging.getLogger(__name__)
 
 Request = namedtuple("Request", ["user", "session"])
 
 
 KNOWN_MODELS = {"user", "preflightresult", "job", "org", "scratchorg"}
+POSSIBLE_EXCEPTIONS = (
+    AttributeError,
+    KeyError,
+    LookupError,
+    MultipleObjectsReturned,
+    ObjectDoesNotExist,
+    ValueError,
+    TypeError,
+)
+
+
+class ConnectionStats:
+    """Counters for the websocket connections served by this process."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.open_connections = 0
+        self.groups = 0
+        self.max_groups = 0
+        self.bytes_sent = 0
+        self.messages_sent = 0
+        self.reaped_connections = 0
+        self.discarded_groups = 0
+        self.last_logged = time.monotonic()
+
+    def as_dict(self):
+        return {
+            "open_connections": self.open_connections,
+            "groups": self.groups,
+            "groups_per_connection": self.groups / self.open_connections
+            if self.open_connections
+            else 0.0,
+            "max_groups_per_connection": self.max_groups,
+            "bytes_sent": self.bytes_sent,
+            "messages_sent": self.messages_sent,
+            "reaped_connections": self.reaped_connections,
+            "discarded_groups": self.discarded_groups,
+        }
+
+    def log_if_due(self):
+        if time.monotonic() - self.last_logged >= settings.WEBSOCKET_STATS_INTERVAL:
+            self.last_logged = time.monotonic()
+            logger.info(
+                " ".join(f"{key}={value}" for key, value in self.as_dict().items())
+            )
+
+
+stats = ConnectionStats()
 
 
 def user_context(user, session):
@@ -57,9 +115,105 @@ def get_language_from_scope(scope):
 
 
 class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Sends push notifications for the groups a client subscribes to.
+
+    Clients are expected to send something at least every
+    WEBSOCKET_IDLE_TIMEOUT seconds (the frontend sends `{"heartbeat": true}`),
+    or the connection is closed. Subscriptions that have seen neither a message
+    nor a resubscription in WEBSOCKET_SUBSCRIPTION_IDLE_TIMEOUT seconds are
+    dropped, as are the least recently active ones past WEBSOCKET_MAX_GROUPS.
+    The client is told with an `{"unsubscribed": {"model": ..., "id": ...},
+    "reason": "idle" | "limit"}` message, so it can subscribe again if it still
+    needs to (the frontend does for "idle", if a page still shows the object).
+    Clients let go of subscriptions they no longer need with
+    `{"unsubscribe": {"model": ..., "id": ...}}`.
+    """
+
     async def connect(self):
         await self.accept()
         self.lang = get_language_from_scope(self.scope)
+        self.last_seen = time.monotonic()
+        # Group name -> when it was last subscribed to or sent a message:
+        self.group_activity = OrderedDict()
+        # Group name -> the subscription that joined it, as the client sent it:
+        self.subscriptions = {}
+        stats.open_connections += 1
+        self.reaper = asyncio.ensure_future(self.reap_idle())
+
+    async def disconnect(self, code):
+        reaper = getattr(self, "reaper", None)
+        if reaper is None:
+            return
+        reaper.cancel()
+        self.reaper = None
+        stats.open_connections -= 1
+        stats.groups -= len(self.group_activity)
+        self.group_activity.clear()
+        self.subscriptions.clear()
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None:
+            stats.bytes_sent += len(text_data.encode("utf-8"))
+            stats.messages_sent += 1
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def reap_idle(self):
+        while True:
+            await asyncio.sleep(settings.WEBSOCKET_REAP_INTERVAL)
+            stats.log_if_due()
+            now = time.monotonic()
+            idle_timeout = settings.WEBSOCKET_IDLE_TIMEOUT
+            if idle_timeout and now - self.last_seen > idle_timeout:
+                stats.reaped_connections += 1
+                # Leaving groups is taken care of when the disconnect comes in:
+                await self.close(code=4000)
+                return
+            subscription_timeout = settings.WEBSOCKET_SUBSCRIPTION_IDLE_TIMEOUT
+            if subscription_timeout:
+                for group_name, last_active in list(self.group_activity.items()):
+                    if now - last_active <= subscription_timeout:
+                        # They're in order of activity, so the rest are newer:
+                        break
+                    await self.leave_group(group_name, reason="idle")
+
+    async def join_group(self, group_name, subscription):
+        if group_name in self.group_activity:
+            self.group_activity.move_to_end(group_name)
+        else:
+            self.groups.append(group_name)
+            stats.groups += 1
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        self.group_activity[group_name] = time.monotonic()
+        self.subscriptions[group_name] = {
+            "model": subscription["model"],
+            "id": subscription["id"],
+        }
+        stats.max_groups = max(stats.max_groups, len(self.group_activity))
+        while len(self.group_activity) > settings.WEBSOCKET_MAX_GROUPS:
+            await self.leave_group(next(iter(self.group_activity)), reason="limit")
+
+    async def leave_group(self, group_name, reason=None):
+        """Leave a group, and unless the client asked to, tell it why."""
+        del self.group_activity[group_name]
+        self.groups.remove(group_name)
+        stats.groups -= 1
+        await self.channel_layer.group_discard(group_name, self.channel_name)
+        subscription = self.subscriptions.pop(group_name)
+        if reason is not None:
+            stats.discarded_groups += 1
+            await self.send_json({"unsubscribed": subscription, "reason": reason})
+
+    async def unsubscribe(self, subscription):
+        if not isinstance(subscription, dict):
+            return
+        subscription = {
+            "model": subscription.get("model"),
+            "id": subscription.get("id"),
+        }
+        for group_name, joined in list(self.subscriptions.items()):
+            if joined == subscription:
+                await self.leave_group(group_name)
 
     async def notify(self, event):
         """
@@ -73,15 +227,32 @@ class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
         """
         # Take lock out of redis for this message:
         await clear_message_semaphore(self.channel_layer, event)
+        group_name = event.get("group", None)
+        if group_name in self.group_activity:
+            self.group_activity[group_name] = time.monotonic()
+            self.group_activity.move_to_end(group_name)
+        await self.send_event(event)
+
+    async def send_event(self, event):
         if "content" in event:
-            await self.send_json(event["content"])
-            return
-        if "serializer" in event and "instance" in event and "inner_type" in event:
+            message = event["content"]
+        elif "serializer" in event and "instance" in event and "inner_type" in event:
             message = await self.serialize_instance_as_message(event)
-            await self.send_json(message)
+        else:
             return
+        if "seq" in event:
+            message = {**message, "seq": event["seq"]}
+        await self.send_json(message)
+
+    async def replay(self, messages):
+        for message in messages:
+            try:
+                await self.send_event(message)
+            except POSSIBLE_EXCEPTIONS:
+                # The instance may be gone by now; newer messages will say so.
+                pass
 
-    @sync_to_async
+    @consumer_db_task
     def serialize_instance_as_message(self, event):
         instance = self.get_instance(**event["instance"])
         with translation.override(self.lang):
@@ -102,9 +273,32 @@ class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
         return getattr(import_module(mod), serializer)
 
     async def receive_json(self, content, **kwargs):
-        # Just used to subscribe to notification channels.
-        is_valid = self.is_valid(content)
-        is_known_model = self.is_known_model(content.get("model", None))
+        """
+        Subscribe to notification channels, either one at a time::
+
+            {"model": "job", "id": "..."}
+
+        or several at once::
+
+            {"subscriptions": [{"model": "job", "id": "..."}, ...]}
+
+        Either form may also carry the scratch org `uuid`. Each subscription gets
+        its own "ok" or "error" response, in order.
+
+        Every message sent carries a sequence id as "seq". A client that
+        reconnects can pass the last one it saw as "since" (per subscription, or
+        for the whole batch) to be sent what it missed instead of refetching. If
+        that can't be done reliably, the "ok" response says `"resync": true`.
+
+        `{"heartbeat": true}` only tells us the client is still there, and
+        `{"unsubscribe": {"model": ..., "id": ...}}` ends a subscription.
+        """
+        self.last_seen = time.monotonic()
+        if content.keys() == {"heartbeat"}:
+            return
+        if content.keys() == {"unsubscribe"}:
+            await self.unsubscribe(content["unsubscribe"])
+            return
 
         # It seems we don't get the correct (updated) value in the session here in the
         # websocket consumer, after it is set by the scratch_org view in PlanViewSet,
@@ -113,62 +307,177 @@ class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
         scratch_org_id = self.scope["session"].get("scratch_org_id", None)
         if uuid and uuid != scratch_org_id:
             self.scope["session"]["scratch_org_id"] = uuid
-            await sync_to_async(self.scope["session"].save)()
+            await consumer_db_task(self.scope["session"].save)()
 
-        has_good_permissions = await self.has_good_permissions(content)
-        all_good = is_valid and is_known_model and has_good_permissions
-        if not all_good:
-            await self.send_json({"error": _("Invalid subscription.")})
-            return
-        group_name = CHANNELS_GROUP_NAME.format(
-            model=content["model"], id=content["id"]
-        )
-        self.groups.append(group_name)
-        await self.channel_layer.group_add(group_name, self.channel_name)
-        await self.send_json(
-            {
+        if "subscriptions" in content:
+            subscriptions = content["subscriptions"]
+            if not self.is_valid_batch(content):
+                await self.send_json({"error": _("Invalid subscription.")})
+                return
+            since = content.get("since", None)
+        else:
+            subscriptions = [content]
+            since = None
+
+        requested = [
+            subscription
+            for subscription in subscriptions
+            if self.is_valid(subscription)
+            and self.is_known_model(subscription["model"])
+        ]
+        allowed = await self.has_good_permissions(requested)
+        for subscription in subscriptions:
+            if not allowed.get(self.get_subscription_key(subscription), False):
+                await self.send_json({"error": _("Invalid subscription.")})
+                continue
+            group_id = self.get_group_id(subscription)
+            group_name = CHANNELS_GROUP_NAME.format(
+                model=subscription["model"], id=group_id
+            )
+            await self.join_group(group_name, subscription)
+            response = {
                 "ok": _("Subscribed to {model}.id = {id_}").format(
-                    model=content["model"], id_=content["id"]
+                    model=subscription["model"], id_=group_id
                 )
             }
-        )
+            # Messages sent from here on are only delivered once we return, so
+            # the replay always comes first (possibly repeating a message or two):
+            resume_from = subscription.get("since", since)
+            if resume_from is None:
+                await self.send_json(response)
+                continue
+            messages, complete = await read_replay_log(
+                self.channel_layer, group_name, resume_from
+            )
+            if not complete:
+                response["resync"] = True
+            await self.send_json(response)
+            await self.replay(messages)
 
     def is_valid(self, content):
-        return content.keys() == {"model", "id"} or content.keys() == {
+        return isinstance(content, dict) and {"model", "id"} <= content.keys() <= {
             "model",
             "id",
             "uuid",
+            "since",
         }
 
+    def is_valid_batch(self, content):
+        return {"subscriptions"} <= content.keys() <= {
+            "subscriptions",
+            "uuid",
+            "since",
+        } and isinstance(content["subscriptions"], list)
+
     def is_known_model(self, model):
         return model in KNOWN_MODELS
 
-    @sync_to_async
-    def has_good_permissions(self, content):
+    def get_subscription_key(self, content):
+        if not self.is_valid(content):
+            return None
+        return (content["model"], str(content["id"]))
+
+    def get_group_id(self, content):
         if content["model"] == "org":
-            return self.handle_org_special_case(content)
-        possible_exceptions = (
-            AttributeError,
-            KeyError,
-            LookupError,
-            MultipleObjectsReturned,
-            ObjectDoesNotExist,
-            ValueError,
-            TypeError,
-        )
+            return convert_org_id_to_key(content["id"])
+        return content["id"]
+
+    def get_auth_cache_key(self, model, id_):
+        # Whether a subscription is allowed depends only on who the user is and
+        # which scratch org their session points at, so that's what we key on:
+        user = self.scope.get("user", None)
+        scratch_org_id = self.scope["session"].get("scratch_org_id", None)
+        user_pk = getattr(user, "pk", None)
+        digest = hashlib.sha1(
+            json.dumps([user_pk, scratch_org_id, model, id_]).encode()
+        ).hexdigest()
+        return REDIS_SUBSCRIPTION_AUTH_KEY.format(digest=digest)
+
+    @consumer_db_task
+    def has_good_permissions(self, subscriptions):
+        """
+        Return a dict of (model, id) to whether this connection may subscribe to it.
+
+        Positive answers are cached for WEBSOCKET_AUTH_CACHE_TIMEOUT seconds, so
+        clients resubscribing on every navigation or reconnect don't hit the
+        database. Whatever isn't cached costs one query per model, plus at most
+        one to look up the session's scratch org.
+        """
+        keys = {
+            self.get_subscription_key(subscription): None
+            for subscription in subscriptions
+        }
+        cache_keys = {key: self.get_auth_cache_key(*key) for key in keys}
+        cached = cache.get_many(list(cache_keys.values()))
+        allowed = {key: cache_keys[key] in cached for key in keys}
+
+        missing = defaultdict(list)
+        for model, id_ in keys:
+            if not allowed[(model, id_)]:
+                missing[model].append(id_)
+        if not missing:
+            return allowed
+
+        scratch_org = ScratchOrg.objects.get_from_session(self.scope["session"])
+        for model, ids in missing.items():
+            if model == "org":
+                for id_ in ids:
+                    allowed[(model, id_)] = self.handle_org_special_case(
+                        id_, scratch_org
+                    )
+                continue
+            instances = self.get_instances(model, ids)
+            for id_ in ids:
+                allowed[(model, id_)] = self.is_subscribable(
+                    instances.get(id_), scratch_org
+                )
+
+        timeout = settings.WEBSOCKET_AUTH_CACHE_TIMEOUT
+        if timeout:
+            cache.set_many(
+                {
+                    cache_keys[key]: True
+                    for key, is_allowed in allowed.items()
+                    if is_allowed and key[0] in missing
+                },
+                timeout=timeout,
+            )
+        return allowed
+
+    def get_instances(self, model, ids):
+        """Fetch the instances of `model` with the given ids, keyed by str(id)."""
         try:
-            obj = self.get_instance(model=content["model"], id=content["id"])
-            return obj.subscribable_by(self.scope["user"], self.scope["session"])
-        except possible_exceptions:
+            Model = apps.get_model("api", model)
+            instances = Model.objects.filter(pk__in=ids)
+            return {str(instance.pk): instance for instance in instances}
+        except POSSIBLE_EXCEPTIONS:
+            # One malformed id spoils the whole query; fall back to looking them up
+            # one at a time:
+            pass
+        instances = {}
+        for id_ in ids:
+            try:
+                instances[id_] = self.get_instance(model=model, id=id_)
+            except POSSIBLE_EXCEPTIONS:
+                pass
+        return instances
+
+    def is_subscribable(self, obj, scratch_org):
+        if obj is None:
+            return False
+        try:
+            return bool(
+                obj.subscribable_by(
+                    self.scope["user"], self.scope["session"], scratch_org=scratch_org
+                )
+            )
+        except POSSIBLE_EXCEPTIONS:
             return False
 
-    def handle_org_special_case(self, content):
+    def handle_org_special_case(self, org_id, scratch_org):
         # Restrict this to only authenticated users, or users who have a valid
         # scratch_org `uuid` in their session, matching the requested org:
-        org_id = content["id"]
-        content["id"] = convert_org_id_to_key(content["id"])
         if "user" in self.scope and self.scope["user"].is_authenticated:
             if self.scope["user"].org_id == org_id:
                 return True
-        scratch_org = ScratchOrg.objects.get_from_session(self.scope["session"])
-        return scratch_org and scratch_org.org_id == org_id
+        return bool(scratch_org and scratch_org.org_id == org_id)
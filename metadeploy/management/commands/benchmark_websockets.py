@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import resource
+import time
+from importlib import import_module
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+
+from ...api.models import Job
+from ...api.push import notify_org_result_changed, notify_post_job, notify_post_task
+from ...channel_layers import LocalRedisChannelLayer
+from ...consumers import stats
+
+
+def rss_kb():
+    """Resident memory of this process, in KB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):  # pragma: nocover
+        # Not Linux; the peak is the best we can do:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class SimulatedClient:
+    """A websocket client that records when each message reaches it."""
+
+    def __init__(self, communicator):
+        self.communicator = communicator
+        self.acks = 0
+        self.errors = 0
+        self.received = 0
+        self.latencies = []
+        self.last_received_at = None
+
+    async def listen(self):
+        while True:
+            output = await self.communicator.output_queue.get()
+            if output["type"] != "websocket.send":
+                continue
+            now = time.time()
+            data = json.loads(output["text"])
+            if "ok" in data:
+                self.acks += 1
+            elif "error" in data:
+                self.errors += 1
+            else:
+                self.received += 1
+                self.last_received_at = now
+                # The sequence id starts with the time the message was logged:
+                if "seq" in data:
+                    sent_ms = int(data["seq"].split("-")[0])
+                    self.latencies.append(now * 1000 - sent_ms)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure websocket push fan-out: connect many simulated clients to the "
+        "real ASGI application and replay a finished job's notifications to them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--job",
+            help="Job to replay (default: the most recent complete job)",
+        )
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=1000,
+            help="Number of simulated websocket clients",
+        )
+        parser.add_argument(
+            "--layer",
+            choices=("memory", "settings"),
+            default="memory",
+            help=(
+                "Use an in-process stand-in for the channel layer, or the one "
+                "configured in CHANNEL_LAYERS"
+            ),
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.05,
+            help="Seconds between replayed notifications",
+        )
+        parser.add_argument(
+            "--settle",
+            type=float,
+            default=2.0,
+            help="Seconds without any delivery after which the run is over",
+        )
+        parser.add_argument(
+            "--origin",
+            default="http://localhost",
+            help="Origin header to connect with; must be in ALLOWED_HOSTS",
+        )
+
+    def handle(self, *args, job, clients, layer, interval, settle, origin, **options):
+        job = self.get_job(job)
+        if layer == "memory":
+            channel_layers.set(
+                DEFAULT_CHANNEL_LAYER,
+                LocalRedisChannelLayer(capacity=1000, group_expiry=3600),
+            )
+        session = self.create_session(job.user)
+        headers = [
+            (b"origin", origin.encode()),
+            (
+                b"cookie",
+                f"{settings.SESSION_COOKIE_NAME}={session.session_key}".encode(),
+            ),
+        ]
+        try:
+            results = async_to_sync(self.run)(job, clients, headers, interval, settle)
+        finally:
+            session.delete()
+        self.report(results)
+
+    def get_job(self, job_id):
+        try:
+            if job_id:
+                return Job.objects.select_related("user").get(pk=job_id)
+            return (
+                Job.objects.select_related("user")
+                .filter(status=Job.Status.complete, user__isnull=False)
+                .exclude(results={})
+                .latest("enqueued_at")
+            )
+        except (Job.DoesNotExist, ValueError):
+            raise CommandError("No job to replay")
+
+    def create_session(self, user):
+        """Log every client in as the job's owner, so they can subscribe to it."""
+        if user is None:
+            raise CommandError("The job to replay has no user")
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    async def run(self, job, count, headers, interval, settle):
+        from ...routing import application
+
+        rss_before = rss_kb()
+        stats.reset()
+        subscriptions = [
+            {"model": "job", "id": str(job.id)},
+            {"model": "org", "id": job.org_id},
+        ]
+
+        clients = []
+        while len(clients) < count:
+            communicator = WebsocketCommunicator(
+                application, "/ws/notifications/", headers=headers
+            )
+            connected, _ = await communicator.connect(timeout=10)
+            if not connected:
+                raise CommandError("Connection refused; check --origin")
+            clients.append(SimulatedClient(communicator))
+        listeners = [asyncio.ensure_future(client.listen()) for client in clients]
+        for client in clients:
+            await client.communicator.send_json_to({"subscriptions": subscriptions})
+        deadline = time.time() + 60
+        expected = count * len(subscriptions)
+        while sum(client.acks + client.errors for client in clients) < expected:
+            if time.time() > deadline:
+                raise CommandError("Timed out waiting for subscriptions")
+            await asyncio.sleep(0.05)
+        rss_connected = rss_kb()
+
+        max_groups = stats.max_groups
+        bytes_before = stats.bytes_sent
+        events = await self.replay_job(job, interval)
+
+        # Wait for deliveries to dry up:
+        while True:
+            latest = max(
+                (c.last_received_at for c in clients if c.last_received_at), default=0
+            )
+            if time.time() - max(latest, events["finished_at"]) >= settle:
+                break
+            await asyncio.sleep(0.1)
+
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        await asyncio.gather(
+            *(client.communicator.disconnect(timeout=10) for client in clients),
+            return_exceptions=True,
+        )
+
+        latencies = sorted(
+            latency for client in clients for latency in client.latencies
+        )
+        received = sum(client.received for client in clients)
+        bytes_sent = stats.bytes_sent - bytes_before
+        last_delivery = max(
+            (c.last_received_at for c in clients if c.last_received_at),
+            default=events["finished_at"],
+        )
+        return {
+            "clients": count,
+            "subscription_errors": sum(client.errors for client in clients),
+            "events_sent": events["sent"],
+            "messages_received": received,
+            "bytes_sent": bytes_sent,
+            "max_groups": max_groups,
+            "duration": last_delivery - events["started_at"],
+            "latencies": latencies,
+            "rss_before": rss_before,
+            "rss_connected": rss_connected,
+            "rss_after": rss_kb(),
+            "rss_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    async def replay_job(self, job, interval):
+        """Send the notifications a run of `job` sends, in the same order."""
+        steps = list(job.results.items())
+        started_at = time.time()
+        sent = 0
+
+        job_in_progress = await sync_to_async(Job.objects.get)(pk=job.pk)
+        job_in_progress.status = Job.Status.started
+        await notify_org_result_changed(job_in_progress)
+        sent += 1
+        for i in range(len(steps)):
+            job_in_progress.results = dict(steps[: i + 1])
+            await asyncio.sleep(interval)
+            await notify_post_task(job_in_progress)
+            sent += 1
+        await asyncio.sleep(interval)
+        await notify_post_job(job)
+        await notify_org_result_changed(job)
+        sent += 2
+
+        return {"started_at": started_at, "finished_at": time.time(), "sent": sent}
+
+    def report(self, results):
+        latencies = results["latencies"]
+        duration = results["duration"]
+        lines = [
+            f"Clients:              {results['clients']}",
+            f"Subscription errors:  {results['subscription_errors']}",
+            f"Events sent:          {results['events_sent']}",
+            f"Messages received:    {results['messages_received']}",
+            f"Bytes sent:           {results['bytes_sent']}",
+            f"Groups per client:    {results['max_groups']}",
+            f"Duration:             {duration:.2f}s",
+            "Messages per second:  "
+            + (f"{results['messages_received'] / duration:.0f}" if duration else "-"),
+        ]
+        if latencies:
+            lines += [
+                f"Latency p{pct}:".ljust(22) + f"{percentile(latencies, pct):.1f}ms"
+                for pct in (50, 90, 95, 99)
+            ]
+            lines.append(f"Latency max:          {latencies[-1]:.1f}ms")
+        else:
+            lines.append("Latency:              - (WEBSOCKET_REPLAY_LENGTH is 0)")
+        connected = results["rss_connected"] - results["rss_before"]
+        lines += [
+            f"RSS before:           {results['rss_before'] // 1024}MB",
+            f"RSS connected:        {results['rss_connected'] // 1024}MB "
+            f"({connected / results['clients']:.1f}KB per client)",
+            f"RSS after:            {results['rss_after'] // 1024}MB",
+            f"RSS peak:             {results['rss_peak'] // 1024}MB",
+        ]
+        self.stdout.write("\n".join(lines))
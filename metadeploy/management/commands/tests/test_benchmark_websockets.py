@@ -0,0 +1,46 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from metadeploy.api.models import Job
+
+from ..benchmark_websockets import percentile
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_websockets(user_factory, job_factory):
+    user = user_factory()
+    job_factory(
+        user=user,
+        org_id=user.org_id,
+        status=Job.Status.complete,
+        results={"1": [{"status": "ok"}], "2": [{"status": "ok"}]},
+    )
+    out = StringIO()
+    call_command(
+        "benchmark_websockets",
+        "--clients=3",
+        "--interval=0",
+        "--settle=0.5",
+        "--layer=settings",
+        stdout=out,
+    )
+
+    output = out.getvalue()
+    assert "Clients:              3" in output
+    assert "Latency p50:" in output
+
+
+@pytest.mark.django_db
+def test_benchmark_websockets__no_job():
+    with pytest.raises(CommandError):
+        call_command("benchmark_websockets", "--clients=1")
@@ -1,9 +1,19 @@
+from django.conf import settings
 from django.db import DatabaseError, InterfaceError, connections
 from rq.worker import HerokuWorker, Worker
 
+from .api.publisher import drain_publisher, start_publisher
+
 
 class ConnectionClosingWorkerMixin:
-    """Mixin for rq workers to ensure db connections are closed."""
+    """Mixin for rq workers to ensure db connections are closed.
+
+    It also runs a background push publisher for each job. RQ performs every
+    job in a freshly forked work horse, and a thread doesn't survive a fork, so
+    the publisher is started there and lasts for that one job: every push it
+    has queued is sent before the job finishes and the work horse exits. The
+    parent worker process never has one.
+    """
 
     def close_database(self):
         for connection in connections.all():
@@ -18,9 +28,11 @@ class ConnectionClosingWorkerMixin:
 
     def perform_job(self, *args, **kwargs):
         self.close_database()
+        start_publisher()
         try:
             return super().perform_job(*args, **kwargs)
         finally:
+            drain_publisher(timeout=settings.PUSH_PUBLISHER_DRAIN_TIMEOUT)
             self.close_database()
 
     def work(self, *args, **kwargs):
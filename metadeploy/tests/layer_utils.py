@@ -1,22 +1,19 @@
-from channels.layers import InMemoryChannelLayer
+from ..channel_layers import (
+    LocalConnectionContextManager,
+    LocalRedisChannelLayer,
+    LocalRedisConnection,
+)
 
 
-class MockedConnection:
+class MockedConnection(LocalRedisConnection):
+    # Never hold back a message as a duplicate in tests:
     async def set(self, *args, **kwargs):
         return True
 
-    async def delete(self, *args, **kwargs):
-        pass
 
+class MockedConnectionContextManager(LocalConnectionContextManager):
+    connection_class = MockedConnection
 
-class MockedConnectionContextManager:
-    async def __aenter__(self):
-        return MockedConnection()
 
-    async def __aexit__(self, *args, **kwargs):
-        pass
-
-
-class MockedRedisInMemoryChannelLayer(InMemoryChannelLayer):
-    def connection(self, *args, **kwargs):
-        return MockedConnectionContextManager()
+class MockedRedisInMemoryChannelLayer(LocalRedisChannelLayer):
+    connection_context_class = MockedConnectionContextManager
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+from .. import consumer_executor
+from ..consumer_executor import consumer_db_task, stats
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    stats.reset()
+    yield
+    stats.reset()
+
+
+@pytest.mark.asyncio
+async def test_consumer_db_task__runs_on_pool():
+    @consumer_db_task
+    def current_thread():
+        return threading.current_thread().name
+
+    assert (await current_thread()).startswith("metadeploy-consumer-db")
+    assert stats.as_dict()["completed"] == 1
+    assert stats.as_dict()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_consumer_db_task__closes_connections(mocker):
+    close_old_connections = mocker.patch.object(
+        consumer_executor, "close_old_connections"
+    )
+
+    @consumer_db_task
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await fail()
+    assert close_old_connections.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_consumer_db_task__limits_pending(settings, mocker):
+    settings.WEBSOCKET_DB_MAX_PENDING = 1
+    mocker.patch.object(consumer_executor, "_semaphores", {})
+    warning = mocker.patch.object(consumer_executor.logger, "warning")
+    settings.WEBSOCKET_DB_WAIT_WARNING = 0.05
+    release = threading.Event()
+
+    @consumer_db_task
+    def blocked():
+        release.wait(5)
+
+    first = asyncio.ensure_future(blocked())
+    second = asyncio.ensure_future(blocked())
+    await asyncio.sleep(0.1)
+    assert stats.as_dict()["pending"] == 2
+    release.set()
+    await asyncio.gather(first, second)
+
+    # The second call had to wait for the first to finish:
+    assert stats.as_dict()["max_wait"] >= 0.1
+    warning.assert_called_once()
@@ -1,3 +1,4 @@
+from unittest.mock import ANY
 from uuid import uuid4
 
 import pytest
@@ -177,7 +178,7 @@ async def test_push_notification_consumer__user_token_invalid(user_factory):
 
     await user_token_expired(user)
     response = await communicator.receive_json_from()
-    assert response == {"type": "USER_TOKEN_INVALID"}
+    assert response == {"type": "USER_TOKEN_INVALID", "seq": ANY}
 
     await communicator.disconnect()
 
@@ -224,7 +225,7 @@ async def test_push_notification_consumer__subscribe_preflight(
     payload = await run_serializer(
         PreflightResultSerializer, preflight, user_context(user, session)
     )
-    assert response == {"type": "PREFLIGHT_COMPLETED", "payload": payload}
+    assert response == {"type": "PREFLIGHT_COMPLETED", "payload": payload, "seq": ANY}
 
     await communicator.disconnect()
 
@@ -298,6 +299,7 @@ async def test_push_notification_consumer__subscribe_job(user_factory, job_facto
         "payload": await run_serializer(
             JobSerializer, job, user_context(user, session)
         ),
+        "seq": ANY,
     }
 
     await communicator.disconnect()
@@ -403,7 +405,7 @@ async def test_push_notification_consumer__subscribe_org(
         }
     )
     org_data = await get_org_data_async(org)
-    assert response == {"type": "ORG_CHANGED", "payload": org_data}
+    assert response == {"type": "ORG_CHANGED", "payload": org_data, "seq": ANY}
 
     await communicator.disconnect()
 
@@ -466,6 +468,7 @@ async def test_push_notification_consumer__anon_subscribe_org(
     assert response == {
         "type": "ORG_CHANGED",
         "payload": data,
+        "seq": ANY,
     }, response
 
     await communicator.disconnect()
@@ -489,3 +492,325 @@ async def test_push_notification_consumer__subscribe_org_bad(user_factory):
     assert "error" in response
 
     await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__subscribe_batch(
+    user_factory, job_factory, preflight_result_factory
+):
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    jobs = [
+        await generate_model(job_factory, user=user, org_id=org_id) for _ in range(3)
+    ]
+    preflight = await generate_model(preflight_result_factory, user=user)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to(
+        {
+            "subscriptions": [
+                *({"model": "job", "id": str(job.id)} for job in jobs),
+                {"model": "preflightresult", "id": str(preflight.id)},
+                {"model": "job", "id": "missingjob"},
+                {"model": "unknown", "id": "1"},
+            ]
+        }
+    )
+    responses = [await communicator.receive_json_from() for _ in range(6)]
+    assert ["ok" in response for response in responses] == [
+        True,
+        True,
+        True,
+        True,
+        False,
+        False,
+    ]
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__subscribe_batch__invalid(user_factory):
+    user = await generate_model(user_factory)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"subscriptions": "job"})
+    response = await communicator.receive_json_from()
+    assert "error" in response
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__permissions_cached(
+    settings, mocker, user_factory, job_factory
+):
+    settings.WEBSOCKET_AUTH_CACHE_TIMEOUT = 60
+    store = {}
+    mocker.patch(
+        "metadeploy.consumers.cache.get_many",
+        side_effect=lambda keys: {key: store[key] for key in keys if key in store},
+    )
+    mocker.patch(
+        "metadeploy.consumers.cache.set_many",
+        side_effect=lambda values, timeout: store.update(values),
+    )
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    job = await generate_model(job_factory, user=user, org_id=org_id)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"model": "job", "id": str(job.id)})
+    assert "ok" in await communicator.receive_json_from()
+    assert len(store) == 1
+
+    get_instances = mocker.patch.object(PushNotificationConsumer, "get_instances")
+    await communicator.send_json_to({"model": "job", "id": str(job.id)})
+    assert "ok" in await communicator.receive_json_from()
+    get_instances.assert_not_called()
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__resume(user_factory, job_factory):
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    job = await generate_model(
+        job_factory, user=user, status=Job.Status.complete, org_id=org_id
+    )
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"model": "job", "id": str(job.id)})
+    assert "ok" in await communicator.receive_json_from()
+    await notify_post_job(job)
+    seq = (await communicator.receive_json_from())["seq"]
+    await communicator.disconnect()
+
+    # Events sent while the client was away:
+    await notify_post_job(job)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to(
+        {"subscriptions": [{"model": "job", "id": str(job.id)}], "since": seq}
+    )
+    response = await communicator.receive_json_from()
+    assert "ok" in response
+    assert "resync" not in response
+    # The last event seen is repeated, then the missed one:
+    first = await communicator.receive_json_from()
+    second = await communicator.receive_json_from()
+    assert first["seq"] == seq
+    assert second["type"] == "JOB_COMPLETED"
+    assert second["seq"] > seq
+    assert await communicator.receive_nothing()
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__resume__too_old(user_factory, job_factory):
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    job = await generate_model(job_factory, user=user, org_id=org_id)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to(
+        {"model": "job", "id": str(job.id), "since": "1000-0"}
+    )
+    response = await communicator.receive_json_from()
+    assert response["resync"]
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__heartbeat(user_factory):
+    user = await generate_model(user_factory)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"heartbeat": True})
+    assert await communicator.receive_nothing()
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__idle_connection_closed(
+    settings, user_factory
+):
+    settings.WEBSOCKET_IDLE_TIMEOUT = 0.1
+    settings.WEBSOCKET_REAP_INTERVAL = 0.05
+    user = await generate_model(user_factory)
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    response = await communicator.receive_output(timeout=1)
+    assert response == {"type": "websocket.close", "code": 4000}
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__max_groups(
+    settings, user_factory, job_factory
+):
+    settings.WEBSOCKET_MAX_GROUPS = 1
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    old_job = await generate_model(
+        job_factory, user=user, status=Job.Status.complete, org_id=org_id
+    )
+    new_job = await generate_model(
+        job_factory, user=user, status=Job.Status.complete, org_id=org_id
+    )
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"model": "job", "id": str(old_job.id)})
+    assert "ok" in await communicator.receive_json_from()
+    await communicator.send_json_to({"model": "job", "id": str(new_job.id)})
+
+    # Subscribing to the new job dropped the old one:
+    assert await communicator.receive_json_from() == {
+        "unsubscribed": {"model": "job", "id": str(old_job.id)},
+        "reason": "limit",
+    }
+    assert "ok" in await communicator.receive_json_from()
+    await notify_post_job(old_job)
+    assert await communicator.receive_nothing()
+    await notify_post_job(new_job)
+    assert (await communicator.receive_json_from())["type"] == "JOB_COMPLETED"
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__idle_subscription_dropped(
+    settings, user_factory, job_factory
+):
+    settings.WEBSOCKET_SUBSCRIPTION_IDLE_TIMEOUT = 0.1
+    settings.WEBSOCKET_REAP_INTERVAL = 0.05
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    job = await generate_model(
+        job_factory, user=user, status=Job.Status.complete, org_id=org_id
+    )
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"model": "job", "id": str(job.id)})
+    assert "ok" in await communicator.receive_json_from()
+
+    assert await communicator.receive_json_from(timeout=1) == {
+        "unsubscribed": {"model": "job", "id": str(job.id)},
+        "reason": "idle",
+    }
+
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_push_notification_consumer__unsubscribe(user_factory, job_factory):
+    user = await generate_model(user_factory)
+    org_id = await get_org_id_async(user)
+    job = await generate_model(
+        job_factory, user=user, status=Job.Status.complete, org_id=org_id
+    )
+
+    communicator = WebsocketCommunicator(
+        PushNotificationConsumer.as_asgi(), "/ws/notifications/"
+    )
+    communicator.scope["user"] = user
+    communicator.scope["session"] = Session()
+    connected, _ = await communicator.connect()
+    assert connected
+
+    await communicator.send_json_to({"model": "job", "id": str(job.id)})
+    assert "ok" in await communicator.receive_json_from()
+    await communicator.send_json_to(
+        {"unsubscribe": {"model": "job", "id": str(job.id)}}
+    )
+
+    # Nothing about it, not even that it's been dropped:
+    await notify_post_job(job)
+    assert await communicator.receive_nothing()
+
+    await communicator.disconnect()
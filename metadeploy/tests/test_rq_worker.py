@@ -68,3 +68,15 @@ class TestConnectionClosingWorker:
         worker.work(burst=True)
 
         assert close_database.called
+
+    def test_perform_job__drains_publisher(self, mocker):
+        mocker.patch("metadeploy.rq_worker.ConnectionClosingWorker.close_database")
+        mocker.patch("rq.worker.Worker.perform_job")
+        start_publisher = mocker.patch("metadeploy.rq_worker.start_publisher")
+        drain_publisher = mocker.patch("metadeploy.rq_worker.drain_publisher")
+
+        worker = get_worker()
+        worker.perform_job(None, None)
+
+        assert start_publisher.called
+        assert drain_publisher.called
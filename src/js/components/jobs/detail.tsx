@@ -48,6 +48,7 @@ import { selectScratchOrg } from '@/js/store/scratchOrgs/selectors';
 import { selectUserState } from '@/js/store/user/selectors';
 import { getVersionLabel } from '@/js/utils/helpers';
 import routes from '@/js/utils/routes';
+import { updateWatched } from '@/js/utils/websockets';
 
 const select = (appState: AppState, props: RouteComponentProps) => ({
   user: selectUserState(appState),
@@ -152,17 +153,26 @@ class JobDetail extends Component<Props, State> {
     }
   }
 
+  // What this page keeps up to date, see `updateWatched`:
+  watched({ job, scratchOrg }: Props = this.props) {
+    return [
+      { model: 'job', id: job?.id },
+      { model: 'scratchorg', id: scratchOrg?.id },
+    ];
+  }
+
   componentDidMount() {
     this.fetchProductIfMissing();
     this.fetchVersionIfMissing();
     this.fetchPlanIfMissing();
     this.fetchJobIfMissing();
     this.fetchScratchOrgIfMissing();
+    updateWatched(this.watched());
     this._isMounted = true;
   }
 
-  /* istanbul ignore next */
-  componentWillUnMount() {
+  componentWillUnmount() {
+    updateWatched([], this.watched());
     this._isMounted = false;
   }
 
@@ -207,6 +217,9 @@ class JobDetail extends Component<Props, State> {
     if (scratchOrgChanged) {
       this.fetchScratchOrgIfMissing();
     }
+    if (jobChanged || scratchOrgChanged) {
+      updateWatched(this.watched(), this.watched(prevProps));
+    }
     // If the job has changed status and is failed (or complete on a scratch org
     // job), automatically open modal
     if (job && !jobIdChanged) {
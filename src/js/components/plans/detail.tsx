@@ -62,6 +62,7 @@ import {
 } from '@/js/utils/constants';
 import { getVersionLabel } from '@/js/utils/helpers';
 import routes from '@/js/utils/routes';
+import { updateWatched } from '@/js/utils/websockets';
 
 const select = (appState: AppState, props: RouteComponentProps) => ({
   user: selectUserState(appState),
@@ -162,12 +163,25 @@ class PlanDetail extends Component<Props, State> {
     }
   }
 
+  // What this page keeps up to date, see `updateWatched`:
+  watched({ preflight, scratchOrg }: Props = this.props) {
+    return [
+      { model: 'preflightresult', id: preflight?.id },
+      { model: 'scratchorg', id: scratchOrg?.id },
+    ];
+  }
+
   componentDidMount() {
     this.fetchProductIfMissing();
     this.fetchVersionIfMissing();
     this.fetchPlanIfMissing();
     this.fetchPreflightIfMissing();
     this.fetchScratchOrgIfMissing();
+    updateWatched(this.watched());
+  }
+
+  componentWillUnmount() {
+    updateWatched([], this.watched());
   }
 
   componentDidUpdate(prevProps: Props) {
@@ -208,6 +222,9 @@ class PlanDetail extends Component<Props, State> {
     if (planChanged) {
       this.fetchPlanIfMissing();
     }
+    if (preflightChanged || scratchOrgChanged) {
+      updateWatched(this.watched(), this.watched(prevProps));
+    }
   }
 
   handleStepsChange = (stepId: string, checked: boolean) => {
@@ -13,6 +13,8 @@ export type Job = {
   } | null;
   plan: string;
   status: 'started' | 'complete' | 'failed' | 'canceled';
+  queue_position: number | null;
+  eta: number | null;
   steps: string[];
   results: PlanResults;
   org_name: string | null;
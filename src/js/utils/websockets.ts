@@ -46,16 +46,29 @@ interface Subscription {
   model: string;
   id: string;
   uuid?: string;
+  since?: string;
+}
+
+interface Watched {
+  model: string;
+  id?: string | null;
 }
 
 export interface Socket {
   subscribe: (payload: Subscription) => void;
+  unsubscribe: (payload: { model: string; id: string }) => void;
+  watch: (payload: { model: string; id: string }) => void;
   reconnect: () => void;
 }
 
 interface SubscriptionEvent {
   ok?: string;
   error?: string;
+  resync?: boolean;
+}
+interface UnsubscribedEvent {
+  unsubscribed: { model: string; id: string };
+  reason: 'idle' | 'limit';
 }
 interface ErrorEvent {
   type: 'BACKEND_ERROR';
@@ -108,7 +121,11 @@ type ModelEvent =
   | OrgEvent
   | ScratchOrgEvent
   | ScratchOrgErrorEvent;
-type EventType = SubscriptionEvent | ErrorEvent | ModelEvent;
+type EventType =
+  | SubscriptionEvent
+  | UnsubscribedEvent
+  | ErrorEvent
+  | ModelEvent;
 
 type Action =
   | TokenInvalidAction
@@ -126,9 +143,54 @@ type Action =
   | ThunkResult<JobStarted>
   | ThunkResult<ScratchOrgFailed>;
 
+// The server closes connections that stay silent for longer than
+// WEBSOCKET_IDLE_TIMEOUT (two minutes by default):
+export const HEARTBEAT_INTERVAL = 30 * 1000;
+// ...with this code:
+const IDLE_CLOSE_CODE = 4000;
+
+const watchedKey = ({ model, id }: Watched) => `${model}.${id}`;
+
+// Keep a component subscribed to the objects it shows for as long as it's
+// mounted: call with what it shows now, and what it showed before (on update),
+// or with nothing (on unmount).
+export const updateWatched = (current: Watched[], previous: Watched[] = []) => {
+  const { socket } = window;
+  if (!socket) {
+    return;
+  }
+  const currentKeys = new Set(current.filter(({ id }) => id).map(watchedKey));
+  const previousKeys = new Set(
+    previous.filter(({ id }) => id).map(watchedKey),
+  );
+  for (const { model, id } of previous) {
+    if (id && !currentKeys.has(watchedKey({ model, id }))) {
+      socket.unsubscribe({ model, id });
+    }
+  }
+  for (const { model, id } of current) {
+    if (id && !previousKeys.has(watchedKey({ model, id }))) {
+      socket.watch({ model, id });
+    }
+  }
+};
+
 const isSubscriptionEvent = (event: EventType): event is SubscriptionEvent =>
   (event as ModelEvent).type === undefined;
 
+const isUnsubscribedEvent = (event: EventType): event is UnsubscribedEvent =>
+  (event as UnsubscribedEvent).unsubscribed !== undefined;
+
+// Sequence ids look like `<milliseconds>-<counter>`
+export const isLaterSeq = (seq: string, than: string | null) => {
+  if (!than) {
+    return true;
+  }
+  const [ms, count] = seq.split('-').map(Number);
+  const [thanMs, thanCount] = than.split('-').map(Number);
+  return ms > thanMs || (ms === thanMs && count > thanCount);
+};
+
 export const getAction = (event: EventType): Action | null => {
   if (!event || isSubscriptionEvent(event)) {
     return null;
@@ -200,14 +262,80 @@ export const createSocket = ({
 
   let open = false;
   let lostConnection = false;
-  const pending = new Set();
+  // Closed for idleness while the tab was hidden, to reconnect once it shows:
+  let asleep = false;
+  const pending = new Set<Subscription>();
+  // Everything subscribed to, and the last message seen, so that after a
+  // reconnect we can resubscribe and be sent only what we missed:
+  const subscriptions = new Map<string, Subscription>();
+  // What components let go of, and the last message seen then, so that if one
+  // shows it again it only needs what was missed since:
+  const released = new Map<string, string | null>();
+  let lastSeq: string | null = null;
+  let uuid: string | undefined;
+  let resuming = 0;
+  let needsResync = false;
+  let heartbeat: NodeJS.Timeout | undefined;
+
+  const resume = () => {
+    resuming = subscriptions.size;
+    needsResync = false;
+    const payload = {
+      subscriptions: [...subscriptions.values()],
+      since: lastSeq,
+      ...(uuid ? { uuid } : {}),
+    };
+    log('[WebSocket] resuming:', payload);
+    socket.json(payload);
+  };
+
+  // The server drops subscriptions that have been quiet for a while, and the
+  // least recently active ones past its limit. Quiet ones that a mounted
+  // component still shows (see `updateWatched`) are subscribed to again, from
+  // the last message seen; the rest are forgotten.
+  const unsubscribed = ({
+    unsubscribed: { model, id },
+    reason,
+  }: UnsubscribedEvent) => {
+    const key = `${model}.${id}`;
+    const subscription = subscriptions.get(key);
+    if (!subscription) {
+      return;
+    }
+    if (reason === 'idle') {
+      const payload = {
+        ...subscription,
+        ...(lastSeq ? { since: lastSeq } : {}),
+        ...(uuid ? { uuid } : {}),
+      };
+      log('[WebSocket] resubscribing to:', payload);
+      socket.json(payload);
+    } else {
+      subscriptions.delete(key);
+    }
+  };
+
+  // Hidden tabs stay silent, so the server lets their connection go:
+  const sendHeartbeat = () => {
+    if (open && !document.hidden) {
+      socket.json({ heartbeat: true });
+    }
+  };
 
-  const socket = new Sockette(url, {
+  const handlers = {
     timeout: opts.timeout,
     maxAttempts: opts.maxAttempts,
-    onopen: (e) => {
+    onopen: (e: Event) => {
       dispatch(connectSocket());
       open = true;
+      if (!heartbeat) {
+        heartbeat = setInterval(sendHeartbeat, HEARTBEAT_INTERVAL);
+      }
+      // Resume first, so the first responses are the ones to the resume batch:
+      const canResume = lostConnection && lastSeq && subscriptions.size;
+      if (canResume) {
+        resume();
+      }
       for (const payload of pending) {
         log('[WebSocket] subscribing to:', payload);
         socket.json(payload);
@@ -216,13 +344,15 @@ export const createSocket = ({
       if (lostConnection) {
         lostConnection = false;
         log('[WebSocket] reconnected');
-        opts.onreconnect(e);
+        if (!canResume) {
+          opts.onreconnect(e);
+        }
       } else {
         log('[WebSocket] connected');
         opts.onopen(e);
       }
     },
-    onmessage: (e) => {
+    onmessage: (e: MessageEvent) => {
       let data = e.data;
       try {
         data = JSON.parse(e.data);
@@ -230,6 +360,29 @@ export const createSocket = ({
         // swallow error
       }
       log('[WebSocket] received:', data);
+      const seq = data?.seq;
+      if (typeof seq === 'string' && isLaterSeq(seq, lastSeq)) {
+        lastSeq = seq;
+      }
+      if (data && isUnsubscribedEvent(data)) {
+        unsubscribed(data);
+        opts.onmessage(e);
+        return;
+      }
+      if (resuming && data && isSubscriptionEvent(data)) {
+        resuming = resuming - 1;
+        if (data.error || data.resync) {
+          needsResync = true;
+        }
+        if (!resuming && needsResync) {
+          log('[WebSocket] could not resume, refetching');
+          opts.onreconnect(e);
+        }
+      } else if (data && isSubscriptionEvent(data) && data.resync) {
+        // Shown again, but too much was missed meanwhile:
+        log('[WebSocket] could not catch up, refetching');
+        opts.onreconnect(e);
+      }
       const action = getAction(data);
       if (action) {
         dispatch(action);
@@ -242,12 +395,23 @@ export const createSocket = ({
         lostConnection = true;
       }
     },
-    onmaximum: (e) => {
+    onmaximum: (e: Event) => {
       log(`[WebSocket] ending reconnect after ${opts.maxAttempts} attempts`);
       opts.onmaximum(e);
     },
-    onclose: (e) => {
+    onclose: (e: CloseEvent) => {
       log('[WebSocket] closed');
+      if (heartbeat) {
+        clearInterval(heartbeat);
+        heartbeat = undefined;
+      }
+      if (e?.code === IDLE_CLOSE_CODE && document.hidden) {
+        // Don't reconnect until someone is looking:
+        log('[WebSocket] idle while hidden, reconnecting once shown');
+        socket.close();
+        asleep = true;
+        lostConnection = true;
+      }
       if (open) {
         open = false;
         setTimeout(() => {
@@ -258,18 +422,64 @@ export const createSocket = ({
       }
       opts.onclose(e);
     },
-    onerror: (e) => {
+    onerror: (e: Event) => {
       log('[WebSocket] error');
       opts.onerror(e);
     },
+  };
+  let socket = new Sockette(url, handlers);
+
+  document.addEventListener('visibilitychange', () => {
+    if (document.hidden) {
+      return;
+    }
+    if (asleep) {
+      asleep = false;
+      socket = new Sockette(url, handlers);
+    } else {
+      sendHeartbeat();
+    }
   });
 
   const subscribe = (payload: Subscription) => {
+    const { uuid: payloadUuid, ...subscription } = payload;
+    const key = `${payload.model}.${payload.id}`;
+    subscriptions.set(key, subscription);
+    const since = released.get(key);
+    released.delete(key);
+    const message = since && !payload.since ? { ...payload, since } : payload;
+    if (payloadUuid) {
+      uuid = payloadUuid;
+    }
     if (open) {
-      log('[WebSocket] subscribing to:', payload);
-      socket.json(payload);
+      log('[WebSocket] subscribing to:', message);
+      socket.json(message);
     } else {
-      pending.add(payload);
+      pending.add(message);
+    }
+  };
+
+  const unsubscribe = ({ model, id }: { model: string; id: string }) => {
+    const key = `${model}.${id}`;
+    if (!subscriptions.delete(key)) {
+      return;
+    }
+    released.set(key, lastSeq);
+    for (const payload of pending) {
+      if (payload.model === model && payload.id === id) {
+        pending.delete(payload);
+      }
+    }
+    if (open) {
+      log('[WebSocket] unsubscribing from:', { model, id });
+      socket.json({ unsubscribe: { model, id } });
+    }
+  };
+
+  // Subscribe to something already fetched, unless we are still:
+  const watch = ({ model, id }: { model: string; id: string }) => {
+    if (!subscriptions.has(`${model}.${id}`)) {
+      subscribe({ model, id });
     }
   };
 
@@ -296,6 +506,8 @@ export const createSocket = ({
 
   return {
     subscribe,
+    unsubscribe,
+    watch,
     reconnect,
   };
 };
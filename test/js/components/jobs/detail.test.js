@@ -320,6 +320,33 @@ describe('<JobDetail />', () => {
     });
   });
 
+  describe('subscriptions', () => {
+    beforeEach(() => {
+      window.socket = { watch: jest.fn(), unsubscribe: jest.fn() };
+    });
+
+    afterEach(() => {
+      window.socket = null;
+    });
+
+    test('keeps the job subscribed to while mounted', () => {
+      const { unmount } = setup();
+
+      expect(window.socket.watch).toHaveBeenCalledWith({
+        model: 'job',
+        id: 'job-1',
+      });
+      expect(window.socket.unsubscribe).not.toHaveBeenCalled();
+
+      unmount();
+
+      expect(window.socket.unsubscribe).toHaveBeenCalledWith({
+        model: 'job',
+        id: 'job-1',
+      });
+    });
+  });
+
   describe('componentDidUpdate', () => {
     describe('product is changed', () => {
       test('fetches product', () => {
@@ -170,6 +170,37 @@ describe('createSocket', () => {
         expect(mockJson).toHaveBeenCalledWith(payload);
       });
 
+      test('sends heartbeats while open', () => {
+        jest.useFakeTimers();
+        socketInstance.onopen();
+        jest.advanceTimersByTime(sockets.HEARTBEAT_INTERVAL);
+
+        expect(mockJson).toHaveBeenCalledWith({ heartbeat: true });
+
+        mockJson.mockClear();
+        socketInstance.onclose();
+        jest.advanceTimersByTime(sockets.HEARTBEAT_INTERVAL);
+
+        expect(mockJson).not.toHaveBeenCalled();
+      });
+
+      test('does not send heartbeats while hidden', () => {
+        jest.useFakeTimers();
+        const hidden = jest
+          .spyOn(document, 'hidden', 'get')
+          .mockReturnValue(true);
+        socketInstance.onopen();
+        jest.advanceTimersByTime(sockets.HEARTBEAT_INTERVAL);
+
+        expect(mockJson).not.toHaveBeenCalled();
+
+        // Once shown again, right away:
+        hidden.mockRestore();
+        document.dispatchEvent(new Event('visibilitychange'));
+
+        expect(mockJson).toHaveBeenCalledWith({ heartbeat: true });
+      });
+
       test('dispatches connectSocket action', () => {
         socketInstance.onopen();
         const expected = connectSocket();
@@ -187,6 +218,51 @@ describe('createSocket', () => {
             '[WebSocket] reconnected',
           );
         });
+
+        test('resumes subscriptions from the last message seen', () => {
+          const onreconnect = jest.fn();
+          socket = sockets.createSocket({ ...opts, options: { onreconnect } });
+          socketInstance = Sockette.mock.calls[1][1];
+          socketInstance.onopen();
+          socket.subscribe({ model: 'job', id: 'abc', uuid: 'xyz' });
+          socketInstance.onmessage({
+            data: '{"type": "TASK_COMPLETED", "seq": "5-1"}',
+          });
+          socketInstance.onmessage({
+            data: '{"type": "TASK_COMPLETED", "seq": "5-0"}',
+          });
+          mockJson.mockClear();
+          socketInstance.onreconnect();
+          socketInstance.onopen();
+
+          expect(mockJson).toHaveBeenCalledWith({
+            subscriptions: [{ model: 'job', id: 'abc' }],
+            since: '5-1',
+            uuid: 'xyz',
+          });
+
+          socketInstance.onmessage({ data: '{"ok": "Subscribed"}' });
+
+          expect(onreconnect).not.toHaveBeenCalled();
+        });
+
+        test('refetches if it cannot resume', () => {
+          const onreconnect = jest.fn();
+          socket = sockets.createSocket({ ...opts, options: { onreconnect } });
+          socketInstance = Sockette.mock.calls[1][1];
+          socketInstance.onopen();
+          socket.subscribe({ model: 'job', id: 'abc' });
+          socketInstance.onmessage({
+            data: '{"type": "TASK_COMPLETED", "seq": "5-1"}',
+          });
+          socketInstance.onreconnect();
+          socketInstance.onopen();
+          socketInstance.onmessage({
+            data: '{"ok": "Subscribed", "resync": true}',
+          });
+
+          expect(onreconnect).toHaveBeenCalledTimes(1);
+        });
       });
     });
 
@@ -208,6 +284,47 @@ describe('createSocket', () => {
 
         expect(dispatch).toHaveBeenCalledWith(expected);
       });
+
+      test('resubscribes to idle subscriptions', () => {
+        socketInstance.onopen();
+        socket.subscribe({ model: 'job', id: 'abc' });
+        socketInstance.onmessage({
+          data: '{"type": "TASK_COMPLETED", "seq": "5-1"}',
+        });
+        mockJson.mockClear();
+        socketInstance.onmessage({
+          data: '{"unsubscribed": {"model": "job", "id": "abc"}, "reason": "idle"}',
+        });
+
+        expect(mockJson).toHaveBeenCalledWith({
+          model: 'job',
+          id: 'abc',
+          since: '5-1',
+        });
+      });
+
+      test('forgets subscriptions dropped over the limit', () => {
+        socketInstance.onopen();
+        socket.subscribe({ model: 'job', id: 'abc' });
+        socket.subscribe({ model: 'job', id: 'def' });
+        socketInstance.onmessage({
+          data: '{"type": "TASK_COMPLETED", "seq": "5-1"}',
+        });
+        mockJson.mockClear();
+        socketInstance.onmessage({
+          data: '{"unsubscribed": {"model": "job", "id": "abc"}, "reason": "limit"}',
+        });
+
+        expect(mockJson).not.toHaveBeenCalled();
+
+        socketInstance.onreconnect();
+        socketInstance.onopen();
+
+        expect(mockJson).toHaveBeenCalledWith({
+          subscriptions: [{ model: 'job', id: 'def' }],
+          since: '5-1',
+        });
+      });
     });
 
     describe('onreconnect', () => {
@@ -268,6 +385,28 @@ describe('createSocket', () => {
       });
     });
 
+    describe('onclose while hidden', () => {
+      test('reconnects once shown', () => {
+        const hidden = jest
+          .spyOn(document, 'hidden', 'get')
+          .mockReturnValue(true);
+        socketInstance.onopen();
+        socketInstance.onclose({ code: 4000 });
+
+        expect(mockClose).toHaveBeenCalled();
+
+        document.dispatchEvent(new Event('visibilitychange'));
+
+        expect(Sockette).toHaveBeenCalledTimes(1);
+
+        hidden.mockReturnValue(false);
+        document.dispatchEvent(new Event('visibilitychange'));
+
+        expect(Sockette).toHaveBeenCalledTimes(2);
+        hidden.mockRestore();
+      });
+    });
+
     describe('onerror', () => {
       test('logs', () => {
         socketInstance.onerror();
@@ -295,6 +434,84 @@ describe('createSocket', () => {
     });
   });
 
+  describe('unsubscribe', () => {
+    let socket;
+
+    beforeEach(() => {
+      socket = sockets.createSocket(opts);
+      Sockette.mock.calls[0][1].onopen();
+      socket.subscribe({ model: 'job', id: 'abc' });
+      Sockette.mock.calls[0][1].onmessage({
+        data: '{"type": "TASK_COMPLETED", "seq": "5-1"}',
+      });
+      mockJson.mockClear();
+    });
+
+    test('lets go of the subscription', () => {
+      socket.unsubscribe({ model: 'job', id: 'abc' });
+
+      expect(mockJson).toHaveBeenCalledWith({
+        unsubscribe: { model: 'job', id: 'abc' },
+      });
+
+      // Not resubscribed to when the server drops it:
+      mockJson.mockClear();
+      Sockette.mock.calls[0][1].onmessage({
+        data: '{"unsubscribed": {"model": "job", "id": "abc"}, "reason": "idle"}',
+      });
+
+      expect(mockJson).not.toHaveBeenCalled();
+    });
+
+    test('catches up when watched again', () => {
+      socket.unsubscribe({ model: 'job', id: 'abc' });
+      mockJson.mockClear();
+      socket.watch({ model: 'job', id: 'abc' });
+      socket.watch({ model: 'job', id: 'abc' });
+
+      expect(mockJson).toHaveBeenCalledTimes(1);
+      expect(mockJson).toHaveBeenCalledWith({
+        model: 'job',
+        id: 'abc',
+        since: '5-1',
+      });
+    });
+  });
+
+  describe('updateWatched', () => {
+    beforeEach(() => {
+      window.socket = { watch: jest.fn(), unsubscribe: jest.fn() };
+    });
+
+    afterEach(() => {
+      window.socket = null;
+    });
+
+    test('watches what is new, and lets go of what is gone', () => {
+      sockets.updateWatched(
+        [
+          { model: 'job', id: 'def' },
+          { model: 'scratchorg', id: undefined },
+        ],
+        [
+          { model: 'job', id: 'abc' },
+          { model: 'scratchorg', id: null },
+        ],
+      );
+
+      expect(window.socket.watch).toHaveBeenCalledTimes(1);
+      expect(window.socket.watch).toHaveBeenCalledWith({
+        model: 'job',
+        id: 'def',
+      });
+      expect(window.socket.unsubscribe).toHaveBeenCalledTimes(1);
+      expect(window.socket.unsubscribe).toHaveBeenCalledWith({
+        model: 'job',
+        id: 'abc',
+      });
+    });
+  });
+
   describe('reconnect', () => {
     let socket;
 